@@ -0,0 +1,201 @@
+"""Microbenchmark for the NATS protocol parser.
+
+Feeds a mixed stream of MSG and HMSG frames to the parser in chunks of the
+client read size and reports how many messages per second are dispatched.
+The regular expression based engine which was used before is kept below as
+a baseline so that both engines can be compared on the same input.
+
+Usage:
+
+    PYTHONPATH=src python benchmarks/bench_parser.py
+"""
+import asyncio
+import inspect
+import json
+import re
+import time
+from typing import Any, Callable, List, Optional
+
+from _nats.protocol.parser import (
+    AWAITING_CONTROL_LINE,
+    AWAITING_MSG_PAYLOAD,
+    CRLF_SIZE,
+    MAX_CONTROL_LINE_SIZE,
+    ErrProtocol,
+    Parser,
+    _CRLF_,
+)
+
+DEFAULT_MESSAGES = 200_000
+DEFAULT_CHUNK_SIZE = 32768
+DEFAULT_ROUNDS = 5
+
+MSG_RE = re.compile(
+    b"\\AMSG\\s+([^\\s]+)\\s+([^\\s]+)\\s+(([^\\s]+)[^\\S\r\n]+)?(\\d+)\r\n"
+)
+HMSG_RE = re.compile(
+    b"\\AHMSG\\s+([^\\s]+)\\s+([^\\s]+)\\s+(([^\\s]+)[^\\S\r\n]+)?([\\d]+)\\s+(\\d+)\r\n"
+)
+OK_RE = re.compile(b"\\A\\+OK\\s*\r\n")
+ERR_RE = re.compile(b"\\A-ERR\\s+('.+')?\r\n")
+PING_RE = re.compile(b"\\APING\\s*\r\n")
+PONG_RE = re.compile(b"\\APONG\\s*\r\n")
+INFO_RE = re.compile(b"\\AINFO\\s+([^\r\n]+)\r\n")
+
+
+class RegexParser(Parser):
+    """Regular expression cascade used by the parser before it was rewritten."""
+
+    async def parse(self, data: bytes = b"") -> None:  # type: ignore[override]
+        self.buf.extend(data)
+        while self.buf:
+            if self.state == AWAITING_CONTROL_LINE:
+                msg = MSG_RE.match(self.buf)
+                if msg:
+                    subject, _sid, _, reply, needed_bytes = msg.groups()
+                    self.msg_arg["subject"] = subject
+                    self.msg_arg["sid"] = int(_sid)
+                    self.msg_arg["reply"] = reply or b""
+                    self.needed = int(needed_bytes)
+                    del self.buf[: msg.end()]
+                    self.state = AWAITING_MSG_PAYLOAD
+                    continue
+                msg = HMSG_RE.match(self.buf)
+                if msg:
+                    subject, _sid, _, reply, header_size, needed_bytes = msg.groups()
+                    self.msg_arg["subject"] = subject
+                    self.msg_arg["sid"] = int(_sid)
+                    self.msg_arg["reply"] = reply or b""
+                    self.needed = int(needed_bytes)
+                    self.header_needed = int(header_size)
+                    del self.buf[: msg.end()]
+                    self.state = AWAITING_MSG_PAYLOAD
+                    continue
+                ok = OK_RE.match(self.buf)
+                if ok:
+                    del self.buf[: ok.end()]
+                    continue
+                err = ERR_RE.match(self.buf)
+                if err:
+                    await self.nc._process_err(err.groups())  # type: ignore[union-attr]
+                    del self.buf[: err.end()]
+                    continue
+                ping = PING_RE.match(self.buf)
+                if ping:
+                    del self.buf[: ping.end()]
+                    await self.nc._process_ping()  # type: ignore[union-attr]
+                    continue
+                pong = PONG_RE.match(self.buf)
+                if pong:
+                    del self.buf[: pong.end()]
+                    await self.nc._process_pong()  # type: ignore[union-attr]
+                    continue
+                info = INFO_RE.match(self.buf)
+                if info:
+                    srv_info = json.loads(info.groups()[0].decode())
+                    self.nc._process_info(srv_info)  # type: ignore[union-attr]
+                    del self.buf[: info.end()]
+                    continue
+                if len(self.buf) < MAX_CONTROL_LINE_SIZE and _CRLF_ in self.buf:
+                    raise ErrProtocol("nats: unknown protocol")
+                break
+            elif self.state == AWAITING_MSG_PAYLOAD:
+                if len(self.buf) < self.needed + CRLF_SIZE:
+                    break
+                hdr = None
+                if self.header_needed > 0:
+                    hdr = bytes(self.buf[: self.header_needed])
+                    payload = bytes(self.buf[self.header_needed : self.needed])
+                    self.header_needed = 0
+                else:
+                    payload = bytes(self.buf[: self.needed])
+                del self.buf[: self.needed + CRLF_SIZE]
+                self.state = AWAITING_CONTROL_LINE
+                await self.nc._process_msg(  # type: ignore[union-attr]
+                    self.msg_arg["sid"],
+                    self.msg_arg["subject"],
+                    self.msg_arg["reply"],
+                    payload,
+                    hdr,
+                )
+
+
+class CountingClient:
+    """Stand-in for the client which only counts dispatched messages."""
+
+    def __init__(self) -> None:
+        self.received = 0
+        self.awaitable = True
+
+    def _process_msg(self, *args: Any) -> Optional[Any]:
+        self.received += 1
+        return _noop() if self.awaitable else None
+
+    def _process_ping(self) -> Optional[Any]:
+        return _noop() if self.awaitable else None
+
+    def _process_pong(self) -> Optional[Any]:
+        return _noop() if self.awaitable else None
+
+    def _process_info(self, info: Any) -> None:
+        return None
+
+
+async def _noop() -> None:
+    return None
+
+
+def build_stream(count: int) -> bytes:
+    """Build a wire stream alternating MSG and HMSG frames with small payloads."""
+    hdr = b"NATS/1.0\r\nNats-Msg-Id: 0123456789\r\n\r\n"
+    payload = b"x" * 64
+    frames: List[bytes] = []
+    for i in range(count):
+        if i % 2:
+            frames.append(
+                b"HMSG foo.bar.%d 1 _INBOX.reply %d %d\r\n"
+                % (i % 10, len(hdr), len(hdr) + len(payload))
+            )
+            frames.append(hdr + payload + _CRLF_)
+        else:
+            frames.append(b"MSG foo.bar.%d 1 %d\r\n" % (i % 10, len(payload)))
+            frames.append(payload + _CRLF_)
+        if i % 1000 == 0:
+            frames.append(b"PING\r\n")
+    return b"".join(frames)
+
+
+def chunks(stream: bytes, size: int) -> List[bytes]:
+    return [stream[i : i + size] for i in range(0, len(stream), size)]
+
+
+async def run(factory: Callable[[Any], Parser], data: List[bytes], count: int) -> float:
+    nc = CountingClient()
+    parser = factory(nc)
+    # Engines which dispatch synchronously do not need awaitables.
+    nc.awaitable = inspect.iscoroutinefunction(parser.parse)
+    start = time.perf_counter()
+    for chunk in data:
+        result = parser.parse(chunk)
+        if inspect.isawaitable(result):
+            await result
+    elapsed = time.perf_counter() - start
+    assert nc.received == count, f"expected {count} messages, got {nc.received}"
+    return count / elapsed
+
+
+async def main(
+    count: int = DEFAULT_MESSAGES,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    rounds: int = DEFAULT_ROUNDS,
+) -> None:
+    data = chunks(build_stream(count), chunk_size)
+    results = {}
+    for name, factory in (("regex", RegexParser), ("parser", Parser)):
+        results[name] = max([await run(factory, data, count) for _ in range(rounds)])
+        print(f"{name:>8}: {results[name]:>12,.0f} msgs/sec")
+    print(f"{'speedup':>8}: {results['parser'] / results['regex']:>12.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
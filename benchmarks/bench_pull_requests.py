@@ -0,0 +1,88 @@
+"""Benchmark for the pull requests sent by pull subscriptions.
+
+Sends pull requests to a consumer of an empty stream and reports how many
+requests per second are written to the connection. Requests sent by a pull
+subscription are encoded once per (batch, expires, no_wait) and reused, the
+previous implementation encoding every request is kept below as a baseline.
+
+A NATS server with JetStream enabled must be listening on the given URL.
+
+Usage:
+
+    PYTHONPATH=src python benchmarks/bench_pull_requests.py [nats://localhost:4222]
+"""
+import asyncio
+import sys
+import time
+from typing import Any, Callable, Optional
+
+from jsm.api.client import Client
+from jsm.api.subscriptions import PullSubscription
+from jsm.models.consumers import AckPolicy
+from jsm.models.streams import Storage
+
+DEFAULT_URL = "nats://localhost:4222"
+DEFAULT_REQUESTS = 100_000
+DEFAULT_ROUNDS = 5
+STREAM = "BENCH_PULL_REQUESTS"
+CONSUMER = "bench"
+
+
+class LegacyPullSubscription(PullSubscription):
+    """Pull subscription encoding every request, as done before templates were used."""
+
+    async def _request(
+        self, batch: int, expires: Optional[float], no_wait: bool
+    ) -> str:
+        self._requests += 1
+        reply = f"{self._inbox_prefix}{self._requests}"
+        await self._js.publish(
+            self._subject,
+            payload=self._pull_request(batch, expires, no_wait),
+            reply=reply,
+        )
+        return reply
+
+
+async def run(
+    js: Client, factory: Callable[..., PullSubscription], count: int
+) -> float:
+    inbox_prefix = f"_INBOX.{js._nuid.next().decode()}."
+    # Answers are not read, the subscription only keeps the server from failing requests.
+    sub = await js.subscribe(f"{inbox_prefix}*", pending_msgs_limit=-1)
+    pull_sub = factory(js, STREAM, CONSUMER, sub, inbox_prefix)
+    start = time.perf_counter()
+    for _ in range(count):
+        await pull_sub._request(1, None, True)
+    await js.flush()
+    elapsed = time.perf_counter() - start
+    await sub.unsubscribe()
+    return count / elapsed
+
+
+async def main(
+    url: str = DEFAULT_URL,
+    count: int = DEFAULT_REQUESTS,
+    rounds: int = DEFAULT_ROUNDS,
+) -> None:
+    js = Client()
+    await js.connect(url)
+    await js.stream_create(STREAM, subjects=[f"{STREAM}.>"], storage=Storage.memory)
+    await js.consumer_durable_create(STREAM, CONSUMER, ack_policy=AckPolicy.explicit)
+    results = {}
+    factories: Any = (
+        ("legacy", LegacyPullSubscription),
+        ("template", PullSubscription),
+    )
+    try:
+        for name, factory in factories:
+            results[name] = max([await run(js, factory, count) for _ in range(rounds)])
+            print(f"{name:>8}: {results[name]:>12,.0f} pulls/sec")
+        print(f"{'speedup':>8}: {results['template'] / results['legacy']:>12.2f}x")
+    finally:
+        await js.stream_delete(STREAM)
+        await js.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*sys.argv[1:2]))
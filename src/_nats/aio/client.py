@@ -13,10 +13,10 @@
 #
 
 import asyncio
+from collections import deque
 from asyncio.futures import Future
 from asyncio.streams import StreamReader, StreamWriter
 from asyncio.tasks import Task
-import json
 import time
 import ssl
 import ipaddress
@@ -31,18 +31,34 @@ from typing import (
     Awaitable,
     Callable,
     Dict,
+    Iterable,
     List,
+    Mapping,
     Optional,
     Sequence,
+    Set,
     Union,
     Tuple,
 )
-from email.parser import BytesParser
 
 from _nats.aio.errors import *
 from _nats.aio.nuid import NUID
+from _nats.aio.transport import NatsProtocol
 from _nats.aio.types import ClientStats, ServerInfos
 from _nats.protocol.parser import *
+from _nats.protocol.codec import JSONCodec, get_codec
+from _nats.protocol.headers import (
+    CTRL_LEN,
+    DESC_HDR,
+    NATS_HDR_LINE,
+    NO_RESPONDERS_STATUS,
+    STATUS_HDR,
+    STATUS_MSG_LEN,
+    FrozenHeaders,
+    Headers,
+    header_block,
+    parse_headers,
+)
 from _nats.protocol import command as prot_command
 
 __version__ = "2.0.0-dev"
@@ -82,12 +98,135 @@ MAX_CONTROL_LINE_SIZE = 1024
 DEFAULT_SUB_PENDING_MSGS_LIMIT = 65536
 DEFAULT_SUB_PENDING_BYTES_LIMIT = 65536 * 1024
 
-NATS_HDR_LINE = bytearray(b"NATS/1.0\r\n")
-NO_RESPONDERS_STATUS = "503"
-STATUS_MSG_LEN = 3  # e.g. 20x, 40x, 50x
-CTRL_LEN = len(_CRLF_)
-STATUS_HDR = "Status"
-DESC_HDR = "Description"
+# Message given to publish_many, as (subject, payload, headers[, reply]).
+PublishItem = Union[
+    Tuple[str, bytes, Optional[Mapping[str, str]]],
+    Tuple[str, bytes, Optional[Mapping[str, str]], str],
+]
+
+
+class _PendingBuffer:
+    """
+    Messages received for a subscription which were not processed yet.
+
+    Messages are kept in a deque along with the number of bytes of their
+    payloads. A single future is shared by the coroutines waiting for
+    messages, it is only created when the buffer is empty. Messages which
+    were taken but are still being processed are counted, so that draining
+    a subscription can wait for them.
+    """
+
+    __slots__ = (
+        "_msgs",
+        "_msgs_limit",
+        "_bytes_limit",
+        "_bytes",
+        "_waiter",
+        "_unfinished",
+        "_finished",
+    )
+
+    def __init__(self, msgs_limit: int = 0, bytes_limit: int = 0) -> None:
+        self._msgs: "deque[Msg]" = deque()
+        self._msgs_limit = msgs_limit
+        self._bytes_limit = bytes_limit
+        self._bytes = 0
+        self._waiter: Optional["Future[None]"] = None
+        self._unfinished = 0
+        self._finished: Optional["Future[None]"] = None
+
+    def __len__(self) -> int:
+        return len(self._msgs)
+
+    @property
+    def bytes(self) -> int:
+        """
+        Size of the payloads of the messages in the buffer.
+        """
+        return self._bytes
+
+    def put(self, msg: "Msg") -> bool:
+        """
+        Adds a message to the buffer, unless it would exceed the limits
+        of the buffer, in which case the message is dropped and False
+        is returned. Limits lower than or equal to zero are disabled.
+        """
+        if 0 < self._msgs_limit <= len(self._msgs):
+            return False
+        size = len(msg.data)
+        if 0 < self._bytes_limit <= self._bytes + size:
+            return False
+        self._msgs.append(msg)
+        self._bytes += size
+        self._unfinished += 1
+        self.wake()
+        return True
+
+    def get_nowait(self) -> "Msg":
+        """
+        Takes the oldest message of the buffer.
+        Raises IndexError when the buffer is empty.
+        """
+        msg = self._msgs.popleft()
+        self._bytes -= len(msg.data)
+        return msg
+
+    async def get(self, timeout: Optional[float] = None) -> "Msg":
+        """
+        Takes the oldest message of the buffer, waiting for one if needed.
+        Raises asyncio.TimeoutError when no message is received in time.
+        """
+        if not self._msgs:
+            loop = asyncio.get_running_loop()
+            deadline = None if timeout is None else loop.time() + timeout
+            while not self._msgs:
+                await self.wait(None if deadline is None else deadline - loop.time())
+        return self.get_nowait()
+
+    async def wait(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits until a message is added, or until waiters are woken up.
+        Raises asyncio.TimeoutError when nothing happens in time.
+        """
+        if timeout is not None and timeout <= 0:
+            raise asyncio.TimeoutError
+        waiter = self._waiter
+        if waiter is None:
+            waiter = self._waiter = asyncio.get_running_loop().create_future()
+        # The waiter is shared, a waiter giving up must not cancel it.
+        done, _ = await asyncio.wait((waiter,), timeout=timeout)
+        if not done:
+            raise asyncio.TimeoutError
+
+    def wake(self) -> None:
+        """
+        Wakes up the coroutines waiting for messages.
+        """
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def task_done(self) -> None:
+        """
+        Indicates that a message taken from the buffer was processed.
+        """
+        self._unfinished -= 1
+        if self._unfinished <= 0 and self._finished is not None:
+            if not self._finished.done():
+                self._finished.set_result(None)
+            self._finished = None
+
+    async def join(self) -> None:
+        """
+        Waits until all messages added to the buffer were processed.
+        """
+        if self._unfinished <= 0:
+            return
+        if self._finished is None:
+            self._finished = asyncio.get_running_loop().create_future()
+        await asyncio.shield(self._finished)
 
 
 class Subscription:
@@ -122,13 +261,24 @@ class Subscription:
         # Per subscription message processor.
         self._pending_msgs_limit = pending_msgs_limit
         self._pending_bytes_limit = pending_bytes_limit
-        self._pending_queue: asyncio.Queue[Msg] = asyncio.Queue(
-            maxsize=pending_msgs_limit
-        )
-        self._pending_size = 0
+        self._pending = _PendingBuffer(pending_msgs_limit, pending_bytes_limit)
         self._wait_for_msgs_task: Optional[Task[None]] = None
         self._message_iterator: Optional[_SubscriptionMessageIterator] = None
 
+    @property
+    def pending_msgs(self) -> int:
+        """
+        Number of messages received and not processed yet.
+        """
+        return len(self._pending)
+
+    @property
+    def pending_bytes(self) -> int:
+        """
+        Size of the payloads of the messages received and not processed yet.
+        """
+        return self._pending.bytes
+
     @property
     def messages(self) -> AsyncIterator["Msg"]:
         """
@@ -149,20 +299,16 @@ class Subscription:
         next_msg can be used to retrieve the next message
         from a stream of messages using await syntax.
         """
-        future: Future[Msg] = asyncio.Future()
-
-        async def _next_msg() -> None:
-            msg = await self._pending_queue.get()
-            future.set_result(msg)
-
-        task = asyncio.create_task(_next_msg())
-        try:
-            msg = await asyncio.wait_for(future, timeout)
-            return msg
-        except asyncio.TimeoutError:
-            future.cancel()
-            task.cancel()
-            raise ErrTimeout
+        pending = self._pending
+        if pending:
+            msg = pending.get_nowait()
+        else:
+            try:
+                msg = await pending.get(timeout)
+            except asyncio.TimeoutError:
+                raise ErrTimeout
+        pending.task_done()
+        return msg
 
     def _start(self, error_cb: Callable[[Exception], Awaitable[None]]) -> None:
         """
@@ -182,7 +328,7 @@ class Subscription:
             # Used to handle the single response from a request.
             pass
         else:
-            self._message_iterator = _SubscriptionMessageIterator(self._pending_queue)
+            self._message_iterator = _SubscriptionMessageIterator(self._pending)
 
     async def drain(self) -> None:
         """
@@ -196,10 +342,9 @@ class Subscription:
             # Roundtrip to ensure that the server has sent all messages.
             await self._conn.flush()
 
-            if self._pending_queue:
-                # Wait until no more messages are left,
-                # then cancel the subscription task.
-                await self._pending_queue.join()
+            # Wait until no more messages are left,
+            # then cancel the subscription task.
+            await self._pending.join()
 
             # stop waiting for messages
             self._stop_processing()
@@ -212,6 +357,29 @@ class Subscription:
             # the sub per task will be canceled as well.
             pass
 
+    async def drain_msgs(self) -> List["Msg"]:
+        """
+        Removes interest in a subject and returns the messages which
+        were received and not processed yet, including the ones sent
+        by the server before it removed the interest.
+
+        Only for subscriptions without a callback, returned messages
+        are considered processed.
+        """
+        await self._conn._send_unsubscribe(self._id)
+
+        # Roundtrip to ensure that the server has sent all messages.
+        await self._conn.flush()
+
+        self._stop_processing()
+        self._conn._remove_sub(self._id)
+        msgs = []
+        pending = self._pending
+        while pending:
+            msgs.append(pending.get_nowait())
+            pending.task_done()
+        return msgs
+
     async def unsubscribe(self, limit: int = 0) -> None:
         """
         Removes interest in a subject, remaining messages will be discarded.
@@ -250,8 +418,7 @@ class Subscription:
         """
         while True:
             try:
-                msg = await self._pending_queue.get()
-                self._pending_size -= len(msg.data)
+                msg = await self._pending.get()
 
                 try:
                     # Invoke depending of type of handler.
@@ -267,37 +434,33 @@ class Subscription:
                         await error_cb(e)
                 finally:
                     # indicate the message finished processing so drain can continue
-                    self._pending_queue.task_done()
+                    self._pending.task_done()
 
             except asyncio.CancelledError:
                 break
 
 
 class _SubscriptionMessageIterator:
-    def __init__(self, queue) -> None:
-        self._queue: asyncio.Queue["Msg"] = queue
-        self._unsubscribed_future: Future[bool] = asyncio.Future()
+    def __init__(self, pending: _PendingBuffer) -> None:
+        self._pending = pending
+        self._unsubscribed = False
 
     def _cancel(self) -> None:
-        if not self._unsubscribed_future.done():
-            self._unsubscribed_future.set_result(True)
+        self._unsubscribed = True
+        self._pending.wake()
 
     def __aiter__(self) -> "_SubscriptionMessageIterator":
         return self
 
     async def __anext__(self) -> "Msg":
-        get_task = asyncio.create_task(self._queue.get())
-        finished, _ = await asyncio.wait(
-            [get_task, self._unsubscribed_future],  # type: ignore[type-var]
-            return_when=asyncio.FIRST_COMPLETED,
-        )
-        if get_task in finished:
-            self._queue.task_done()
-            return get_task.result()
-        elif self._unsubscribed_future.done():
-            get_task.cancel()
-
-        raise StopAsyncIteration
+        # Messages received before unsubscribing are still delivered.
+        while not self._pending:
+            if self._unsubscribed:
+                raise StopAsyncIteration
+            await self._pending.wait()
+        msg = self._pending.get_nowait()
+        self._pending.task_done()
+        return msg
 
 
 class Msg:
@@ -305,7 +468,15 @@ class Msg:
     Msg represents a message delivered by NATS.
     """
 
-    __slots__ = ("subject", "reply", "data", "sid", "_client", "headers")
+    __slots__ = (
+        "subject",
+        "reply",
+        "data",
+        "sid",
+        "_client",
+        "_headers",
+        "_raw_headers",
+    )
 
     def __init__(
         self,
@@ -314,14 +485,41 @@ class Msg:
         data: bytes = b"",
         sid: int = 0,
         client: Optional["Client"] = None,
-        headers: Dict[str, str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        raw_headers: Optional[bytes] = None,
     ) -> None:
         self.subject = subject
         self.reply = reply
         self.data = data
         self.sid = sid
         self._client = client
-        self.headers = headers
+        self._headers = headers
+        self._raw_headers = raw_headers
+
+    @property
+    def headers(self) -> Optional[Dict[str, str]]:
+        """
+        Headers of the message, the raw header block received
+        from the server is only parsed on first access.
+
+        A header block which cannot be decoded is reported to the
+        error callback of the client as ErrInvalidHeaders, and the
+        message is considered to have no headers.
+        """
+        if self._headers is None and self._raw_headers is not None:
+            try:
+                self._headers = parse_headers(self._raw_headers)
+            except UnicodeDecodeError:
+                self._headers = {}
+                if self._client is not None:
+                    err = ErrInvalidHeaders(subject=self.subject, sid=self.sid)
+                    self._client._report_error(err)
+        return self._headers
+
+    @headers.setter
+    def headers(self, headers: Optional[Dict[str, str]]) -> None:
+        self._headers = headers
+        self._raw_headers = None
 
     def __repr__(self) -> str:
         return f"<{self.__class__.__name__}: subject='{self.subject}' reply='{self.reply}' data='{self.data[:10].decode()}...'>"
@@ -375,11 +573,17 @@ class Client:
     def __repr__(self) -> str:
         return f"<nats client v{__version__}>"
 
-    def __init__(self) -> None:
+    def __init__(self, json_codec: Union[str, JSONCodec, None] = None) -> None:
+        # Codec used for INFO and CONNECT, given by name or as an instance
+        self._codec = (
+            json_codec if isinstance(json_codec, JSONCodec) else get_codec(json_codec)
+        )
         self._current_server: Optional[Srv] = None
         self._server_info: ServerInfos = {}
         self._server_pool: List[Srv] = []
         self._reading_task: Optional[Task[None]] = None
+        # Reports the loss of the connection of the buffered protocol.
+        self._connection_lost_task: Optional[Task[None]] = None
         self._ping_interval_task: Optional[Task[None]] = None
         self._pings_outstanding = 0
         self._pongs_received = 0
@@ -388,6 +592,7 @@ class Client:
         self._io_reader: Optional[StreamReader] = None
         self._bare_io_writer: Optional[StreamWriter] = None
         self._io_writer: Optional[StreamWriter] = None
+        self._stream_io_writer: Optional[StreamWriter] = None
         self._err: Optional[Exception] = None
         self._error_cb: Optional[Callable[[Exception], Awaitable[None]]] = None
         self._disconnected_cb: Optional[Callable[[], Awaitable[None]]] = None
@@ -407,12 +612,16 @@ class Client:
         self._sid = 0
         self._subs: Dict[int, Subscription] = {}
         self._status = Client.DISCONNECTED
-        self._ps = Parser(self)
+        self._ps = Parser(self, self._codec)
+        # Coroutines scheduled while dispatching parsed operations,
+        # awaited by the reading loop once the parser is done.
+        self._deferred: List[Awaitable[None]] = []
+        # Error callbacks started outside of a coroutine, kept until they return.
+        self._error_tasks: Set[Task[None]] = set()
         self._pending: List[bytes] = []
         self._pending_data_size = 0
         self._flush_queue: Optional[asyncio.Queue[None]] = None
         self._flusher_task: Optional[Task[None]] = None
-        self._hdr_parser = BytesParser()
 
         # New style request/response
         self._resp_map: Dict[str, Future[Msg]] = {}
@@ -478,6 +687,7 @@ class Client:
         user_jwt_cb: Optional[Callable[[], bytes]] = None,
         user_credentials: Optional[Union[str, Tuple[str, str]]] = None,
         nkeys_seed: Optional[str] = None,
+        buffered_protocol: bool = False,
     ) -> None:
         for cb in [
             error_cb,
@@ -519,6 +729,7 @@ class Client:
         self.options["connect_timeout"] = connect_timeout
         self.options["drain_timeout"] = drain_timeout
         self.options["pending_size"] = pending_size
+        self.options["buffered_protocol"] = buffered_protocol
 
         if tls:
             self.options["tls"] = tls
@@ -602,10 +813,18 @@ class Client:
         except asyncio.CancelledError:
             pass
         finally:
+            await self._flush_buffered_publishes()
             self._status = Client.DRAINING_PUBS
             await self.flush()
             await self._close(Client.CLOSED)
 
+    async def _flush_buffered_publishes(self) -> None:
+        """
+        Called by drain once subscriptions are drained, before publishers
+        are. Subclasses buffering messages before publishing them send
+        them here.
+        """
+
     async def flush(self, timeout: float = 60) -> None:
         """
         Sends a ping to the server expecting a pong back ensuring
@@ -633,7 +852,7 @@ class Client:
         subject: str,
         payload: bytes = b"",
         reply: str = "",
-        headers: Optional[Dict[str, str]] = None,
+        headers: Optional[Mapping[str, str]] = None,
     ) -> None:
         """
         Sends a PUB command to the server on the specified subject.
@@ -654,6 +873,73 @@ class Client:
             raise ErrMaxPayload
         await self._send_publish(subject, reply, payload, payload_size, headers)
 
+    async def publish_many(
+        self,
+        messages: Iterable[PublishItem],
+    ) -> None:
+        """
+        Sends a batch of messages given as (subject, payload, headers)
+        tuples, optionally followed by a reply subject. The whole batch
+        is encoded at once, then appended to the pending buffer and
+        flushed a single time.
+
+          ->> PUB hello 5
+          ->> MSG_PAYLOAD: world
+          ->> HPUB hello 22 27
+          ->> MSG_PAYLOAD: NATS/1.0 ... world
+
+        """
+        if self.is_closed:
+            raise ErrConnectionClosed
+        if self.is_draining_pubs:
+            raise ErrConnectionDraining
+
+        max_payload = self._max_payload
+        segments: List[bytes] = []
+        count = 0
+        out_bytes = 0
+        for item in messages:
+            subject, payload, headers = item[0], item[1], item[2]
+            reply = item[3] if len(item) > 3 else ""  # type: ignore[misc]
+            payload_size = len(payload)
+            if payload_size > max_payload:
+                raise ErrMaxPayload
+            segments.extend(self._pub_command(subject, reply, payload, headers))
+            count += 1
+            out_bytes += payload_size
+
+        self.stats["out_msgs"] += count
+        self.stats["out_bytes"] += out_bytes
+        self._pending.extend(segments)
+        self._pending_data_size += sum(map(len, segments))
+        if (
+            self._pending_data_size > self.options["pending_size"]
+            or self._flush_queue.empty()  # type: ignore[union-attr]
+        ):
+            await self._flush_pending()
+
+    async def publish_command(
+        self,
+        cmd: Tuple[bytes, ...],
+        payload_size: int,
+    ) -> None:
+        """
+        Sends a PUB or HPUB command whose segments were built in
+        advance, e.g. from a template of a message sent repeatedly.
+        The payload is not checked against the maximum payload size.
+
+        """
+        if self.is_closed:
+            raise ErrConnectionClosed
+        if self.is_draining_pubs:
+            raise ErrConnectionDraining
+
+        self.stats["out_msgs"] += 1
+        self.stats["out_bytes"] += payload_size
+        await self._send_command(cmd)
+        if self._flush_queue.empty():  # type: ignore[union-attr]
+            await self._flush_pending()
+
     async def publish_request(
         self,
         subject: str,
@@ -676,7 +962,7 @@ class Client:
         payload: bytes = b"",
         timeout: float = 0.5,
         old_style: bool = False,
-        headers: Optional[Dict[str, str]] = None,
+        headers: Optional[Mapping[str, str]] = None,
     ) -> Msg:
         """
         Implements the request/response pattern via pub/sub
@@ -815,13 +1101,13 @@ class Client:
         subject: bytes,
         reply: bytes,
         data: bytes,
-        headers: Optional[Dict[str, str]],
+        headers: Optional[bytes],
     ) -> "Msg":
         return self.msg_class(
             subject=subject.decode(),
             reply=reply.decode(),
             data=data,
-            headers=headers,
+            raw_headers=_EMPTY_ if headers is None else headers,
             client=self,
         )
 
@@ -883,8 +1169,8 @@ class Client:
         if self.options["no_echo"] is not None:
             options["echo"] = not self.options["no_echo"]
 
-        connect_opts = json.dumps(options, sort_keys=True)
-        return b"".join([CONNECT_OP + _SPC_ + connect_opts.encode() + _CRLF_])
+        connect_opts = self._codec.dumps(options)
+        return b"".join([CONNECT_OP + _SPC_ + connect_opts + _CRLF_])
 
     def _host_is_ip(self, connect_url: Optional[str]) -> bool:
         try:
@@ -893,28 +1179,6 @@ class Client:
         except:
             return False
 
-    def _parse_headers(self, headers: Optional[bytes]) -> Dict[str, str]:
-        hdrs: Dict[str, str] = {}
-        if headers is None:
-            return hdrs
-        raw_headers = headers[len(NATS_HDR_LINE) :]
-        parsed_hdrs = self._hdr_parser.parsebytes(raw_headers)
-        # Check if it is an inline status message like:
-        #
-        # NATS/1.0 404 No Messages
-        #
-        if len(parsed_hdrs.items()) == 0:
-            l = headers[len(NATS_HDR_LINE) - 1 :]
-            status = l[:STATUS_MSG_LEN]
-            desc = l[STATUS_MSG_LEN + 1 : len(l) - CTRL_LEN - CTRL_LEN]
-            hdrs[STATUS_HDR] = status.decode()
-            hdrs[DESC_HDR] = desc.decode()
-        else:
-            for k, v in parsed_hdrs.items():
-                hdrs[k] = v
-
-        return hdrs
-
     def _process_disconnect(self) -> None:
         """
         Process disconnection from the server and set client status
@@ -1254,6 +1518,11 @@ class Client:
         if self._flusher_task is not None and not self._flusher_task.cancelled():
             self._flusher_task.cancel()
 
+        # Closing can be the outcome of the lost connection being reported.
+        lost = self._connection_lost_task
+        if lost is not None and not lost.done() and lost is not asyncio.current_task():
+            lost.cancel()
+
         if self._reconnection_task is not None and not self._reconnection_task.done():
             self._reconnection_task.cancel()
 
@@ -1273,12 +1542,17 @@ class Client:
         # Relinquish control to allow background tasks to wrap up.
         await asyncio.sleep(0)
 
+        # Drop operations deferred by the parser which did not get to run.
+        for coro in self._deferred:
+            coro.close()  # type: ignore[attr-defined]
+        self._deferred = []
+
         if self._current_server is not None:
             # In case there is any pending data at this point, flush before disconnecting.
             if self._pending_data_size > 0:
-                self._io_writer.writelines(self._pending[:])  # type: ignore[union-attr]
-                self._pending = []
+                pending, self._pending = self._pending, []
                 self._pending_data_size = 0
+                self._io_writer.writelines(pending)  # type: ignore[union-attr]
                 await self._io_writer.drain()  # type: ignore[union-attr]
 
         # Cleanup subscriptions since not reconnecting so no need
@@ -1318,11 +1592,9 @@ class Client:
                 await self._flush_queue.get()  # type: ignore[union-attr]
 
                 if self._pending_data_size > 0:
-                    self._io_writer.writelines(  # type: ignore[union-attr]
-                        self._pending[:]
-                    )
-                    self._pending = []
+                    pending, self._pending = self._pending, []
                     self._pending_data_size = 0
+                    self._io_writer.writelines(pending)  # type: ignore[union-attr]
                     await self._io_writer.drain()  # type: ignore[union-attr]
             except OSError as e:
                 await self._error_cb(e)  # type: ignore[misc]
@@ -1391,7 +1663,7 @@ class Client:
         _, info = info_line.split(INFO_OP + _SPC_, 1)
 
         try:
-            srv_info: ServerInfos = json.loads(info.decode())
+            srv_info: ServerInfos = self._codec.loads(info)
         except:
             raise NatsError("nats: info message, json parse error")
 
@@ -1503,7 +1775,8 @@ class Client:
         if PONG_PROTO in next_op:
             self._status = Client.CONNECTED
 
-        self._reading_task = asyncio.get_event_loop().create_task(self._read_loop())
+        if not (self.options["buffered_protocol"] and self._switch_to_protocol()):
+            self._reading_task = asyncio.get_event_loop().create_task(self._read_loop())
         self._pongs = []
         self._pings_outstanding = 0
         self._ping_interval_task = asyncio.get_event_loop().create_task(
@@ -1513,11 +1786,14 @@ class Client:
         # Task for kicking the flusher queue
         self._flusher_task = asyncio.get_event_loop().create_task(self._flusher())
 
-    async def _process_err(self, err_msg: Sequence[bytes]) -> None:
+    def _process_err(self, err_msg: Sequence[bytes]) -> None:
         """
         Processes the raw error message sent by the server
         and close connection with current server.
         """
+        self._defer(self._handle_err(err_msg))
+
+    async def _handle_err(self, err_msg: Sequence[bytes]) -> None:
         if STALE_CONNECTION in err_msg:
             await self._process_op_err(ErrStaleConnection)  # type: ignore[arg-type]
             return
@@ -1542,16 +1818,19 @@ class Client:
         # For now we handle similar as other clients and close.
         asyncio.get_event_loop().create_task(self._close(Client.CLOSED, do_cbs))
 
-    async def _process_msg(
+    def _process_msg(
         self,
         sid: int,
         subject: bytes,
         reply: bytes,
-        data: bytes,
-        headers: Optional[bytes],
+        data: Union[bytes, memoryview],
+        headers: Optional[Union[bytes, memoryview]],
     ) -> None:
         """
         Process MSG sent by server.
+
+        Payload and headers may be views into the parser buffer,
+        they are copied only once a subscription is known to want them.
         """
         payload_size = len(data)
         self.stats["in_msgs"] += 1
@@ -1568,13 +1847,13 @@ class Client:
             self._subs.pop(sid, None)
             sub._stop_processing()
 
-        try:
-            hdrs = self._parse_headers(headers)
-        except Exception as e:
-            await self._error_cb(e)  # type: ignore[misc]
-            return
-
-        msg = self._build_message(subject, reply, data, hdrs)
+        # Headers are kept raw, they are parsed when accessed on the message.
+        msg = self._build_message(
+            subject,
+            reply,
+            bytes(data),
+            None if headers is None else bytes(headers),
+        )
 
         # Check if it is an old style request.
         if sub._future:
@@ -1587,26 +1866,12 @@ class Client:
         # Let subscription wait_for_msgs coroutine process the messages,
         # but in case sending to the subscription task would block,
         # then consider it to be an slow consumer and drop the message.
-        try:
-            sub._pending_size += payload_size
-            # allow setting pending_bytes_limit to 0 to disable
-            if (
-                sub._pending_bytes_limit > 0
-                and sub._pending_size >= sub._pending_bytes_limit
-            ):
-                # Subtract the bytes since the message will be thrown away
-                # so it would not be pending data.
-                sub._pending_size -= payload_size
-
-                await self._error_cb(
+        if not sub._pending.put(msg):
+            self._defer(
+                self._error_cb(  # type: ignore[misc]
                     ErrSlowConsumer(subject=subject, sid=sid)
-                )  # type: ignore[misc]
-                return
-            sub._pending_queue.put_nowait(msg)
-        except asyncio.QueueFull:
-            await self._error_cb(
-                ErrSlowConsumer(subject=subject, sid=sid)
-            )  # type: ignore[misc]
+                )
+            )
 
     async def _process_op_err(self, e: Exception) -> None:
         """
@@ -1637,14 +1902,13 @@ class Client:
             self._err = e
             await self._close(Client.CLOSED, True)
 
-    async def _process_ping(self) -> None:
+    def _process_ping(self) -> None:
         """
         Process PING sent by server.
         """
-        await self._send_command(PONG)
-        await self._flush_pending()
+        self._defer(self._send_pong())
 
-    async def _process_pong(self) -> None:
+    def _process_pong(self) -> None:
         """
         Process PONG sent by server.
         """
@@ -1654,6 +1918,70 @@ class Client:
             self._pongs_received += 1
             self._pings_outstanding = 0
 
+    def _switch_to_protocol(self) -> bool:
+        """
+        Replaces the stream reader protocol used during the handshake
+        with a NatsProtocol which feeds the parser directly from the
+        transport, so that no reading task is needed.
+
+        Returns False when the bytes buffered by the stream reader
+        cannot be recovered, in which case the stream reader is kept
+        and must be read with the read loop.
+        """
+        # Bytes which the server sent right after the handshake
+        # may already be waiting in the stream reader, which does
+        # not expose its buffer publicly.
+        buffer = getattr(self._io_reader, "_buffer", None)
+        if not isinstance(buffer, (bytes, bytearray)):
+            return False
+        leftover = bytes(buffer)
+        loop = asyncio.get_event_loop()
+        transport = self._io_writer.transport  # type: ignore[union-attr]
+        protocol = NatsProtocol(self, DEFAULT_BUFFER_SIZE, loop=loop)
+        transport.set_protocol(protocol)
+        # Keep the stream writer used during the handshake alive, otherwise
+        # it would close the transport when garbage collected.
+        self._stream_io_writer = self._io_writer
+        self._io_writer = asyncio.StreamWriter(transport, protocol, None, loop)
+        if leftover:
+            protocol.feed(leftover)
+        return True
+
+    def _report_error(self, err: Exception) -> None:
+        """
+        Gives an error to the error callback from code which cannot
+        await it, a reference to the task is kept until it is done.
+        """
+        task = asyncio.get_running_loop().create_task(
+            self._error_cb(err)  # type: ignore[misc]
+        )
+        self._error_tasks.add(task)
+        task.add_done_callback(self._error_tasks.discard)
+
+    def _defer(self, coro: Awaitable[None]) -> None:
+        """
+        Schedules a coroutine to be awaited once the parser is done
+        with the data which was read, so that dispatching parsed
+        operations never needs to suspend.
+        """
+        self._deferred.append(coro)
+
+    async def _run_deferred(self) -> None:
+        """
+        Awaits coroutines deferred while dispatching parsed operations
+        in the order they were scheduled.
+        """
+        while self._deferred:
+            deferred, self._deferred = self._deferred, []
+            for i, coro in enumerate(deferred):
+                try:
+                    await coro
+                except BaseException:
+                    # Do not leave never awaited coroutines behind.
+                    for pending in deferred[i + 1 :]:
+                        pending.close()  # type: ignore[attr-defined]
+                    raise
+
     async def _read_loop(self) -> None:
         """
         Coroutine which gathers bytes sent by the server
@@ -1676,7 +2004,9 @@ class Client:
                     break
 
                 b = await self._io_reader.read(DEFAULT_BUFFER_SIZE)
-                await self._ps.parse(b)
+                self._ps.parse(b)
+                if self._deferred:
+                    await self._run_deferred()
             except ErrProtocol:
                 await self._process_op_err(ErrProtocol)  # type: ignore[arg-type]
                 break
@@ -1693,11 +2023,27 @@ class Client:
         subject: str,
         payload: bytes,
         timeout: float = 0.5,
-        headers: Optional[Dict[str, str]] = None,
+        headers: Optional[Mapping[str, str]] = None,
     ) -> Msg:
         if self.is_draining_pubs:
             raise ErrConnectionDraining
 
+        inbox, future = await self._response_inbox()
+        await self.publish(subject, payload, reply=inbox, headers=headers)
+
+        # Wait for the response or give up on timeout.
+        try:
+            msg = await asyncio.wait_for(future, timeout)
+            return msg
+        except asyncio.TimeoutError:
+            self._discard_response(inbox)
+            raise ErrTimeout
+
+    async def _response_inbox(self) -> Tuple[str, "Future[Msg]"]:
+        """
+        Returns a reply subject handled by the responses subscription
+        and the future which will be resolved with the response.
+        """
         if not self._resp_sub_prefix:
             await self._init_request_sub()
 
@@ -1707,16 +2053,16 @@ class Client:
         inbox.extend(token)
         future: Future[Msg] = asyncio.Future()
         self._resp_map[token.decode()] = future
-        await self.publish(subject, payload, reply=inbox.decode(), headers=headers)
+        return inbox.decode(), future
 
-        # Wait for the response or give up on timeout.
-        try:
-            msg = await asyncio.wait_for(future, timeout)
-            return msg
-        except asyncio.TimeoutError:
-            self._resp_map.pop(token.decode())
+    def _discard_response(self, inbox: str) -> None:
+        """
+        Stops waiting for a response on a reply subject
+        returned by _response_inbox.
+        """
+        future = self._resp_map.pop(inbox[INBOX_PREFIX_LEN:], None)
+        if future is not None:
             future.cancel()
-            raise ErrTimeout
 
     async def _request_old_style(
         self, subject: str, payload: bytes, timeout: float = 0.5
@@ -1811,12 +2157,27 @@ class Client:
                 await self._error_cb(e)  # type: ignore[misc]
                 continue
 
-    async def _send_command(self, cmd: bytes, priority: bool = False) -> None:
-        if priority:
-            self._pending.insert(0, cmd)
+    async def _send_command(
+        self, cmd: Union[bytes, Tuple[bytes, ...]], priority: bool = False
+    ) -> None:
+        """
+        Appends a command to the pending buffer. Commands carrying
+        a payload are given as a tuple of segments, which are kept
+        as is until they are written to the transport.
+        """
+        if isinstance(cmd, tuple):
+            size = sum(map(len, cmd))
+            if priority:
+                self._pending[0:0] = cmd
+            else:
+                self._pending.extend(cmd)
         else:
-            self._pending.append(cmd)
-        self._pending_data_size += len(cmd)
+            size = len(cmd)
+            if priority:
+                self._pending.insert(0, cmd)
+            else:
+                self._pending.append(cmd)
+        self._pending_data_size += size
         if self._pending_data_size > self.options["pending_size"]:
             await self._flush_pending()
 
@@ -1827,35 +2188,44 @@ class Client:
         self._io_writer.write(PING_PROTO)  # type: ignore[union-attr]
         await self._flush_pending()
 
-    async def _send_publish(
+    async def _send_pong(self) -> None:
+        await self._send_command(PONG)
+        await self._flush_pending()
+
+    def _pub_command(
         self,
         subject: str,
         reply: str,
         payload: bytes,
-        payload_size: int,
-        headers: Optional[Dict[str, str]],
-    ) -> None:
+        headers: Optional[Mapping[str, str]],
+    ) -> Tuple[bytes, ...]:
         """
-        Sends PUB command to the NATS server.
+        Builds the segments of the PUB or HPUB command for a message.
         """
         if subject == "":
             # Avoid sending messages with empty replies.
             raise ErrBadSubject
 
-        pub_cmd = None
+        if not isinstance(payload, bytes):
+            # Mutable buffers could change before being flushed.
+            payload = bytes(payload)
         if headers is None:
-            pub_cmd = prot_command.pub_cmd(subject, reply, payload)
-        else:
-            hdr = bytearray()
-            hdr.extend(NATS_HDR_LINE)
-            for k, v in headers.items():
-                hdr.extend(k.encode())
-                hdr.extend(b": ")
-                hdr.extend(v.encode())
-                hdr.extend(_CRLF_)
-            hdr.extend(_CRLF_)
-            pub_cmd = prot_command.hpub_cmd(subject, reply, hdr, payload)
+            return prot_command.pub_cmd(subject, reply, payload)
+        hdr = header_block(headers)
+        return prot_command.hpub_cmd(subject, reply, hdr, payload)
 
+    async def _send_publish(
+        self,
+        subject: str,
+        reply: str,
+        payload: bytes,
+        payload_size: int,
+        headers: Optional[Mapping[str, str]],
+    ) -> None:
+        """
+        Sends PUB command to the NATS server.
+        """
+        pub_cmd = self._pub_command(subject, reply, payload, headers)
         self.stats["out_msgs"] += 1
         self.stats["out_bytes"] += payload_size
         await self._send_command(pub_cmd)
@@ -62,6 +62,15 @@ class ErrSlowConsumer(NatsError):
         return "nats: Slow Consumer, messages dropped"
 
 
+class ErrInvalidHeaders(NatsError):
+    def __init__(self, subject=None, sid=None):
+        self.subject = subject
+        self.sid = sid
+
+    def __str__(self):
+        return "nats: Invalid message headers, headers dropped"
+
+
 class ErrTimeout(asyncio.TimeoutError):
     def __str__(self):
         return "nats: Timeout"
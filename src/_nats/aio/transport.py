@@ -0,0 +1,96 @@
+# Copyright 2016-2021 The NATS Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+asyncio protocol feeding the NATS protocol parser directly from the transport.
+"""
+
+import asyncio
+from asyncio.streams import FlowControlMixin
+from typing import TYPE_CHECKING, Optional
+
+from _nats.aio.errors import ErrStaleConnection
+from _nats.protocol.parser import ErrProtocol
+
+if TYPE_CHECKING:
+    from _nats.aio.client import Client
+
+
+class NatsProtocol(FlowControlMixin, asyncio.BufferedProtocol):
+    """
+    Buffered protocol used once the connection with the server is established.
+
+    The event loop reads from the socket into a buffer owned by the protocol
+    which is handed to the parser as is, instead of going through the buffer
+    of a StreamReader and a reading task. Flow control for writes is provided
+    by FlowControlMixin so that a StreamWriter can still be used on top of the
+    transport.
+    """
+
+    def __init__(
+        self,
+        nc: "Client",
+        buffer_size: int,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> None:
+        super().__init__(loop=loop)
+        self._nc = nc
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._deferred_task: Optional["asyncio.Task[None]"] = None
+        self._closed: "asyncio.Future[None]" = self._loop.create_future()
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._view
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self.feed(self._buffer, nbytes)
+
+    def feed(self, data: bytes, size: Optional[int] = None) -> None:
+        """
+        Parses data received from the server and schedules the
+        operations which were deferred while dispatching them.
+        """
+        nc = self._nc
+        if nc.is_closed or nc.is_reconnecting:
+            # Connection is being replaced, ignore what is left.
+            return
+        try:
+            nc._ps.parse(data, size)
+        except ErrProtocol:
+            nc._defer(nc._process_op_err(ErrProtocol))
+        if nc._deferred and (self._deferred_task is None or self._deferred_task.done()):
+            self._deferred_task = self._loop.create_task(nc._run_deferred())
+
+    def eof_received(self) -> bool:
+        # Let the transport close itself, connection_lost handles the rest.
+        return False
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        super().connection_lost(exc)
+        if not self._closed.done():
+            self._closed.set_result(None)
+        nc = self._nc
+        if nc.is_closed or nc.is_reconnecting or nc.is_connecting:
+            return
+        nc._connection_lost_task = self._loop.create_task(
+            self._process_connection_lost(exc)
+        )
+
+    async def _process_connection_lost(self, exc: Optional[Exception]) -> None:
+        err = exc or ErrStaleConnection()
+        await self._nc._error_cb(err)  # type: ignore[misc]
+        await self._nc._process_op_err(err)  # type: ignore[arg-type]
+
+    def _get_close_waiter(self, stream: asyncio.StreamWriter) -> "asyncio.Future[None]":
+        return self._closed
@@ -0,0 +1,152 @@
+# Copyright 2016-2021 The NATS Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+JSON codecs used for protocol messages and JetStream payloads.
+
+Codecs are registered by name. When no name is given, the first
+installed backend among orjson, ujson and the standard library is used.
+"""
+
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+JSONData = Union[str, bytes, bytearray]
+
+# Backends tried in order when no codec is requested.
+DEFAULT_CODECS = ("orjson", "ujson", "json")
+
+
+class JSONCodec:
+    """
+    Codec using the json module of the standard library.
+
+    `default` is called with objects which cannot be encoded natively,
+    e.g. datetimes or enums found in pydantic models.
+    """
+
+    name = "json"
+
+    def __init__(self, default: Optional[Callable[[Any], Any]] = None) -> None:
+        self._default = default
+
+    def loads(self, data: JSONData) -> Any:
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), default=self._default).encode()
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    Codec using orjson.
+    """
+
+    name = "orjson"
+
+    def __init__(self, default: Optional[Callable[[Any], Any]] = None) -> None:
+        import orjson
+
+        super().__init__(default)
+        self._orjson = orjson
+
+    def loads(self, data: JSONData) -> Any:
+        return self._orjson.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._orjson.dumps(obj, default=self._default)
+
+
+class UjsonCodec(JSONCodec):
+    """
+    Codec using ujson.
+    """
+
+    name = "ujson"
+
+    def __init__(self, default: Optional[Callable[[Any], Any]] = None) -> None:
+        import ujson  # type: ignore[import]
+
+        super().__init__(default)
+        self._ujson = ujson
+
+    def loads(self, data: JSONData) -> Any:
+        if isinstance(data, bytearray):
+            data = bytes(data)
+        return self._ujson.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._ujson.dumps(  # type: ignore[no-any-return]
+            obj, ensure_ascii=False, default=self._default
+        ).encode()
+
+
+_CODECS: Dict[str, Callable[..., JSONCodec]] = {
+    "json": JSONCodec,
+    "orjson": OrjsonCodec,
+    "ujson": UjsonCodec,
+}
+_CACHE: Dict[Tuple[Optional[str], Optional[Callable[[Any], Any]]], JSONCodec] = {}
+
+
+def register_codec(name: str, factory: Callable[..., JSONCodec]) -> None:
+    """
+    Registers a codec factory, called with the `default` function
+    for objects which cannot be encoded natively.
+    """
+    _CODECS[name] = factory
+    _CACHE.clear()
+
+
+def available_codecs() -> List[str]:
+    """
+    Returns the names of the codecs whose backend is installed,
+    the ones tried by default first, in order of preference.
+    """
+    names = []
+    others = [name for name in _CODECS if name not in DEFAULT_CODECS]
+    for name in [*DEFAULT_CODECS, *others]:
+        try:
+            _CODECS[name]()
+        except (ImportError, KeyError):
+            continue
+        names.append(name)
+    return names
+
+
+def get_codec(
+    name: Optional[str] = None, default: Optional[Callable[[Any], Any]] = None
+) -> JSONCodec:
+    """
+    Returns the codec registered under `name`, or the fastest installed one.
+
+    Raises ImportError when the backend of the requested codec is not installed.
+    """
+    key = (name, default)
+    codec = _CACHE.get(key)
+    if codec is not None:
+        return codec
+    if name is not None:
+        if name not in _CODECS:
+            raise ValueError(f"nats: unknown json codec {name!r}")
+        codec = _CODECS[name](default)
+    else:
+        for candidate in DEFAULT_CODECS:
+            try:
+                codec = _CODECS[candidate](default)
+            except ImportError:
+                continue
+            break
+    assert codec is not None
+    _CACHE[key] = codec
+    return codec
@@ -1,20 +1,51 @@
+from typing import Tuple
+
 PUB_OP = 'PUB'
 HPUB_OP = 'HPUB'
 SUB_OP = 'SUB'
 UNSUB_OP = 'UNSUB'
 _CRLF_ = '\r\n'
-
-
-def pub_cmd(subject: str, reply: str, payload: bytes) -> bytes:
-    return f'{PUB_OP} {subject} {reply} {len(payload)}{_CRLF_}'.encode(
-    ) + payload + _CRLF_.encode()
-
-
-def hpub_cmd(subject: str, reply: str, hdr: bytes, payload: bytes) -> bytes:
+_CRLF_BYTES_ = _CRLF_.encode()
+
+
+def pub_cmd(subject: str, reply: str,
+            payload: bytes) -> Tuple[bytes, bytes, bytes]:
+    """
+    Returns the segments of a PUB command, the payload is not copied.
+    """
+    return (
+        f'{PUB_OP} {subject} {reply} {len(payload)}{_CRLF_}'.encode(),
+        payload,
+        _CRLF_BYTES_,
+    )
+
+
+def hpub_cmd(subject: str, reply: str, hdr: bytes,
+             payload: bytes) -> Tuple[bytes, bytes, bytes, bytes]:
+    """
+    Returns the segments of a HPUB command, the payload is not copied.
+    """
     hdr_len = len(hdr)
     total_size = len(payload) + hdr_len
-    return f'{HPUB_OP} {subject} {reply} {hdr_len} {total_size}{_CRLF_}'.encode(
-    ) + hdr + payload + _CRLF_.encode()
+    return (
+        f'{HPUB_OP} {subject} {reply} {hdr_len} {total_size}{_CRLF_}'.encode(),
+        hdr,
+        payload,
+        _CRLF_BYTES_,
+    )
+
+
+def pub_cmd_template(subject: str, reply_prefix: str,
+                     payload: bytes) -> Tuple[bytes, bytes]:
+    """
+    Returns the segments of a PUB command surrounding the end of its reply
+    subject, for commands sent repeatedly with the same subject and payload
+    to replies sharing a prefix.
+    """
+    return (
+        f'{PUB_OP} {subject} {reply_prefix}'.encode(),
+        b' %d%b%b%b' % (len(payload), _CRLF_BYTES_, payload, _CRLF_BYTES_),
+    )
 
 
 def sub_cmd(subject: str, queue: str, sid: int) -> bytes:
@@ -0,0 +1,139 @@
+# Copyright 2016-2021 The NATS Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+NATS message headers codec.
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterator, Mapping, Tuple, Union
+
+_CRLF_ = b"\r\n"
+
+NATS_HDR_VERSION = "NATS/1.0"
+NATS_HDR_LINE = bytearray(b"NATS/1.0\r\n")
+NO_RESPONDERS_STATUS = "503"
+STATUS_MSG_LEN = 3  # e.g. 20x, 40x, 50x
+CTRL_LEN = len(_CRLF_)
+STATUS_HDR = "Status"
+DESC_HDR = "Description"
+
+# Number of distinct header dictionaries whose encoding is kept around.
+HEADERS_CACHE_SIZE = 256
+
+_VERSION_LEN = len(NATS_HDR_VERSION)
+_TEXT_CRLF_ = "\r\n"
+
+
+def parse_headers(data: Union[bytes, bytearray, memoryview]) -> Dict[str, str]:
+    """
+    Parses a header block such as `NATS/1.0\\r\\nKey: Value\\r\\n\\r\\n`.
+
+    An inline status on the version line, e.g. `NATS/1.0 404 No Messages`,
+    is reported under the Status and Description keys.
+    """
+    hdrs: Dict[str, str] = {}
+    if not data:
+        return hdrs
+    lines = str(data, "utf-8").split(_TEXT_CRLF_)
+    status = lines[0][_VERSION_LEN:]
+    if status:
+        status = status.strip()
+        hdrs[STATUS_HDR] = status[:STATUS_MSG_LEN]
+        hdrs[DESC_HDR] = status[STATUS_MSG_LEN + 1 :]
+    for line in lines[1:]:
+        key, sep, value = line.partition(":")
+        if sep:
+            hdrs[key.strip()] = value.strip()
+    return hdrs
+
+
+def encode_headers(headers: Mapping[str, str]) -> bytes:
+    """
+    Encodes headers into a header block ready to be sent with HPUB.
+    """
+    hdr = bytearray(NATS_HDR_LINE)
+    for k, v in headers.items():
+        hdr.extend(k.encode())
+        hdr.extend(b": ")
+        hdr.extend(v.encode())
+        hdr.extend(_CRLF_)
+    hdr.extend(_CRLF_)
+    return bytes(hdr)
+
+
+@lru_cache(maxsize=HEADERS_CACHE_SIZE)
+def _encode_items(items: Tuple[Tuple[str, str], ...]) -> bytes:
+    return encode_headers(dict(items))
+
+
+def header_block(headers: Mapping[str, str]) -> bytes:
+    """
+    Returns the encoded header block for the given headers.
+
+    Frozen headers carry their block already, volatile headers are
+    encoded every time, other mappings are looked up in a small cache
+    keyed on their items.
+    """
+    if isinstance(headers, FrozenHeaders):
+        return headers.block
+    if isinstance(headers, VolatileHeaders):
+        return encode_headers(headers)
+    return _encode_items(tuple(headers.items()))
+
+
+class Headers(Dict[str, str]):
+    """
+    Headers of a message to publish.
+    """
+
+    def freeze(self) -> "FrozenHeaders":
+        """
+        Returns an immutable copy of the headers which is encoded once,
+        to be reused when publishing many messages with the same headers.
+        """
+        return FrozenHeaders(self)
+
+
+class VolatileHeaders(Dict[str, str]):
+    """
+    Headers which are unlikely to be published again, e.g. carrying a
+    sequence number, encoded without going through the header cache.
+    """
+
+
+class FrozenHeaders(Mapping[str, str]):
+    """
+    Immutable headers holding their encoded header block.
+    """
+
+    __slots__ = ("_headers", "block")
+
+    def __init__(self, headers: Mapping[str, str]) -> None:
+        self._headers = dict(headers)
+        self.block = encode_headers(self._headers)
+
+    def __getitem__(self, key: str) -> str:
+        return self._headers[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._headers)
+
+    def __len__(self) -> int:
+        return len(self._headers)
+
+    def __hash__(self) -> int:
+        return hash(self.block)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}: {self._headers!r}>"
@@ -15,25 +15,13 @@
 NATS network protocol parser.
 """
 
-import re
-import json
-from typing import TYPE_CHECKING, Any, Dict, Optional
+from typing import TYPE_CHECKING, Any, Dict, Optional, Union
+
+from _nats.protocol.codec import JSONCodec, get_codec
 
 if TYPE_CHECKING:
     from _nats.aio.client import Client
 
-MSG_RE = re.compile(
-    b"\\AMSG\\s+([^\\s]+)\\s+([^\\s]+)\\s+(([^\\s]+)[^\\S\r\n]+)?(\\d+)\r\n"
-)
-HMSG_RE = re.compile(
-    b"\\AHMSG\\s+([^\\s]+)\\s+([^\\s]+)\\s+(([^\\s]+)[^\\S\r\n]+)?([\\d]+)\\s+(\\d+)\r\n"
-)
-OK_RE = re.compile(b"\\A\\+OK\\s*\r\n")
-ERR_RE = re.compile(b"\\A-ERR\\s+('.+')?\r\n")
-PING_RE = re.compile(b"\\APING\\s*\r\n")
-PONG_RE = re.compile(b"\\APONG\\s*\r\n")
-INFO_RE = re.compile(b"\\AINFO\\s+([^\r\n]+)\r\n")
-
 INFO_OP = b"INFO"
 CONNECT_OP = b"CONNECT"
 PUB_OP = b"PUB"
@@ -48,6 +36,7 @@ ERR_OP = b"-ERR"
 MSG_END = b"\n"
 _CRLF_ = b"\r\n"
 _SPC_ = b" "
+_EMPTY_ = b""
 
 OK = OK_OP + _CRLF_
 PING = PING_OP + _CRLF_
@@ -57,8 +46,18 @@ OK_SIZE = len(OK)
 PING_SIZE = len(PING)
 PONG_SIZE = len(PONG)
 MSG_OP_SIZE = len(MSG_OP)
+HMSG_OP_SIZE = len(HMSG_OP)
+INFO_OP_SIZE = len(INFO_OP)
 ERR_OP_SIZE = len(ERR_OP)
 
+# First byte of each operation sent by the server.
+_M_ = ord("M")
+_H_ = ord("H")
+_P_ = ord("P")
+_I_ = ord("I")
+_PLUS_ = ord("+")
+_MINUS_ = ord("-")
+
 # States
 AWAITING_CONTROL_LINE = 1
 AWAITING_MSG_PAYLOAD = 2
@@ -66,8 +65,11 @@ MAX_CONTROL_LINE_SIZE = 1024
 
 
 class Parser:
-    def __init__(self, nc: Optional["Client"] = None) -> None:
+    def __init__(
+        self, nc: Optional["Client"] = None, codec: Optional[JSONCodec] = None
+    ) -> None:
         self.nc = nc
+        self.codec = codec or get_codec()
         self.reset()
 
     def __repr__(self) -> str:
@@ -80,127 +82,157 @@ class Parser:
         self.header_needed = 0
         self.msg_arg: Dict[str, Any] = {}
 
-    async def parse(self, data: bytes = b"") -> None:
+    def parse(self, data: bytes = b"", size: Optional[int] = None) -> None:
         """
         Parses the wire protocol from NATS for the client
         and dispatches the subscription callbacks.
+
+        Control lines are located with a single search for CRLF and
+        dispatched on their first bytes, arguments are split on
+        whitespace without going through regular expressions.
+
+        The parser walks the buffer with a read offset and only
+        compacts it once all complete operations have been processed.
+        Payloads and headers are handed to the client as memoryview
+        slices which are only valid during the `_process_msg` call.
+
+        Dispatching is done with plain function calls, the client
+        defers the rare operations which need to be awaited.
+
+        When `size` is given only the first `size` bytes of `data` are
+        parsed, and `data` can be reused by the caller once this returns.
         """
-        self.buf.extend(data)
-        while self.buf:
+        if size is None:
+            size = len(data)
+        # Either the pending buffer, or the data which was read
+        buf: Union[bytes, bytearray]
+        if self.buf:
+            self.buf.extend(memoryview(data)[:size])
+            buf = self.buf
+            size = len(buf)
+        else:
+            # Parse straight from the data which was read.
+            buf = data
+        if self.state == AWAITING_MSG_PAYLOAD and size < self.needed + CRLF_SIZE:
+            # Still gathering a payload which is split across reads.
+            if buf is data:
+                self.buf.extend(memoryview(data)[:size])
+            return
+
+        view = memoryview(buf)
+        pos = 0
+        while pos < size:
             if self.state == AWAITING_CONTROL_LINE:
-                msg = MSG_RE.match(self.buf)
-                if msg:
+                end = buf.find(_CRLF_, pos, size)
+                if end < 0:
+                    # Split buffer, need to gather more bytes.
+                    break
+                line = buf[pos:end]
+                pos = end + CRLF_SIZE
+                op = line[0] if line else 0
+
+                if op == _M_ and line.startswith(MSG_OP):
+                    # MSG <subject> <sid> [reply-to] <#bytes>
+                    args = line[MSG_OP_SIZE:].split()
+                    nargs = len(args)
                     try:
-                        subject, _sid, _, reply, needed_bytes = msg.groups()
-                        self.msg_arg["subject"] = subject
-                        self.msg_arg["sid"] = int(_sid)
-                        if reply:
-                            self.msg_arg["reply"] = reply
+                        if nargs == 3:
+                            subject, sid, needed = args
+                            reply = _EMPTY_
+                        elif nargs == 4:
+                            subject, sid, reply, needed = args
                         else:
-                            self.msg_arg["reply"] = b""
-                        self.needed = int(needed_bytes)
-                        del self.buf[: msg.end()]
-                        self.state = AWAITING_MSG_PAYLOAD
-                        continue
-                    except:
+                            raise ValueError
+                        self.msg_arg["sid"] = int(sid)
+                        self.needed = int(needed)
+                    except ValueError:
                         raise ErrProtocol("nats: malformed MSG")
+                    self.msg_arg["subject"] = subject
+                    self.msg_arg["reply"] = reply
+                    self.header_needed = 0
+                    self.state = AWAITING_MSG_PAYLOAD
+                    continue
 
-                msg = HMSG_RE.match(self.buf)
-                if msg:
+                if op == _H_ and line.startswith(HMSG_OP):
+                    # HMSG <subject> <sid> [reply-to] <#header bytes> <#total bytes>
+                    args = line[HMSG_OP_SIZE:].split()
+                    nargs = len(args)
                     try:
-                        (
-                            subject,
-                            _sid,
-                            _,
-                            reply,
-                            header_size,
-                            needed_bytes,
-                        ) = msg.groups()
-                        self.msg_arg["subject"] = subject
-                        self.msg_arg["sid"] = int(_sid)
-                        if reply:
-                            self.msg_arg["reply"] = reply
+                        if nargs == 4:
+                            subject, sid, header_needed, needed = args
+                            reply = _EMPTY_
+                        elif nargs == 5:
+                            subject, sid, reply, header_needed, needed = args
                         else:
-                            self.msg_arg["reply"] = b""
-                        self.needed = int(needed_bytes)
-                        self.header_needed = int(header_size)
-                        del self.buf[: msg.end()]
-                        self.state = AWAITING_MSG_PAYLOAD
-                        continue
-                    except:
+                            raise ValueError
+                        self.msg_arg["sid"] = int(sid)
+                        self.header_needed = int(header_needed)
+                        self.needed = int(needed)
+                    except ValueError:
                         raise ErrProtocol("nats: malformed MSG")
-
-                ok = OK_RE.match(self.buf)
-                if ok:
-                    # Do nothing and just skip.
-                    del self.buf[: ok.end()]
+                    self.msg_arg["subject"] = subject
+                    self.msg_arg["reply"] = reply
+                    self.state = AWAITING_MSG_PAYLOAD
                     continue
 
-                err = ERR_RE.match(self.buf)
-                if err:
-                    err_msg = err.groups()
-                    await self.nc._process_err(err_msg)  # type: ignore[union-attr]
-                    del self.buf[: err.end()]
-                    continue
+                if op == _P_:
+                    if line.startswith(PING_OP):
+                        self.nc._process_ping()  # type: ignore[union-attr]
+                        continue
+                    if line.startswith(PONG_OP):
+                        self.nc._process_pong()  # type: ignore[union-attr]
+                        continue
 
-                ping = PING_RE.match(self.buf)
-                if ping:
-                    del self.buf[: ping.end()]
-                    await self.nc._process_ping()  # type: ignore[union-attr]
+                if op == _PLUS_ and line.startswith(OK_OP):
+                    # Do nothing and just skip.
                     continue
 
-                pong = PONG_RE.match(self.buf)
-                if pong:
-                    del self.buf[: pong.end()]
-                    await self.nc._process_pong()  # type: ignore[union-attr]
+                if op == _MINUS_ and line.startswith(ERR_OP):
+                    err_msg = bytes(line[ERR_OP_SIZE:].strip())
+                    self.nc._process_err((err_msg,))  # type: ignore[union-attr]
                     continue
 
-                info = INFO_RE.match(self.buf)
-                if info:
-                    info_line = info.groups()[0]
-                    srv_info = json.loads(info_line.decode())
+                if op == _I_ and line.startswith(INFO_OP):
+                    srv_info = self.codec.loads(bytes(line[INFO_OP_SIZE:]))
                     self.nc._process_info(srv_info)  # type: ignore[union-attr]
-                    del self.buf[: info.end()]
                     continue
 
-                if len(self.buf) < MAX_CONTROL_LINE_SIZE and _CRLF_ in self.buf:
-                    # FIXME: By default server uses a max protocol
-                    # line of 1024 bytes but it can be tuned in latest
-                    # releases, in that case we won't reach here but
-                    # client ping/pong interval would disconnect
-                    # eventually.
-                    raise ErrProtocol("nats: unknown protocol")
-                else:
-                    # If nothing matched at this point, then it must
-                    # be a split buffer and need to gather more bytes.
-                    break
+                raise ErrProtocol("nats: unknown protocol")
 
             elif self.state == AWAITING_MSG_PAYLOAD:
-                if len(self.buf) >= self.needed + CRLF_SIZE:
-                    hdr = None
-                    subject = self.msg_arg["subject"]
-                    sid = self.msg_arg["sid"]
-                    reply = self.msg_arg["reply"]
-
-                    # Consume msg payload from buffer and set next parser state.
-                    if self.header_needed > 0:
-                        hbuf = bytes(self.buf[: self.header_needed])
-                        payload = bytes(self.buf[self.header_needed : self.needed])
-                        hdr = hbuf
-                        del self.buf[: self.needed + CRLF_SIZE]
-                        self.header_needed = 0
-                    else:
-                        payload = bytes(self.buf[: self.needed])
-                        del self.buf[: self.needed + CRLF_SIZE]
-
-                    self.state = AWAITING_CONTROL_LINE
-                    await self.nc._process_msg(  # type: ignore[union-attr]
-                        sid, subject, reply, payload, hdr
-                    )
-                else:
+                end = pos + self.needed
+                if end + CRLF_SIZE > size:
                     # Wait until we have enough bytes in buffer.
                     break
 
+                # Consume msg payload from buffer and set next parser state.
+                hdr = None
+                if self.header_needed > 0:
+                    hdr_end = pos + self.header_needed
+                    hdr = view[pos:hdr_end]
+                    payload = view[hdr_end:end]
+                    self.header_needed = 0
+                else:
+                    payload = view[pos:end]
+                pos = end + CRLF_SIZE
+
+                self.state = AWAITING_CONTROL_LINE
+                self.nc._process_msg(  # type: ignore[union-attr]
+                    self.msg_arg["sid"],
+                    self.msg_arg["subject"],
+                    self.msg_arg["reply"],
+                    payload,
+                    hdr,
+                )
+
+        # Compact the buffer once. Views which were handed out
+        # still point into the previous buffer so it is replaced
+        # rather than resized.
+        if pos >= size:
+            self.buf = bytearray()
+        elif pos > 0 or buf is data:
+            self.buf = bytearray(view[pos:size])
+
 
 class ErrProtocol(Exception):
     def __str__(self) -> str:
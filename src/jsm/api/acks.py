@@ -0,0 +1,122 @@
+# Copyright 2021 - Guillaume Charbonnier
+# Licensed under the Apache License, Version 2.0 (the "License");
+# http://www.apache.org/licenses/LICENSE-2.0
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Iterable, List, Optional, Union
+
+from _nats.aio.client import PublishItem
+from jsm.models.messages import JsMsg, Message, parse_metadata
+
+# Messages received from a consumer, parsed or not
+_AnyMessage = Union[Message, JsMsg]
+
+if TYPE_CHECKING:
+    from .client import Client
+
+# Payloads sent to the reply subject of a message to acknowledge it
+ACK = b"+ACK"
+NAK = b"-NAK"
+WPI = b"+WPI"
+TERM = b"+TERM"
+
+DEFAULT_ACK_BATCH_SIZE = 256
+
+
+class AckBatcher:
+    """Collect acknowledgements and send them together.
+
+    Acknowledgements are written at once on the next iteration of the event loop,
+    or as soon as `max_batch` acknowledgements are waiting. Use `wait=True` to send
+    an acknowledgement right away and wait until the server received it, errors are
+    then raised to the caller instead of being reported to the error callback.
+
+    Notes:
+        * This is not meant to be constructed directly, use `Client.acks` instead.
+    """
+
+    def __init__(self, nc: Client, max_batch: int = DEFAULT_ACK_BATCH_SIZE) -> None:
+        self._nc = nc
+        self._max_batch = max_batch
+        self._pending: List[PublishItem] = []
+        self._handle: Optional[asyncio.Handle] = None
+        self._task: Optional[asyncio.Task[None]] = None
+
+    @property
+    def pending(self) -> int:
+        """Number of acknowledgements waiting to be sent."""
+        return len(self._pending)
+
+    async def ack(self, msg: _AnyMessage, wait: bool = False) -> None:
+        """Acknowledge a message."""
+        await self.add(msg.reply, ACK, wait)
+
+    async def nak(self, msg: _AnyMessage, wait: bool = False) -> None:
+        """Negatively acknowledge a message so that it is redelivered."""
+        await self.add(msg.reply, NAK, wait)
+
+    async def in_progress(self, msg: _AnyMessage, wait: bool = False) -> None:
+        """Indicate that a message is still being processed, resetting its ack wait timer."""
+        await self.add(msg.reply, WPI, wait)
+
+    async def term(self, msg: _AnyMessage, wait: bool = False) -> None:
+        """Stop the redelivery of a message without acknowledging it."""
+        await self.add(msg.reply, TERM, wait)
+
+    async def ack_all(self, msgs: Iterable[_AnyMessage]) -> None:
+        """Acknowledge messages of a consumer using AckPolicy.all.
+
+        Only the message with the highest stream sequence is acknowledged,
+        which acknowledges all messages before it.
+        """
+        last: Optional[_AnyMessage] = None
+        last_seq = -1
+        for msg in msgs:
+            seq = _stream_seq(msg)
+            if seq > last_seq:
+                last, last_seq = msg, seq
+        if last is not None:
+            await self.ack(last)
+
+    async def add(self, reply: str, payload: bytes, wait: bool = False) -> None:
+        """Queue an acknowledgement payload to send to a reply subject.
+
+        When `wait` is True, acknowledgements waiting to be sent are sent immediately
+        and this returns once the server received them.
+        """
+        self._pending.append((reply, payload, None))
+        if wait or len(self._pending) >= self._max_batch:
+            await self.flush()
+        elif self._handle is None:
+            self._handle = asyncio.get_running_loop().call_soon(self._flush_soon)
+        if wait:
+            await self._nc.flush()
+
+    async def flush(self) -> None:
+        """Send the acknowledgements waiting to be sent."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        await self._nc.publish_many(pending)
+
+    def _flush_soon(self) -> None:
+        self._handle = None
+        if self._pending and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._flush_task())
+
+    async def _flush_task(self) -> None:
+        try:
+            # Acknowledgements may be added while the previous ones are sent
+            while self._pending:
+                await self.flush()
+        except Exception as err:
+            await self._nc._error_cb(err)  # type: ignore[misc]
+
+
+def _stream_seq(msg: _AnyMessage) -> int:
+    seq: int = parse_metadata(msg.reply).stream_seq
+    return seq
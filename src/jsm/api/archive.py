@@ -0,0 +1,196 @@
+# Copyright 2021 - Guillaume Charbonnier
+# Licensed under the Apache License, Version 2.0 (the "License");
+# http://www.apache.org/licenses/LICENSE-2.0
+"""Archive format used to export and import the messages of a stream.
+
+An archive starts with a header made of the magic bytes, the format version and the
+compression used. It is followed by blocks, each made of its stored size, its size once
+decompressed, and its content. Blocks hold records:
+
+    seq (u64) | time in ns (u64) | subject size (u32) | headers size (u32) | payload size (u32)
+    subject | headers | payload
+
+Records never span two blocks, so an archive is read or written holding one block at a time.
+"""
+from __future__ import annotations
+
+import struct
+import zlib
+from enum import Enum
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+ARCHIVE_MAGIC = b"JSMA"
+ARCHIVE_VERSION = 1
+# Size of the records written in a block before it is compressed and written
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+_HEADER = struct.Struct(">4sBB")
+_BLOCK = struct.Struct(">II")
+_RECORD = struct.Struct(">QQIII")
+
+
+class Compression(str, Enum):
+    """Compression applied to the blocks of an archive."""
+
+    none = "none"
+    zlib = "zlib"
+    zstd = "zstd"
+
+
+_COMPRESSION_CODES = {Compression.none: 0, Compression.zlib: 1, Compression.zstd: 2}
+_CODE_COMPRESSIONS = {code: c for c, code in _COMPRESSION_CODES.items()}
+
+
+class ArchiveRecord(NamedTuple):
+    """A message read from an archive"""
+
+    seq: int
+    time: int
+    subject: str
+    headers: bytes
+    data: bytes
+
+
+def _check_compression(compression: Compression) -> None:
+    if compression == Compression.zstd and zstandard is None:
+        raise ValueError("zstd compression requires the zstandard package")
+
+
+class ArchiveWriter:
+    """Write records to an archive file opened in binary mode."""
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        compression: Compression = Compression.none,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+    ) -> None:
+        compression = Compression(compression)
+        _check_compression(compression)
+        self.count = 0
+        self._file = fileobj
+        self._compression = compression
+        self._block_size = block_size
+        self._block = bytearray()
+        self._compressor: Optional[zstandard.ZstdCompressor] = None
+        if compression == Compression.zstd:
+            self._compressor = zstandard.ZstdCompressor()
+        self._file.write(
+            _HEADER.pack(
+                ARCHIVE_MAGIC, ARCHIVE_VERSION, _COMPRESSION_CODES[compression]
+            )
+        )
+
+    def write(
+        self, seq: int, time: int, subject: str, headers: bytes, data: bytes
+    ) -> None:
+        """Add a record to the archive."""
+        if self.add(seq, time, subject, headers, data):
+            self.flush()
+
+    def add(
+        self, seq: int, time: int, subject: str, headers: bytes, data: bytes
+    ) -> bool:
+        """Add a record to the current block without writing it, return True once the block must be flushed."""
+        raw_subject = subject.encode()
+        block = self._block
+        block += _RECORD.pack(seq, time, len(raw_subject), len(headers), len(data))
+        block += raw_subject
+        block += headers
+        block += data
+        self.count += 1
+        return len(block) >= self._block_size
+
+    def flush(self) -> None:
+        """Write the records added since the last block."""
+        if not self._block:
+            return
+        raw, self._block = self._block, bytearray()
+        if self._compression == Compression.zlib:
+            stored: bytes = zlib.compress(raw)
+        elif self._compressor is not None:
+            stored = self._compressor.compress(raw)
+        else:
+            stored = raw
+        self._file.write(_BLOCK.pack(len(stored), len(raw)))
+        self._file.write(stored)
+
+    def close(self) -> None:
+        """Write the remaining records. The file itself is not closed."""
+        self.flush()
+        self._file.flush()
+
+
+class ArchiveReader:
+    """Iterate over the records of an archive file opened in binary mode."""
+
+    def __init__(self, fileobj: BinaryIO) -> None:
+        self._file = fileobj
+        header = fileobj.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise ValueError("Failed to read archive. File is too short")
+        magic, version, code = _HEADER.unpack(header)
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError("Failed to read archive. File is not a stream archive")
+        if version != ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported archive version: {version}")
+        if code not in _CODE_COMPRESSIONS:
+            raise ValueError(f"Unsupported archive compression: {code}")
+        self.compression = _CODE_COMPRESSIONS[code]
+        _check_compression(self.compression)
+        self._decompressor: Optional[zstandard.ZstdDecompressor] = None
+        if self.compression == Compression.zstd:
+            self._decompressor = zstandard.ZstdDecompressor()
+
+    def __iter__(self) -> Iterator[ArchiveRecord]:
+        while True:
+            block = self._read_block()
+            if block is None:
+                return
+            yield from _iter_records(block)
+
+    def read_block(self) -> Optional[List[ArchiveRecord]]:
+        """Read the records of the next block, or None once the end of the archive is reached."""
+        block = self._read_block()
+        if block is None:
+            return None
+        return list(_iter_records(block))
+
+    def _read_block(self) -> Optional[bytes]:
+        header = self._file.read(_BLOCK.size)
+        if not header:
+            return None
+        if len(header) != _BLOCK.size:
+            raise ValueError("Failed to read archive. Block is truncated")
+        stored_size, raw_size = _BLOCK.unpack(header)
+        stored = self._file.read(stored_size)
+        if len(stored) != stored_size:
+            raise ValueError("Failed to read archive. Block is truncated")
+        if self.compression == Compression.zlib:
+            return zlib.decompress(stored)
+        if self._decompressor is not None:
+            return self._decompressor.decompress(stored, max_output_size=raw_size)  # type: ignore[no-any-return]
+        return stored
+
+
+def _iter_records(block: bytes) -> Iterator[ArchiveRecord]:
+    view = memoryview(block)
+    offset = 0
+    end = len(block)
+    while offset < end:
+        seq, time, subject_size, headers_size, data_size = _RECORD.unpack_from(
+            view, offset
+        )
+        offset += _RECORD.size
+        subject = str(view[offset : offset + subject_size], "utf-8")
+        offset += subject_size
+        headers = bytes(view[offset : offset + headers_size])
+        offset += headers_size
+        data = bytes(view[offset : offset + data_size])
+        offset += data_size
+        yield ArchiveRecord(seq, time, subject, headers, data)
@@ -1,13 +1,23 @@
 # Copyright 2021 - Guillaume Charbonnier
 # Licensed under the Apache License, Version 2.0 (the "License");
 # http://www.apache.org/licenses/LICENSE-2.0
-from typing import Optional
+import asyncio
+from typing import Dict, Optional, Set, Tuple
+
+from pydantic.json import pydantic_encoder
 
 from _nats.aio.client import Client as NC
+from _nats.protocol.codec import get_codec
+from jsm.models.messages import JsMsg
+from jsm.models.streams import PubAck
 
+from .acks import DEFAULT_ACK_BATCH_SIZE, AckBatcher
 from .mixins.consumers import ConsumersMixin
 from .mixins.infos import AccountInfosMixin
 from .mixins.streams import StreamsMixin
+from .subscriptions import PullSubscription
+
+DEFAULT_PUBLISH_ASYNC_MAX_PENDING = 4000
 
 
 class Client(NC, AccountInfosMixin, ConsumersMixin, StreamsMixin):
@@ -66,13 +76,59 @@ class Client(NC, AccountInfosMixin, ConsumersMixin, StreamsMixin):
     >>> await js.consumer_delete("DEMO", "app-consumer-01")
     """
 
+    # Metadata of consumed messages is parsed from their reply subject when accessed
+    msg_class = JsMsg
+
     def __init__(
         self,
         domain: Optional[str] = None,
         default_timeout: float = 1.0,
         raise_on_error: bool = False,
+        publish_async_max_pending: int = DEFAULT_PUBLISH_ASYNC_MAX_PENDING,
+        trust_responses: bool = False,
+        json_codec: Optional[str] = None,
+        batch_acks: bool = True,
     ):
-        super().__init__()
+        # Codec of protocol and JetStream payloads, the fastest installed one by default
+        super().__init__(get_codec(json_codec, default=pydantic_encoder))
         self._prefix = f"$JS.{domain}.API" if domain else "$JS.API"
         self._timeout = default_timeout
         self._raise_on_error = raise_on_error
+        # Skip validation of JetStream API responses
+        self._trust_responses = trust_responses
+        self._publish_async_max_pending = publish_async_max_pending
+        # Created on first use so that it is bound to the running loop
+        self._publish_async_sem: Optional[asyncio.Semaphore] = None
+        self._publish_async_acks: Set[asyncio.Future[PubAck]] = set()
+        self._pull_subscriptions: Dict[Tuple[str, str], PullSubscription] = {}
+        # Created on first use so that it is bound to the running loop
+        self._pull_subscriptions_lock: Optional[asyncio.Lock] = None
+        # Acknowledgements are sent one by one when batching is disabled
+        self._acks = AckBatcher(self, DEFAULT_ACK_BATCH_SIZE if batch_acks else 1)
+
+    @property
+    def acks(self) -> AckBatcher:
+        """Acknowledgements sent by messages are batched using this object."""
+        return self._acks
+
+    async def drain(self) -> None:
+        # Do not lose acknowledgements which were not sent yet
+        if self.is_connected:
+            await self._acks.flush()
+        await super().drain()
+
+    async def _flush_buffered_publishes(self) -> None:
+        # Acknowledgements sent by messages processed while draining subscriptions
+        try:
+            await self._acks.flush()
+        except Exception as err:
+            await self._error_cb(err)  # type: ignore[misc]
+
+    async def close(self) -> None:
+        # Do not lose acknowledgements which were not sent yet
+        if self.is_connected:
+            await self._acks.flush()
+        # Subscriptions are closed along with the connection
+        for pull_sub in list(self._pull_subscriptions.values()):
+            pull_sub._forget()
+        await super().close()
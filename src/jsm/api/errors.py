@@ -18,3 +18,23 @@ class JetStreamError(NatsError):
 
     def __str__(self) -> str:
         return f"{self.type}: {self.description} (status_code={self.code})"
+
+
+class ErrConsumerHeartbeatsMissed(NatsError):
+    def __init__(self, stream: str, consumer: str) -> None:
+        super().__init__(stream, consumer)
+        self.stream = stream
+        self.consumer = consumer
+
+    def __str__(self) -> str:
+        return f"nats: Missed heartbeats from consumer {self.consumer} of stream {self.stream}"
+
+
+class ErrKeyConflict(JetStreamError):
+    def __init__(self, bucket: str, key: str, description: str, code: int) -> None:
+        super().__init__(description, code, "io.nats.jetstream.api.v1.pub_ack")
+        self.bucket = bucket
+        self.key = key
+
+    def __str__(self) -> str:
+        return f"nats: Key {self.key} of bucket {self.bucket} was modified ({self.description})"
@@ -0,0 +1,200 @@
+# Copyright 2021 - Guillaume Charbonnier
+# Licensed under the Apache License, Version 2.0 (the "License");
+# http://www.apache.org/licenses/LICENSE-2.0
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Mapping, Optional, Tuple, Union
+
+from _nats.aio.client import Msg, Subscription
+from jsm.models.messages import JsMsg, Message
+from jsm.models.streams import PubAck
+
+if TYPE_CHECKING:
+    from .client import Client
+
+# Header indicating that a message removes a key from a bucket
+KV_OPERATION_HDR = "KV-Operation"
+KV_DEL = "DEL"
+KV_PURGE = "PURGE"
+# Error code returned when a key does not exist
+KV_NOT_FOUND_CODE = 404
+# Maximum number of keys kept in the cache of a bucket
+DEFAULT_KV_CACHE_SIZE = 1024
+
+# A cached value and the time at which it expires
+_CacheEntry = Tuple[Optional[Message], Optional[float]]
+
+
+def is_deleted(msg: Union[Message, JsMsg]) -> bool:
+    """Return True when a message is a delete or purge marker of a key."""
+    return bool(msg.hdrs) and msg.hdrs.get(KV_OPERATION_HDR) in (KV_DEL, KV_PURGE)
+
+
+class KeyValue:
+    """A KV store bucket with a local cache of the last value of keys.
+
+    Values read from the server are kept in a size bounded LRU cache. A subscription on the
+    subjects of the bucket removes keys from the cache as soon as they are modified, whoever
+    modifies them, and the cache is cleared when the client reconnects.
+
+    Notes:
+        * This is not meant to be constructed directly, use `Client.kv_bucket` instead.
+    """
+
+    def __init__(
+        self,
+        js: Client,
+        bucket: str,
+        cache_size: int = DEFAULT_KV_CACHE_SIZE,
+        ttl: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.bucket = bucket
+        self.stream = f"KV_{bucket}"
+        self.hits = 0
+        self.misses = 0
+        self._js = js
+        self._prefix = f"$KV.{bucket}."
+        self._cache_size = cache_size
+        self._ttl = ttl
+        self._timeout = timeout
+        self._cache: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future[Optional[Message]]] = {}
+        # Incremented whenever a key is modified, so that values read before are not cached
+        self._generation = 0
+        self._reconnects = 0
+        self._watcher: Optional[Subscription] = None
+
+    async def start(self) -> None:
+        if self._ttl is None:
+            info = await self._js.stream_info(
+                self.stream, timeout=self._timeout, raise_on_error=True
+            )
+            max_age = info.config.max_age
+            self._ttl = max_age / 1e9 if max_age else 0
+        self._reconnects = self._js.stats["reconnects"]
+        self._watcher = await self._js.subscribe(
+            f"{self._prefix}>", cb=self._invalidate
+        )
+
+    async def get(self, key: str) -> Optional[Message]:
+        """Get the last value of a key, or None when the key does not exist or was deleted."""
+        self._check_connection()
+        entry = self._cache.get(key)
+        if entry is not None:
+            msg, expires = entry
+            if expires is None or expires > time.time():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return msg
+            del self._cache[key]
+        self.misses += 1
+        # Concurrent reads of the same key share a single request
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        future: asyncio.Future[
+            Optional[Message]
+        ] = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            msg = await self._fetch(key)
+        except BaseException as err:
+            future.set_exception(err)
+            # Waiters retrieve the exception, the future itself is not awaited
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        if generation == self._generation:
+            self._store(key, msg)
+        future.set_result(msg)
+        return msg
+
+    async def put(
+        self,
+        key: str,
+        value: bytes,
+        headers: Optional[Mapping[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> PubAck:
+        """Put a new value in the bucket under given key."""
+        self._discard(key)
+        return await self._js.kv_put(
+            self.bucket, key, value, headers=headers, timeout=timeout or self._timeout
+        )
+
+    async def update(
+        self,
+        key: str,
+        value: bytes,
+        last_revision: int,
+        timeout: Optional[float] = None,
+    ) -> PubAck:
+        """Put a new value under given key only if the key was not modified since last_revision."""
+        self._discard(key)
+        return await self._js.kv_update(
+            self.bucket, key, value, last_revision, timeout=timeout or self._timeout
+        )
+
+    async def create(
+        self, key: str, value: bytes, timeout: Optional[float] = None
+    ) -> PubAck:
+        """Put a value under given key only if the key does not exist."""
+        self._discard(key)
+        return await self._js.kv_create(
+            self.bucket, key, value, timeout=timeout or self._timeout
+        )
+
+    async def delete(self, key: str, timeout: Optional[float] = None) -> PubAck:
+        """Delete a key from the bucket. Previous values are kept in the history."""
+        self._discard(key)
+        return await self._js.kv_delete(
+            self.bucket, key, timeout=timeout or self._timeout
+        )
+
+    def clear(self) -> None:
+        """Remove all keys from the cache."""
+        self._cache.clear()
+        self._generation += 1
+
+    async def close(self) -> None:
+        """Stop watching the bucket and clear the cache."""
+        if self._watcher is not None and not self._js.is_closed:
+            await self._watcher.unsubscribe()
+        self._watcher = None
+        self.clear()
+
+    async def _fetch(self, key: str) -> Optional[Message]:
+        msg = await self._js._kv_last(self.bucket, key, timeout=self._timeout)
+        if msg is None or is_deleted(msg):
+            return None
+        return msg
+
+    def _store(self, key: str, msg: Optional[Message]) -> None:
+        expires = None
+        if msg is not None and self._ttl:
+            # Values are removed from the bucket once max age is reached
+            expires = msg.time.timestamp() + self._ttl
+        self._cache[key] = (msg, expires)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _discard(self, key: str) -> None:
+        self._cache.pop(key, None)
+        self._generation += 1
+
+    def _check_connection(self) -> None:
+        # Modifications published while disconnected were not received by the watcher
+        reconnects = self._js.stats["reconnects"]
+        if reconnects != self._reconnects:
+            self._reconnects = reconnects
+            self.clear()
+
+    async def _invalidate(self, msg: Msg) -> None:
+        self._discard(msg.subject[len(self._prefix) :])
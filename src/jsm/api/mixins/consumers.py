@@ -3,8 +3,18 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime
-from typing import AsyncGenerator, List, Optional, Union
+from typing import (
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from _nats.aio.client import Subscription
 from jsm.models.consumers import (
@@ -14,7 +24,6 @@ from jsm.models.consumers import (
     IoNatsJetstreamApiV1ConsumerCreateRequest,
     IoNatsJetstreamApiV1ConsumerCreateResponse,
     IoNatsJetstreamApiV1ConsumerDeleteResponse,
-    IoNatsJetstreamApiV1ConsumerGetNextRequest,
     IoNatsJetstreamApiV1ConsumerInfoResponse,
     IoNatsJetstreamApiV1ConsumerListRequest,
     IoNatsJetstreamApiV1ConsumerListResponse,
@@ -23,12 +32,24 @@ from jsm.models.consumers import (
     ReplayPolicy,
 )
 from jsm.models.errors import IoNatsJetstreamApiV1ErrorResponse
-from jsm.models.messages import Message
+from jsm.models.messages import JsMsg
 
+from ..errors import JetStreamError
+from ..kv import is_deleted
+from ..subscriptions import OrderedSubscription, PullSubscription, PushSubscription
 from .request_reply import BaseJetStreamRequestReplyMixin, JetStreamResponse
 
 
 class ConsumersMixin(BaseJetStreamRequestReplyMixin):
+    """This mixin implements methods used to manipulate Jetstream Consumers.
+
+    Messages received from consumers are returned as `JsMsg`. Previous versions returned
+    `Message` models, use `JsMsg.to_message()` where a `Message` is still needed.
+    """
+
+    _pull_subscriptions: Dict[Tuple[str, str], PullSubscription]
+    _pull_subscriptions_lock: Optional[asyncio.Lock]
+
     async def consumer_info(
         self,
         stream: str,
@@ -101,6 +122,9 @@ class ConsumersMixin(BaseJetStreamRequestReplyMixin):
         idle_heartbeat: Optional[int] = None,
         flow_control: Optional[bool] = None,
         max_waiting: Optional[int] = None,
+        opt_start_seq: Optional[int] = None,
+        opt_start_time: Optional[datetime] = None,
+        headers_only: Optional[bool] = None,
         timeout: Optional[float] = None,
         raise_on_error: Optional[bool] = None,
     ) -> Union[
@@ -121,6 +145,9 @@ class ConsumersMixin(BaseJetStreamRequestReplyMixin):
             idle_heartbeat=idle_heartbeat,
             flow_control=flow_control,
             max_waiting=max_waiting,
+            opt_start_seq=opt_start_seq,
+            opt_start_time=opt_start_time,
+            headers_only=headers_only,
         )
         options = IoNatsJetstreamApiV1ConsumerCreateRequest(
             stream_name=stream, config=config
@@ -153,6 +180,9 @@ class ConsumersMixin(BaseJetStreamRequestReplyMixin):
         idle_heartbeat: Optional[int] = None,
         flow_control: Optional[bool] = None,
         max_waiting: Optional[int] = None,
+        opt_start_seq: Optional[int] = None,
+        opt_start_time: Optional[datetime] = None,
+        headers_only: Optional[bool] = None,
         timeout: Optional[float] = None,
         raise_on_error: Optional[bool] = None,
     ) -> Union[
@@ -175,6 +205,9 @@ class ConsumersMixin(BaseJetStreamRequestReplyMixin):
             idle_heartbeat=idle_heartbeat,
             flow_control=flow_control,
             max_waiting=max_waiting,
+            opt_start_seq=opt_start_seq,
+            opt_start_time=opt_start_time,
+            headers_only=headers_only,
         )
         options = IoNatsJetstreamApiV1ConsumerCreateRequest(
             stream_name=stream, config=config
@@ -187,6 +220,33 @@ class ConsumersMixin(BaseJetStreamRequestReplyMixin):
             timeout=timeout,
         )
 
+    async def consumer_pull_subscription(
+        self,
+        stream: str,
+        name: str,
+        /,
+    ) -> PullSubscription:
+        """Return the pull subscription used to receive messages from a pull consumer.
+
+        A single subscription is kept open per consumer and reused by successive calls
+        until it is closed or drained.
+        """
+        key = (stream, name)
+        pull_sub = self._pull_subscriptions.get(key)
+        if pull_sub is not None:
+            return pull_sub
+        if self._pull_subscriptions_lock is None:
+            self._pull_subscriptions_lock = asyncio.Lock()
+        # Concurrent first calls must not each open an inbox subscription
+        async with self._pull_subscriptions_lock:
+            pull_sub = self._pull_subscriptions.get(key)
+            if pull_sub is None:
+                inbox_prefix = f"_INBOX.{self._nuid.next().decode()}."  # type: ignore[attr-defined]
+                subscription: Subscription = await self.subscribe(f"{inbox_prefix}*")  # type: ignore[attr-defined]
+                pull_sub = PullSubscription(self, stream, name, subscription, inbox_prefix)  # type: ignore[arg-type]
+                self._pull_subscriptions[key] = pull_sub
+        return pull_sub
+
     async def consumer_pull_next(
         self,
         stream: str,
@@ -195,15 +255,13 @@ class ConsumersMixin(BaseJetStreamRequestReplyMixin):
         no_wait: bool = False,
         timeout: Optional[float] = None,
         auto_ack: bool = True,
-    ) -> Union[Message, None]:
-        """Wait and return next message by default. If no_wait is True and no message is available, None is returned."""
-        # Wait for consumer next message
-        async for msg in self.consumer_pull_msgs(
-            stream, name, timeout=timeout, auto_ack=auto_ack, no_wait=no_wait
-        ):
-            # Return on first message
-            return msg
-        return None
+    ) -> Union[JsMsg, None]:
+        """Wait and return next message by default. If no_wait is True and no message is available, None is returned.
+
+        The message is returned as a `JsMsg`, use `JsMsg.to_message()` to get a `Message`.
+        """
+        pull_sub = await self.consumer_pull_subscription(stream, name)
+        return await pull_sub.next(no_wait=no_wait, timeout=timeout, auto_ack=auto_ack)
 
     async def consumer_pull_msgs(
         self,
@@ -214,52 +272,173 @@ class ConsumersMixin(BaseJetStreamRequestReplyMixin):
         timeout: Optional[float] = None,
         auto_ack: bool = True,
         max_msgs: Optional[int] = None,
-    ) -> AsyncGenerator[Union[Message, None], None]:
-        # inbox: str = self._nc._nuid.next().decode("utf-8")
-        inbox: str = self._nuid.next().decode("utf-8")  # type: ignore[attr-defined]
-        total: int = 0
-        subscription: Subscription = await self.subscribe(inbox)  # type: ignore[attr-defined]
-        # Stop subscription on error
-        try:
-            while True:
-                # Stop subscription if maximum number of message has been received
-                if max_msgs and (max_msgs <= total):
-                    break
-                # Generate payload
-                payload = (
-                    IoNatsJetstreamApiV1ConsumerGetNextRequest(
-                        batch=1,
-                        expires=timeout * 1e9 if timeout else None,
-                        no_wait=no_wait if no_wait else None,
-                    )
-                    .json(exclude_none=True)
-                    .encode()
-                )
-                # Request next message to be published on inbox subject
-                # await self._nc.publish_request(
-                await self.publish(  # type: ignore[attr-defined]
-                    f"$JS.API.CONSUMER.MSG.NEXT.{stream}.{name}",
-                    payload=payload,
-                    reply=inbox,
-                )
-                # Wait for next message on inbox subscription
-                msg = await subscription.next_msg(timeout=timeout)
-                try:
-                    message = Message.from_msg(msg)
-                except ValueError:
-                    if msg.headers.get("Status") == "404":
-                        if no_wait:
-                            yield None
-                # Increment message counter
-                total += 1
-                # Optionally acknowledge the message
-                if auto_ack:
-                    await message.ack()
-                # Yield the message
-                yield message
-        # Always stop the subscription on exit
-        finally:
-            await subscription.unsubscribe()
+        batch: int = 1,
+    ) -> AsyncGenerator[Union[JsMsg, None], None]:
+        """Iterate over messages of a pull consumer.
+
+        Messages are requested `batch` at a time, and the next batch is requested
+        once half of the current one has been received, so that messages keep flowing
+        while the caller is processing the current batch.
+        When no_wait is True, iteration stops once no message is available.
+        """
+        pull_sub = await self.consumer_pull_subscription(stream, name)
+        async for message in pull_sub.messages(
+            batch=batch,
+            no_wait=no_wait,
+            timeout=timeout,
+            auto_ack=auto_ack,
+            max_msgs=max_msgs,
+        ):
+            yield message
+
+    async def consumer_fetch(
+        self,
+        stream: str,
+        name: str,
+        /,
+        batch: int = 1,
+        expires: Optional[float] = None,
+        no_wait: bool = False,
+        timeout: Optional[float] = None,
+        auto_ack: bool = True,
+    ) -> List[JsMsg]:
+        """Fetch up to `batch` messages from a pull consumer using a single pull request.
+
+        Args:
+            stream: Name of the stream.
+            name: Name of the consumer.
+            batch: Maximum number of messages to fetch.
+            expires: How long in seconds the server keeps the pull request open. Defaults to the timeout.
+            no_wait: Return as soon as no message is available.
+            timeout: timeout to wait for messages before returning the messages received so far.
+            auto_ack: Acknowledge messages before returning them.
+
+        Returns:
+            The messages received as `JsMsg`, which can be fewer than `batch` or none at all.
+        """
+        pull_sub = await self.consumer_pull_subscription(stream, name)
+        return await pull_sub.fetch(
+            batch=batch,
+            expires=expires,
+            no_wait=no_wait,
+            timeout=timeout,
+            auto_ack=auto_ack,
+        )
+
+    async def push_subscribe(
+        self,
+        stream: str,
+        name: str,
+        /,
+        cb: Callable[[JsMsg], Awaitable[None]],
+        deliver_subject: Optional[str] = None,
+        deliver_group: Optional[str] = None,
+        deliver_policy: DeliverPolicy = "all",
+        ack_policy: AckPolicy = "explicit",
+        filter_subject: Optional[str] = None,
+        max_ack_pending: Optional[int] = None,
+        idle_heartbeat: Optional[float] = 5.0,
+        flow_control: bool = True,
+        auto_ack: bool = True,
+        timeout: Optional[float] = None,
+    ) -> PushSubscription:
+        """Subscribe to the messages delivered by a push consumer.
+
+        The durable consumer is created when it does not exist yet, otherwise the subscription
+        is bound to its delivery subject and the consumer options are ignored.
+
+        Args:
+            stream: Name of the stream.
+            name: Name of the durable consumer.
+            cb: Coroutine function called with each message.
+            deliver_subject: Subject messages are delivered to. Defaults to a new inbox.
+            deliver_group: Queue group used to share messages between subscriptions.
+            deliver_policy: Where to start reading the stream, from the first message by default.
+            idle_heartbeat: Interval in seconds of the heartbeats sent by an idle consumer.
+            flow_control: Let the server regulate the delivery of messages.
+            auto_ack: Acknowledge messages once the callback returns.
+            timeout: timeout to wait before raising a TimeoutError.
+        """
+        info = await self.consumer_info(
+            stream, name, timeout=timeout, raise_on_error=False
+        )
+        if isinstance(info, IoNatsJetstreamApiV1ErrorResponse):
+            if info.error.code != 404:
+                info.raise_on_error()
+            info = await self.consumer_durable_create(
+                stream,
+                name,
+                deliver_subject=deliver_subject
+                or f"_INBOX.{self._nuid.next().decode()}",  # type: ignore[attr-defined]
+                deliver_group=deliver_group,
+                deliver_policy=deliver_policy,
+                ack_policy=ack_policy,
+                filter_subject=filter_subject,
+                max_ack_pending=max_ack_pending,
+                idle_heartbeat=int(idle_heartbeat * 1e9) if idle_heartbeat else None,
+                flow_control=flow_control or None,
+                timeout=timeout,
+                raise_on_error=True,
+            )
+        config = info.config
+        if not config.deliver_subject:
+            raise JetStreamError(
+                f"consumer {name} is not a push consumer", 400, info.type
+            )
+        push_sub = PushSubscription(
+            self,  # type: ignore[arg-type]
+            stream,
+            name,
+            config.deliver_subject,
+            cb,
+            auto_ack=auto_ack and config.ack_policy != AckPolicy.none,
+            idle_heartbeat=config.idle_heartbeat / 1e9
+            if config.idle_heartbeat
+            else None,
+        )
+        await push_sub.start(queue=config.deliver_group or "")
+        return push_sub
+
+    async def ordered_subscribe(
+        self,
+        stream: str,
+        /,
+        filter_subject: Optional[str] = None,
+        deliver_policy: DeliverPolicy = DeliverPolicy.all,
+        opt_start_seq: Optional[int] = None,
+        opt_start_time: Optional[datetime] = None,
+        headers_only: bool = False,
+        idle_heartbeat: float = 5.0,
+        timeout: Optional[float] = None,
+    ) -> OrderedSubscription:
+        """Read the messages of a stream in order using an ephemeral consumer.
+
+        Messages do not need to be acknowledged. When a message is missed or heartbeats stop,
+        the consumer is recreated to resume after the last message received.
+
+        Args:
+            stream: Name of the stream.
+            filter_subject: Only read messages published on this subject.
+            deliver_policy: Where to start reading the stream.
+            opt_start_seq: Stream sequence to start from when using DeliverPolicy.by_start_sequence.
+            opt_start_time: Time to start from when using DeliverPolicy.by_start_time.
+            headers_only: Receive only the headers of messages, without their payload.
+            idle_heartbeat: Interval in seconds of the heartbeats sent by an idle consumer.
+            timeout: timeout to wait before raising a TimeoutError when creating the consumer.
+        """
+        ordered_sub = OrderedSubscription(
+            self,  # type: ignore[arg-type]
+            stream,
+            filter_subject=filter_subject,
+            deliver_policy=deliver_policy,
+            opt_start_seq=opt_start_seq,
+            opt_start_time=opt_start_time,
+            headers_only=headers_only,
+            idle_heartbeat=idle_heartbeat,
+            timeout=timeout,
+        )
+        await ordered_sub.start()
+        return ordered_sub
 
     async def consumer_delete(
         self,
@@ -268,6 +447,10 @@ class ConsumersMixin(BaseJetStreamRequestReplyMixin):
         timeout: Optional[float] = None,
         raise_on_error: Optional[bool] = None,
     ) -> IoNatsJetstreamApiV1ConsumerDeleteResponse:
+        # Pull subscription of the consumer is not needed anymore
+        pull_sub = self._pull_subscriptions.get((stream, name))
+        if pull_sub is not None:
+            await pull_sub.close()
         return await self._jetstream_request(
             f"CONSUMER.DELETE.{stream}.{name}",
             None,
@@ -281,31 +464,99 @@ class ConsumersMixin(BaseJetStreamRequestReplyMixin):
         name: str,
         key: str,
         timeout: Optional[float] = None,
-    ) -> List[Message]:
-        """This is not efficient, I think it should NOT use a durable consumer, but I don't know how to use non durable consumers."""
-        # Create a consumer without durable name
-        _now = int(datetime.utcnow().timestamp() * 1000)
-        _stream = f"KV_{name}"
-        _subject = f"$KV.{name}.{key}"
-        _consumer = f"{_stream}_HISTORY_{_now}"
-        consumer: IoNatsJetstreamApiV1ConsumerCreateResponse = (
-            await self.consumer_durable_create(
-                _stream,
-                _consumer,
-                deliver_group=_consumer,
-                deliver_subject=None,
-                deliver_policy=DeliverPolicy.all,
-                replay_policy=ReplayPolicy.instant,
-                filter_subject=_subject,
-                raise_on_error=True,
-                timeout=timeout,
-            )
+    ) -> List[JsMsg]:
+        """Return all the versions of a key still stored in a bucket, oldest first."""
+        ordered_sub = await self.ordered_subscribe(
+            f"KV_{name}", filter_subject=f"$KV.{name}.{key}", timeout=timeout
         )
-        history_size = consumer.num_pending
-        versions = []
-        async for msg in self.consumer_pull_msgs(
-            _stream, _consumer, max_msgs=history_size, auto_ack=True
-        ):
-            versions.append(msg)
-        await self.consumer_delete(_stream, _consumer)
-        return versions
+        try:
+            return [msg async for msg in ordered_sub.messages(catch_up=True)]
+        finally:
+            await ordered_sub.unsubscribe()
+
+    async def kv_watch(
+        self,
+        name: str,
+        /,
+        pattern: str = ">",
+        headers_only: bool = False,
+        idle_heartbeat: float = 5.0,
+        timeout: Optional[float] = None,
+    ) -> AsyncGenerator[Optional[JsMsg], None]:
+        """Watch the keys of a bucket.
+
+        The last value of each key matching the pattern is yielded first, followed by None once
+        they were all delivered. Modifications of the keys are then yielded as they happen,
+        delete markers included.
+
+        Args:
+            name: Name of the bucket.
+            pattern: Keys to watch, wildcards are allowed.
+            headers_only: Receive only the headers of messages, without their value.
+            idle_heartbeat: Interval in seconds of the heartbeats sent by an idle consumer.
+            timeout: timeout to wait before raising a TimeoutError when creating the consumer.
+        """
+        ordered_sub = await self.ordered_subscribe(
+            f"KV_{name}",
+            filter_subject=f"$KV.{name}.{pattern}",
+            deliver_policy=DeliverPolicy.last_per_subject,
+            headers_only=headers_only,
+            idle_heartbeat=idle_heartbeat,
+            timeout=timeout,
+        )
+        try:
+            async for msg in ordered_sub.messages(catch_up=True):
+                yield msg
+            yield None
+            async for msg in ordered_sub.messages():
+                yield msg
+        finally:
+            await ordered_sub.unsubscribe()
+
+    async def kv_snapshot(
+        self,
+        name: str,
+        /,
+        pattern: str = ">",
+        timeout: Optional[float] = None,
+    ) -> Dict[str, JsMsg]:
+        """Return the last value of each key of a bucket matching the pattern. Deleted keys are omitted."""
+        return await self._kv_last_values(name, pattern, False, timeout)
+
+    async def kv_keys(
+        self,
+        name: str,
+        /,
+        pattern: str = ">",
+        timeout: Optional[float] = None,
+    ) -> List[str]:
+        """Return the keys of a bucket matching the pattern. Values are not transferred."""
+        return list(await self._kv_last_values(name, pattern, True, timeout))
+
+    async def _kv_last_values(
+        self,
+        name: str,
+        pattern: str,
+        headers_only: bool,
+        timeout: Optional[float],
+    ) -> Dict[str, JsMsg]:
+        prefix = f"$KV.{name}."
+        values: Dict[str, JsMsg] = {}
+        ordered_sub = await self.ordered_subscribe(
+            f"KV_{name}",
+            filter_subject=f"{prefix}{pattern}",
+            deliver_policy=DeliverPolicy.last_per_subject,
+            headers_only=headers_only,
+            timeout=timeout,
+        )
+        try:
+            async for msg in ordered_sub.messages(catch_up=True):
+                key = msg.subject[len(prefix) :]
+                # Keys may be delivered again when the consumer is recreated
+                if is_deleted(msg):
+                    values.pop(key, None)
+                else:
+                    values[key] = msg
+        finally:
+            await ordered_sub.unsubscribe()
+        return values
@@ -3,12 +3,28 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 from __future__ import annotations
 
-from typing import Any, Generic, Optional, Type, TypeVar, Union
+from enum import Enum
+from functools import lru_cache
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+    get_args,
+)
 
 from pydantic import BaseModel
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON, ModelField
 from pydantic.generics import GenericModel
 
 from _nats.aio.client import Msg
+from _nats.protocol.codec import JSONCodec, get_codec
 from jsm.models.base import BaseResponse
 from jsm.models.errors import IoNatsJetstreamApiV1ErrorResponse
 
@@ -24,6 +40,115 @@ class JetStreamResponse(GenericModel, Generic[ResponseItemT]):
 
 
 ResponseT = TypeVar("ResponseT", bound=JetStreamResponse[BaseModel])
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# How to construct each field of a model: name, alias, nested model, whether the field is a list,
+# and the default value, None when the default value must be copied for each instance
+_FieldSpec = Tuple[str, str, Optional[Type[BaseModel]], bool, Any, Optional[ModelField]]
+_FieldPlan = Tuple[_FieldSpec, ...]
+_IMMUTABLE_DEFAULTS = (type(None), bool, int, float, str, bytes, Enum)
+
+
+@lru_cache(maxsize=None)
+def _success_model(response: Type[JetStreamResponse[Any]]) -> Type[BaseResponse]:
+    """Return the model of successful responses of a parametrized JetStreamResponse."""
+    for model in get_args(response.__fields__["__root__"].outer_type_):
+        if (
+            isinstance(model, type)
+            and issubclass(model, BaseResponse)
+            and model is not IoNatsJetstreamApiV1ErrorResponse
+        ):
+            return model
+    raise TypeError(f"{response} is not a parametrized JetStreamResponse")
+
+
+@lru_cache(maxsize=None)
+def _field_plan(model: Type[BaseModel]) -> _FieldPlan:
+    plan: List[_FieldSpec] = []
+    for name, field in model.__fields__.items():
+        nested: Optional[Type[BaseModel]] = None
+        if (
+            isinstance(field.type_, type)
+            and issubclass(field.type_, BaseModel)
+            and field.shape in (SHAPE_SINGLETON, SHAPE_LIST)
+        ):
+            nested = field.type_
+        copy_default = None
+        if field.default_factory is not None or not isinstance(
+            field.default, _IMMUTABLE_DEFAULTS
+        ):
+            copy_default = field
+        plan.append(
+            (
+                name,
+                field.alias,
+                nested,
+                field.shape == SHAPE_LIST,
+                field.default,
+                copy_default,
+            )
+        )
+    return tuple(plan)
+
+
+def construct_model(model: Type[ModelT], obj: Dict[str, Any]) -> ModelT:
+    """Create a model from a decoded JSON document without validating it.
+
+    Nested models are created recursively. Other values are kept as decoded from JSON,
+    for example timestamps are not converted to datetime, and null values are replaced by defaults.
+    """
+    values = {}
+    fields_set = set()
+    for name, alias, nested, is_list, default, copy_default in _field_plan(model):
+        value = obj.get(alias)
+        if value is None:
+            values[name] = (
+                default if copy_default is None else copy_default.get_default()
+            )
+            continue
+        if nested is not None:
+            if is_list:
+                value = [construct_model(nested, item) for item in value]
+            else:
+                value = construct_model(nested, value)
+        values[name] = value
+        fields_set.add(name)
+    # Same as BaseModel.construct, without copying default values
+    instance: ModelT = model.__new__(model)
+    object.__setattr__(instance, "__dict__", values)
+    object.__setattr__(instance, "__fields_set__", fields_set)
+    if model.__private_attributes__:
+        instance._init_private_attributes()
+    return instance
+
+
+def decode_response(
+    data: bytes,
+    response: Type[JetStreamResponse[ResponseT]],
+    trusted: bool = False,
+    codec: Optional[JSONCodec] = None,
+) -> ResponseT:
+    """Decode a JetStream API response.
+
+    The JSON document is parsed once, then an error response or a successful response
+    is created depending on the presence of an error.
+
+    Args:
+        data: Payload of the response.
+        response: Expected JetStreamResponse, for example JetStreamResponse[IoNatsJetstreamApiV1StreamInfoResponse].
+        trusted: Create models without validating the response. See construct_model.
+        codec: JSON codec used to parse the response. Defaults to the fastest installed one.
+    """
+    obj = (codec or get_codec()).loads(data)
+    model: Type[BaseResponse] = (
+        IoNatsJetstreamApiV1ErrorResponse
+        if "error" in obj
+        else _success_model(response)
+    )
+    result = construct_model(model, obj) if trusted else model.parse_obj(obj)
+    # Successful responses of JetStreamResponse[ResponseT] are ResponseT, and error
+    # responses expose the same raise_on_error method.
+    return cast(ResponseT, result)
 
 
 class BaseJetStreamRequestReplyMixin:
@@ -31,6 +156,8 @@ class BaseJetStreamRequestReplyMixin:
     _prefix: str
     _raise_on_error: bool
     _timeout: float
+    _trust_responses: bool
+    _codec: JSONCodec
 
     async def _jetstream_request(
         self,
@@ -39,11 +166,12 @@ class BaseJetStreamRequestReplyMixin:
         response: Type[JetStreamResponse[ResponseT]],
         raise_on_error: Optional[bool] = None,
         timeout: Optional[float] = None,
+        trusted: Optional[bool] = None,
         **kwargs: Any,
     ) -> ResponseT:
         # First encode payload if necessary
         if model:
-            payload = model.json().encode("utf-8")
+            payload = self._codec.dumps(model.dict())
         # Or create empty payload
         else:
             payload = b""
@@ -55,8 +183,12 @@ class BaseJetStreamRequestReplyMixin:
         msg: Msg = await self.request(  # type: ignore[attr-defined]
             f"{self._prefix}.{subject}", payload=payload, timeout=timeout, **kwargs
         )
-        # Parse message from bytes
-        js_response: ResponseT = response.parse_raw(msg.data).__root__
+        # Parse message from bytes, without validation when responses are trusted
+        if trusted is None:
+            trusted = self._trust_responses
+        js_response: ResponseT = decode_response(
+            msg.data, response, trusted, self._codec
+        )
         # Optionally raise on error because keyword argument "raise_on_error" is True
         if raise_on_error:
             js_response.raise_on_error()
@@ -3,9 +3,30 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 from __future__ import annotations
 
+import asyncio
+import os
 from base64 import b64decode
-from typing import Any, Dict, List, Optional, Union
+from collections import deque
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
+from _nats.aio.client import Msg
+from _nats.aio.errors import ErrTimeout
+from _nats.protocol.codec import JSONCodec
+from _nats.protocol.headers import VolatileHeaders, encode_headers, parse_headers
 from jsm.models.errors import IoNatsJetstreamApiV1ErrorResponse
 from jsm.models.messages import Message
 from jsm.models.streams import (
@@ -33,8 +54,35 @@ from jsm.models.streams import (
     Storage,
 )
 
+from ..archive import DEFAULT_BLOCK_SIZE, ArchiveReader, ArchiveWriter, Compression
+from ..errors import ErrKeyConflict, JetStreamError
+from ..kv import (
+    DEFAULT_KV_CACHE_SIZE,
+    KV_DEL,
+    KV_NOT_FOUND_CODE,
+    KV_OPERATION_HDR,
+    KeyValue,
+    is_deleted,
+)
 from .request_reply import BaseJetStreamRequestReplyMixin, JetStreamResponse
 
+# Header used to make sure a published message is stored in the expected stream
+EXPECTED_STREAM_HDR = "Nats-Expected-Stream"
+# Header used by the server to detect duplicated messages
+MSG_ID_HDR = "Nats-Msg-Id"
+# Prefix of the headers making the server check the state of a stream before storing a message
+EXPECTED_HDR_PREFIX = "nats-expected-"
+# Header used to store a message only if the last message of its subject has this sequence
+EXPECTED_LAST_SUBJECT_SEQUENCE_HDR = "Nats-Expected-Last-Subject-Sequence"
+# Error code returned when the last sequence of a subject is not the expected one
+WRONG_LAST_SEQUENCE_CODE = 10071
+# Number of attempts of kv_compare_and_swap before giving up
+DEFAULT_KV_CAS_ATTEMPTS = 10
+# Number of message get requests waiting for a response in stream_msg_get_many
+DEFAULT_MSG_GET_WINDOW = 256
+# Error code returned when getting a message which does not exist or was deleted
+MSG_NOT_FOUND_ERR_CODE = 10037
+
 
 class StreamsMixin(BaseJetStreamRequestReplyMixin):
     """This mixin implements methods used to manipulate Jetstream Streams.
@@ -46,6 +94,10 @@ class StreamsMixin(BaseJetStreamRequestReplyMixin):
         * Jetstream NATS API Reference: <https://docs.nats.io/jetstream/nats_api_reference#streams>
     """
 
+    _publish_async_max_pending: int
+    _publish_async_sem: Optional[asyncio.Semaphore]
+    _publish_async_acks: Set[asyncio.Future[PubAck]]
+
     async def stream_list(
         self,
         offset: int = 0,
@@ -398,11 +450,101 @@ class StreamsMixin(BaseJetStreamRequestReplyMixin):
             JetStreamResponse[IoNatsJetstreamApiV1StreamMsgGetResponse],
             raise_on_error=raise_on_error,
             timeout=timeout,
+            # Message headers are decoded by validators
+            trusted=False,
         )
         if isinstance(res, IoNatsJetstreamApiV1StreamMsgGetResponse):
             res.message.data = b64decode(res.message.data)
         return res
 
+    async def stream_msg_get_many(
+        self,
+        name: str,
+        seqs: Iterable[int],
+        /,
+        window: int = DEFAULT_MSG_GET_WINDOW,
+        timeout: Optional[float] = None,
+    ) -> AsyncGenerator[Message, None]:
+        """Get many messages from a stream by sequence.
+
+        Up to `window` requests are sent without waiting for the previous responses.
+        Messages are yielded in the order of the sequences, and missing or deleted messages are skipped.
+
+        Args:
+            * `name`: Name of the stream.
+            * `seqs`: Stream sequence numbers of the messages to get.
+            * `window`: Number of requests waiting for a response at the same time.
+            * `timeout`: timeout to wait for each response before raising a TimeoutError.
+
+        Raises:
+            JetStreamError: when a message cannot be read for another reason than not being found.
+        """
+        if timeout is None:
+            timeout = self._timeout
+        subject = f"{self._prefix}.STREAM.MSG.GET.{name}"
+        seqs_iter = iter(seqs)
+        pending: Deque[Tuple[str, asyncio.Future[Msg]]] = deque()
+
+        async def _send_requests() -> None:
+            batch = []
+            for seq in seqs_iter:
+                inbox, future = await self._response_inbox()  # type: ignore[attr-defined]
+                batch.append((subject, b'{"seq":%d}' % seq, None, inbox))
+                pending.append((inbox, future))
+                if len(pending) >= window:
+                    break
+            if batch:
+                await self.publish_many(batch)  # type: ignore[attr-defined]
+
+        try:
+            await _send_requests()
+            while pending:
+                inbox, future = pending[0]
+                try:
+                    msg = await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    raise ErrTimeout
+                pending.popleft()
+                # Requests are sent in batches once half of the window is available
+                if len(pending) <= window // 2:
+                    await _send_requests()
+                message = _decode_msg_get_response(msg.data, self._codec)
+                if message is not None:
+                    yield message
+        finally:
+            for inbox, _ in pending:
+                self._discard_response(inbox)  # type: ignore[attr-defined]
+
+    async def stream_msg_get_range(
+        self,
+        name: str,
+        start: int = 1,
+        end: Optional[int] = None,
+        /,
+        window: int = DEFAULT_MSG_GET_WINDOW,
+        timeout: Optional[float] = None,
+    ) -> AsyncGenerator[Message, None]:
+        """Get the messages of a stream between two sequences, both included.
+
+        The range is first restricted to the sequences stored in the stream,
+        so that purged messages are not requested.
+
+        Args:
+            * `name`: Name of the stream.
+            * `start`: First stream sequence to get.
+            * `end`: Last stream sequence to get. Defaults to the last sequence of the stream.
+            * `window`: Number of requests waiting for a response at the same time.
+            * `timeout`: timeout to wait for each response before raising a TimeoutError.
+        """
+        info = await self.stream_info(name, timeout=timeout, raise_on_error=True)
+        state = info.state
+        first: int = max(start, state.first_seq)
+        last: int = state.last_seq if end is None else min(end, state.last_seq)
+        async for message in self.stream_msg_get_many(
+            name, range(first, last + 1), window=window, timeout=timeout
+        ):
+            yield message
+
     async def stream_msg_delete(
         self,
         name: str,
@@ -440,7 +582,7 @@ class StreamsMixin(BaseJetStreamRequestReplyMixin):
         subject: str,
         /,
         payload: bytes,
-        headers: Optional[Dict[str, str]] = None,
+        headers: Optional[Mapping[str, str]] = None,
         timeout: Optional[float] = None,
     ) -> PubAck:
         """Publish a message to an NATS subject and wait for stream acknowledgement.
@@ -448,11 +590,237 @@ class StreamsMixin(BaseJetStreamRequestReplyMixin):
         Args:
             * `subject`: subject to publish message to
             * `payload`: content of the message in bytes
+            * `headers`: optional headers, frozen headers are sent without being encoded again
             * `timeout`: optional timeout in seconds
         """
         res = await self.request(subject, payload, timeout=timeout, headers=headers)  # type: ignore[attr-defined]
         return PubAck.parse_raw(res.data)
 
+    async def stream_publish_many(
+        self,
+        messages: Iterable[Tuple[str, bytes, Optional[Mapping[str, str]]]],
+        /,
+        timeout: Optional[float] = None,
+    ) -> List[PubAck]:
+        """Publish a batch of messages and wait for all stream acknowledgements.
+
+        Messages are sent at once without waiting for the acknowledgement of the previous one.
+
+        Args:
+            * `messages`: an iterable of (subject, payload, headers) tuples
+            * `timeout`: optional timeout in seconds to wait for all acknowledgements
+
+        Returns:
+            The acknowledgements, in the same order as the messages.
+        """
+        if timeout is None:
+            timeout = self._timeout
+        batch = []
+        futures = []
+        for subject, payload, headers in messages:
+            inbox, future = await self._response_inbox()  # type: ignore[attr-defined]
+            batch.append((subject, payload, headers, inbox))
+            futures.append((inbox, future))
+        try:
+            await self.publish_many(batch)  # type: ignore[attr-defined]
+            responses = await asyncio.wait_for(
+                asyncio.gather(*(future for _, future in futures)), timeout
+            )
+        except BaseException as err:
+            for inbox, _ in futures:
+                self._discard_response(inbox)  # type: ignore[attr-defined]
+            if isinstance(err, asyncio.TimeoutError):
+                raise ErrTimeout
+            raise
+        return [PubAck.parse_raw(msg.data) for msg in responses]
+
+    async def stream_publish_async(
+        self,
+        subject: str,
+        /,
+        payload: bytes,
+        headers: Optional[Mapping[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> asyncio.Future[PubAck]:
+        """Publish a message to an NATS subject without waiting for stream acknowledgement.
+
+        A future resolved with the acknowledgement is returned as soon as the message is sent.
+        When too many acknowledgements are still outstanding, this method waits for one of them
+        to be received before publishing.
+
+        Args:
+            * `subject`: subject to publish message to
+            * `payload`: content of the message in bytes
+            * `headers`: optional headers, frozen headers are sent without being encoded again
+            * `timeout`: optional timeout in seconds to wait for the acknowledgement
+        """
+        if timeout is None:
+            timeout = self._timeout
+        if self._publish_async_sem is None:
+            self._publish_async_sem = asyncio.Semaphore(self._publish_async_max_pending)
+        sem = self._publish_async_sem
+        await sem.acquire()
+        try:
+            inbox, response = await self._response_inbox()  # type: ignore[attr-defined]
+            try:
+                await self.publish(subject, payload, reply=inbox, headers=headers)  # type: ignore[attr-defined]
+            except BaseException:
+                self._discard_response(inbox)  # type: ignore[attr-defined]
+                raise
+        except BaseException:
+            sem.release()
+            raise
+
+        loop = asyncio.get_running_loop()
+        ack: asyncio.Future[PubAck] = loop.create_future()
+        self._publish_async_acks.add(ack)
+        # The response is cancelled when it was not received in time.
+        timer = loop.call_later(timeout, self._discard_response, inbox)  # type: ignore[attr-defined]
+
+        def _resolve(response: asyncio.Future[Msg]) -> None:
+            timer.cancel()
+            sem.release()
+            self._publish_async_acks.discard(ack)
+            if ack.done():
+                return
+            if response.cancelled():
+                ack.set_exception(ErrTimeout)
+                return
+            try:
+                ack.set_result(PubAck.parse_raw(response.result().data))
+            except Exception as err:
+                ack.set_exception(err)
+
+        response.add_done_callback(_resolve)
+        return ack
+
+    async def publish_async_complete(self, timeout: Optional[float] = None) -> None:
+        """Wait until all acknowledgements of messages published using stream_publish_async are received.
+
+        Args:
+            * `timeout`: optional timeout in seconds
+        """
+        if not self._publish_async_acks:
+            return
+        try:
+            await asyncio.wait_for(asyncio.wait(self._publish_async_acks), timeout)
+        except asyncio.TimeoutError:
+            raise ErrTimeout
+
+    async def stream_export(
+        self,
+        name: str,
+        path: Union[str, os.PathLike[str]],
+        /,
+        compression: Compression = Compression.none,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        timeout: Optional[float] = None,
+    ) -> int:
+        """Write the messages of a stream to an archive file.
+
+        Messages are read in order using an ephemeral consumer and written one block at a time,
+        so that memory usage does not depend on the size of the stream. Blocks are compressed
+        and written in the default executor of the event loop.
+
+        Args:
+            * `name`: name of the stream
+            * `path`: path of the archive file
+            * `compression`: compression of archive blocks. zstd requires the zstandard package.
+            * `block_size`: size of the blocks written to the archive
+            * `timeout`: optional timeout in seconds to wait for the consumer to be created
+
+        Returns:
+            The number of messages exported.
+        """
+        loop = asyncio.get_running_loop()
+        sub = await self.ordered_subscribe(name, timeout=timeout)  # type: ignore[attr-defined]
+        try:
+            f = await loop.run_in_executor(None, open, path, "wb")
+            try:
+                writer = await loop.run_in_executor(
+                    None, ArchiveWriter, f, compression, block_size
+                )
+                async for msg in sub.messages(catch_up=True):
+                    if writer.add(
+                        msg.seq,
+                        msg.metadata.timestamp,
+                        msg.subject,
+                        encode_headers(msg.hdrs) if msg.hdrs else b"",
+                        msg.data,
+                    ):
+                        await loop.run_in_executor(None, writer.flush)
+                await loop.run_in_executor(None, writer.close)
+            finally:
+                await loop.run_in_executor(None, f.close)
+        finally:
+            await sub.unsubscribe()
+        return writer.count
+
+    async def stream_import(
+        self,
+        path: Union[str, os.PathLike[str]],
+        name: str,
+        /,
+        keep_publish_headers: bool = False,
+        timeout: Optional[float] = None,
+    ) -> int:
+        """Publish the messages of an archive file to a stream.
+
+        Messages are published using stream_publish_async, in the order they were exported.
+        They are stored with new sequences and timestamps. The archive is read one block at
+        a time in the default executor of the event loop.
+
+        Args:
+            * `path`: path of the archive file
+            * `name`: name of the stream messages are published to
+            * `keep_publish_headers`: keep the `Nats-Msg-Id` and `Nats-Expected-*` headers of archived messages. By default they are removed, otherwise messages can be rejected or deduplicated by the stream they are imported to.
+            * `timeout`: optional timeout in seconds to wait for each acknowledgement
+
+        Returns:
+            The number of messages imported.
+        """
+        errors: List[BaseException] = []
+        pending: Set[asyncio.Future[PubAck]] = set()
+
+        def _check(ack: asyncio.Future[PubAck]) -> None:
+            pending.discard(ack)
+            if ack.cancelled():
+                return
+            try:
+                ack.result().raise_on_error()
+            except Exception as err:
+                errors.append(err)
+
+        loop = asyncio.get_running_loop()
+        count = 0
+        f = await loop.run_in_executor(None, open, path, "rb")
+        try:
+            reader = await loop.run_in_executor(None, ArchiveReader, f)
+            while not errors:
+                records = await loop.run_in_executor(None, reader.read_block)
+                if records is None:
+                    break
+                for record in records:
+                    headers = _import_headers(
+                        record.headers, name, keep_publish_headers
+                    )
+                    ack = await self.stream_publish_async(
+                        record.subject, record.data, headers=headers, timeout=timeout
+                    )
+                    pending.add(ack)
+                    ack.add_done_callback(_check)
+                    count += 1
+                    if errors:
+                        break
+        finally:
+            await loop.run_in_executor(None, f.close)
+        # Only wait for the acknowledgements of this import
+        if pending:
+            await asyncio.wait(pending)
+        if errors:
+            raise errors[0]
+        return count
+
     async def kv_add(
         self,
         name: str,
@@ -544,7 +912,7 @@ class StreamsMixin(BaseJetStreamRequestReplyMixin):
         key: str,
         value: bytes,
         timeout: Optional[float] = None,
-        headers: Optional[Dict[str, str]] = None,
+        headers: Optional[Mapping[str, str]] = None,
     ) -> PubAck:
         """Put a new value in a KV Store (bucket) under given key.
 
@@ -554,3 +922,190 @@ class StreamsMixin(BaseJetStreamRequestReplyMixin):
         return await self.stream_publish(
             f"$KV.{name}.{key}", payload=value, timeout=timeout, headers=headers
         )
+
+    async def kv_update(
+        self,
+        name: str,
+        key: str,
+        value: bytes,
+        last_revision: int,
+        timeout: Optional[float] = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> PubAck:
+        """Put a new value in a KV Store (bucket) only if the key was not modified since a revision.
+
+        Args:
+            name: Name of the bucket.
+            key: Key to update.
+            value: New value of the key.
+            last_revision: Stream sequence of the last value of the key, 0 when the key must not exist.
+            timeout: timeout to wait before raising a TimeoutError.
+            headers: optional headers.
+
+        Raises:
+            ErrKeyConflict: when the last revision of the key is not last_revision.
+        """
+        # The expected sequence changes on every update, keep it out of the header cache
+        expected_headers = VolatileHeaders(headers or {})
+        expected_headers[EXPECTED_LAST_SUBJECT_SEQUENCE_HDR] = str(last_revision)
+        ack = await self.kv_put(
+            name, key, value, timeout=timeout, headers=expected_headers
+        )
+        if ack.error is not None and ack.error.err_code == WRONG_LAST_SEQUENCE_CODE:
+            raise ErrKeyConflict(name, key, ack.error.description, ack.error.code)
+        ack.raise_on_error()
+        return ack
+
+    async def kv_create(
+        self,
+        name: str,
+        key: str,
+        value: bytes,
+        timeout: Optional[float] = None,
+    ) -> PubAck:
+        """Put a value in a KV Store (bucket) only if the key does not exist or was deleted.
+
+        Raises:
+            ErrKeyConflict: when the key already exists.
+        """
+        try:
+            return await self.kv_update(name, key, value, 0, timeout=timeout)
+        except ErrKeyConflict:
+            # A deleted key can be created again
+            last = await self._kv_last(name, key, timeout)
+            if last is None or not is_deleted(last):
+                raise
+        return await self.kv_update(name, key, value, last.seq, timeout=timeout)
+
+    async def kv_compare_and_swap(
+        self,
+        name: str,
+        key: str,
+        fn: Callable[[Optional[bytes]], Union[bytes, Awaitable[bytes]]],
+        max_attempts: int = DEFAULT_KV_CAS_ATTEMPTS,
+        timeout: Optional[float] = None,
+    ) -> PubAck:
+        """Replace the value of a key with the result of a function of its current value.
+
+        The function is called with the current value, or None when the key does not exist.
+        When the key is modified before the new value is written, the function is called again
+        with the value read once more.
+
+        Args:
+            name: Name of the bucket.
+            key: Key to update.
+            fn: Function or coroutine function returning the new value.
+            max_attempts: Number of attempts before giving up.
+            timeout: timeout to wait before raising a TimeoutError.
+
+        Raises:
+            ErrKeyConflict: when the key was modified during each attempt.
+        """
+        for attempt in range(1, max_attempts + 1):
+            last = await self._kv_last(name, key, timeout)
+            current = None if last is None or is_deleted(last) else last.data
+            result = fn(current)
+            value = await result if isinstance(result, Awaitable) else result
+            try:
+                return await self.kv_update(
+                    name,
+                    key,
+                    value,
+                    0 if last is None else last.seq,
+                    timeout=timeout,
+                )
+            except ErrKeyConflict:
+                if attempt == max_attempts:
+                    raise
+        raise ValueError("max_attempts must be greater than 0")
+
+    async def _kv_last(
+        self, name: str, key: str, timeout: Optional[float] = None
+    ) -> Optional[Message]:
+        """Return the last message of a key, including delete markers, or None when there is none."""
+        res = await self.stream_msg_get(
+            f"KV_{name}",
+            last_by_subj=f"$KV.{name}.{key}",
+            timeout=timeout,
+            raise_on_error=False,
+        )
+        if isinstance(res, IoNatsJetstreamApiV1ErrorResponse):
+            if res.error.code == KV_NOT_FOUND_CODE:
+                return None
+            res.raise_on_error()
+        return res.message
+
+    async def kv_delete(
+        self,
+        name: str,
+        key: str,
+        timeout: Optional[float] = None,
+    ) -> PubAck:
+        """Delete a key from a KV Store (bucket).
+
+        A delete marker is published, so previous values are kept in the history of the key.
+        """
+        return await self.stream_publish(
+            f"$KV.{name}.{key}",
+            payload=b"",
+            timeout=timeout,
+            headers={KV_OPERATION_HDR: KV_DEL},
+        )
+
+    async def kv_bucket(
+        self,
+        name: str,
+        /,
+        cache_size: int = DEFAULT_KV_CACHE_SIZE,
+        ttl: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> KeyValue:
+        """Get a KV Store (bucket) which caches the last value of keys.
+
+        Args:
+            name: Name of the bucket.
+            cache_size: Maximum number of keys kept in cache.
+            ttl: How long in seconds values are cached after being written. Defaults to the max age of the bucket.
+            timeout: timeout to wait before raising a TimeoutError.
+        """
+        bucket = KeyValue(
+            self,  # type: ignore[arg-type]
+            name,
+            cache_size=cache_size,
+            ttl=ttl,
+            timeout=timeout,
+        )
+        await bucket.start()
+        return bucket
+
+
+def _import_headers(
+    raw: bytes, stream: str, keep_publish_headers: bool
+) -> Dict[str, str]:
+    """Headers of an archived message published by stream_import."""
+    # Headers of archived messages usually differ, keep them out of the header cache
+    headers = VolatileHeaders(parse_headers(raw))
+    if not keep_publish_headers:
+        headers = VolatileHeaders(
+            (key, value)
+            for key, value in headers.items()
+            if key.lower() != MSG_ID_HDR.lower()
+            and not key.lower().startswith(EXPECTED_HDR_PREFIX)
+        )
+    headers[EXPECTED_STREAM_HDR] = stream
+    return headers
+
+
+def _decode_msg_get_response(data: bytes, codec: JSONCodec) -> Optional[Message]:
+    """Decode a message get response, returning None when the message was not found."""
+    response = codec.loads(data)
+    error = response.get("error")
+    if error is not None:
+        if error.get("err_code") == MSG_NOT_FOUND_ERR_CODE:
+            return None
+        raise JetStreamError(
+            error.get("description", ""), error.get("code", 500), response.get("type")
+        )
+    message = response["message"]
+    message["data"] = b64decode(message.get("data", ""))
+    return Message.parse_obj(message)
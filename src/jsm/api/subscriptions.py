@@ -0,0 +1,653 @@
+# Copyright 2021 - Guillaume Charbonnier
+# Licensed under the Apache License, Version 2.0 (the "License");
+# http://www.apache.org/licenses/LICENSE-2.0
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
+
+from _nats.aio.client import Msg, Subscription
+from _nats.aio.errors import ErrTimeout
+from _nats.protocol.command import pub_cmd_template
+from _nats.protocol.headers import STATUS_HDR
+from jsm.models.consumers import (
+    AckPolicy,
+    DeliverPolicy,
+    IoNatsJetstreamApiV1ConsumerGetNextRequest,
+)
+from jsm.models.messages import JsMsg
+
+from .errors import ErrConsumerHeartbeatsMissed
+
+if TYPE_CHECKING:
+    from .client import Client
+
+_logger = logging.getLogger(__name__)
+
+# Status sent by the server when a pull request ends without being fulfilled:
+# no message available (no_wait), request expired, or request rejected.
+PULL_TERMINATED_STATUS = ("404", "408", "409")
+# How long before the client gives up waiting a pull request is expired by the server.
+PULL_EXPIRES_MARGIN = 0.01
+# Maximum number of encoded pull requests kept by a pull subscription
+PULL_TEMPLATE_CACHE_SIZE = 64
+# Status of flow control requests and idle heartbeats sent to push consumers
+CONTROL_STATUS = "100"
+CONSUMER_STALLED_HDR = "Nats-Consumer-Stalled"
+LAST_CONSUMER_HDR = "Nats-Last-Consumer"
+# Reply subjects of JetStream messages start with this prefix
+ACK_PREFIX = "$JS.ACK."
+# Number of heartbeat intervals without any message before heartbeats are considered missed
+MISSED_HEARTBEATS_THRESHOLD = 2
+
+
+class PullSubscription:
+    """A subscription used to receive messages from a pull consumer.
+
+    A single inbox subscription is kept open and every pull request is sent with its own
+    reply subject under this inbox, so that status messages ending a request can be routed
+    to the caller which sent it, and status messages answering requests which were given up
+    on can be skipped.
+
+    Several calls may receive messages concurrently: messages delivered by the consumer are
+    handed to whichever caller is waiting, and a single caller at a time reads from the
+    inbox while the others wait to be given a message or the end of their request.
+
+    Notes:
+        * This is not meant to be constructed directly, use `Client.consumer_pull_subscription` instead.
+    """
+
+    def __init__(
+        self,
+        js: Client,
+        stream: str,
+        consumer: str,
+        subscription: Subscription,
+        inbox_prefix: str,
+    ) -> None:
+        self.stream = stream
+        self.consumer = consumer
+        self._js = js
+        self._sub = subscription
+        self._inbox_prefix = inbox_prefix
+        self._subject = f"{js._prefix}.CONSUMER.MSG.NEXT.{stream}.{consumer}"
+        self._requests = 0
+        # Encoded pull requests by (batch, expires, no_wait)
+        self._templates: Dict[
+            Tuple[int, Optional[float], bool], Tuple[bytes, bytes, int]
+        ] = {}
+        # Messages read from the inbox and not taken by a caller yet
+        self._msgs: Deque[JsMsg] = deque()
+        # Status which ended the requests still waited for, by reply subject
+        self._active: Dict[str, Optional[str]] = {}
+        # Whether a caller is reading from the inbox, the others wait on the waiter
+        self._reading = False
+        self._waiter: Optional[asyncio.Future[None]] = None
+        self._closed = False
+
+    @property
+    def is_closed(self) -> bool:
+        return self._closed
+
+    async def fetch(
+        self,
+        batch: int = 1,
+        expires: Optional[float] = None,
+        no_wait: bool = False,
+        timeout: Optional[float] = None,
+        auto_ack: bool = True,
+    ) -> List[JsMsg]:
+        """Fetch up to `batch` messages using a single pull request.
+
+        Args:
+            batch: Maximum number of messages to fetch.
+            expires: How long in seconds the server keeps the pull request open. Defaults to the timeout.
+            no_wait: Return as soon as no message is available.
+            timeout: timeout to wait for messages before returning the messages received so far.
+            auto_ack: Acknowledge messages before returning them.
+
+        Returns:
+            The messages received, which can be fewer than `batch` or none at all.
+        """
+        if timeout is None:
+            timeout = self._js._timeout
+        if no_wait:
+            expires = None
+        elif expires is None:
+            expires = _pull_expires(timeout, no_wait)
+        else:
+            timeout = max(timeout, expires + PULL_EXPIRES_MARGIN)
+        messages: List[JsMsg] = []
+        deadline = asyncio.get_running_loop().time() + timeout
+        reply = await self._request(batch, expires, no_wait)
+        try:
+            while len(messages) < batch:
+                try:
+                    msg = await self._next_msg((reply,), deadline)
+                except ErrTimeout:
+                    break
+                if not isinstance(msg, JsMsg):
+                    break
+                if auto_ack:
+                    await msg.ack()
+                messages.append(msg)
+        finally:
+            self._active.pop(reply, None)
+        return messages
+
+    async def next(
+        self,
+        no_wait: bool = False,
+        timeout: Optional[float] = None,
+        auto_ack: bool = True,
+    ) -> Optional[JsMsg]:
+        """Wait and return next message. If no_wait is True and no message is available, None is returned.
+
+        Raises:
+            ErrTimeout: when no message is received before timeout.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = asyncio.get_running_loop().time() + timeout
+        reply = await self._request(1, _pull_expires(timeout, no_wait), no_wait)
+        try:
+            msg = await self._next_msg((reply,), deadline)
+        finally:
+            self._active.pop(reply, None)
+        if not isinstance(msg, JsMsg):
+            if no_wait:
+                return None
+            raise ErrTimeout
+        if auto_ack:
+            await msg.ack()
+        return msg
+
+    async def messages(
+        self,
+        batch: int = 1,
+        no_wait: bool = False,
+        timeout: Optional[float] = None,
+        auto_ack: bool = True,
+        max_msgs: Optional[int] = None,
+    ) -> AsyncGenerator[JsMsg, None]:
+        """Iterate over messages.
+
+        Messages are requested `batch` at a time, and the next batch is requested
+        once half of the current one has been received, so that messages keep flowing
+        while the caller is processing the current batch.
+        When no_wait is True, iteration stops once no message is available.
+        """
+        total = 0
+        expires = _pull_expires(timeout, no_wait)
+        # Messages still owed by each pull request, in the order requests were sent
+        owed: Dict[str, int] = {}
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                # Stop if maximum number of message has been received
+                if max_msgs and (max_msgs <= total):
+                    break
+                # Request next messages
+                outstanding = sum(owed.values())
+                if outstanding <= batch // 2:
+                    size = batch
+                    if max_msgs:
+                        size = min(size, max_msgs - total - outstanding)
+                    if size > 0:
+                        owed[await self._request(size, expires, no_wait)] = size
+                deadline = None if timeout is None else loop.time() + timeout
+                msg = await self._next_msg(tuple(owed), deadline)
+                if not isinstance(msg, JsMsg):
+                    reply, status = msg
+                    del owed[reply]
+                    del self._active[reply]
+                    if status == "404" and no_wait or status == "409":
+                        break
+                    # Pull request is over, the next iteration may send a new one
+                    continue
+                total += 1
+                # The server fulfills pull requests in the order they were sent,
+                # a request is over once all its messages were delivered.
+                if owed:
+                    reply = next(iter(owed))
+                    owed[reply] -= 1
+                    if not owed[reply]:
+                        del owed[reply]
+                        self._active.pop(reply, None)
+                if auto_ack:
+                    await msg.ack()
+                yield msg
+        finally:
+            for reply in owed:
+                self._active.pop(reply, None)
+
+    async def drain(self) -> List[JsMsg]:
+        """Stop receiving messages and return the messages already delivered by the server.
+
+        Returned messages are not acknowledged.
+        """
+        self._forget()
+        for msg in await self._sub.drain_msgs():
+            self._route(msg)
+        messages = list(self._msgs)
+        self._msgs.clear()
+        self._wake()
+        return messages
+
+    async def close(self) -> None:
+        """Stop receiving messages, messages already delivered by the server are discarded."""
+        self._forget()
+        self._msgs.clear()
+        self._wake()
+        if not self._js.is_closed:
+            await self._sub.unsubscribe()
+
+    def _forget(self) -> None:
+        self._closed = True
+        key = (self.stream, self.consumer)
+        if self._js._pull_subscriptions.get(key) is self:
+            del self._js._pull_subscriptions[key]
+
+    async def _request(
+        self, batch: int, expires: Optional[float], no_wait: bool
+    ) -> str:
+        """Send a pull request and return its reply subject.
+
+        The caller must remove the reply subject from the active requests once done with it.
+        """
+        key = (batch, expires, no_wait)
+        template = self._templates.get(key)
+        if template is None:
+            template = self._pull_template(batch, expires, no_wait)
+            if len(self._templates) >= PULL_TEMPLATE_CACHE_SIZE:
+                self._templates.clear()
+            self._templates[key] = template
+        head, tail, payload_size = template
+        self._requests += 1
+        suffix = str(self._requests)
+        reply = f"{self._inbox_prefix}{suffix}"
+        self._active[reply] = None
+        try:
+            await self._js.publish_command((head, suffix.encode(), tail), payload_size)
+        except BaseException:
+            del self._active[reply]
+            raise
+        return reply
+
+    def _pull_template(
+        self, batch: int, expires: Optional[float], no_wait: bool
+    ) -> Tuple[bytes, bytes, int]:
+        """Encode the PUB command of a pull request, except the end of its reply subject."""
+        payload = self._pull_request(batch, expires, no_wait)
+        head, tail = pub_cmd_template(self._subject, self._inbox_prefix, payload)
+        return head, tail, len(payload)
+
+    def _pull_request(
+        self, batch: int, expires: Optional[float], no_wait: bool
+    ) -> bytes:
+        """Encode the payload of a pull request."""
+        return self._js._codec.dumps(
+            IoNatsJetstreamApiV1ConsumerGetNextRequest(
+                batch=batch,
+                expires=int(expires * 1e9) if expires else None,
+                no_wait=no_wait if no_wait else None,
+            ).dict(exclude_none=True)
+        )
+
+    async def _next_msg(
+        self, replies: Sequence[str], deadline: Optional[float]
+    ) -> Union[JsMsg, Tuple[str, str]]:
+        """Wait for the next message, or for the end of one of the pull requests sent with reply subjects.
+
+        Returns:
+            A message, or the reply subject and the status of the request which ended.
+
+        Raises:
+            ErrTimeout: when nothing is received before the deadline.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._msgs:
+                return self._msgs.popleft()
+            for reply in replies:
+                status = self._active.get(reply)
+                if status is not None:
+                    return reply, status
+            if self._closed:
+                raise ErrTimeout
+            timeout = None if deadline is None else deadline - loop.time()
+            if timeout is not None and timeout <= 0:
+                raise ErrTimeout
+            if self._reading:
+                await self._wait(timeout)
+                continue
+            self._reading = True
+            try:
+                msg = await self._sub.next_msg(timeout=timeout)
+            finally:
+                self._reading = False
+                # Let another caller read once this one is done
+                self._wake()
+            self._route(msg)
+
+    def _route(self, msg: Msg) -> None:
+        if not _is_status(msg):
+            self._msgs.append(_js_msg(msg))
+            return
+        # Status of requests which were given up on are skipped
+        if msg.subject not in self._active:
+            return
+        status = (msg.headers or {}).get(STATUS_HDR)
+        if status in PULL_TERMINATED_STATUS:
+            self._active[msg.subject] = status
+
+    async def _wait(self, timeout: Optional[float]) -> None:
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+        # The waiter is shared, a caller giving up must not cancel it
+        done, _ = await asyncio.wait((self._waiter,), timeout=timeout)
+        if not done:
+            raise ErrTimeout
+
+    def _wake(self) -> None:
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
+class PushSubscription:
+    """A subscription receiving the messages delivered by a push consumer.
+
+    Flow control requests are answered as soon as they are received, and a stalled
+    consumer is resumed. When the consumer has an idle heartbeat, missed heartbeats
+    are reported to the error callback of the client.
+
+    Notes:
+        * This is not meant to be constructed directly, use `Client.push_subscribe` instead.
+    """
+
+    def __init__(
+        self,
+        js: Client,
+        stream: str,
+        consumer: str,
+        deliver_subject: str,
+        cb: Callable[[JsMsg], Awaitable[None]],
+        auto_ack: bool = True,
+        idle_heartbeat: Optional[float] = None,
+    ) -> None:
+        self.stream = stream
+        self.consumer = consumer
+        self.deliver_subject = deliver_subject
+        self.missed_heartbeats = 0
+        self._js = js
+        self._cb = cb
+        self._auto_ack = auto_ack
+        self._idle_heartbeat = idle_heartbeat
+        self._last_activity = 0.0
+        self._sub: Optional[Subscription] = None
+        self._heartbeat_task: Optional[asyncio.Task[None]] = None
+
+    async def start(self, queue: str = "") -> None:
+        loop = asyncio.get_running_loop()
+        self._last_activity = loop.time()
+        self._sub = await self._js.subscribe(
+            self.deliver_subject, queue=queue, cb=self._process_msg
+        )
+        if self._idle_heartbeat:
+            self._heartbeat_task = loop.create_task(self._check_heartbeats())
+
+    async def unsubscribe(self) -> None:
+        """Stop receiving messages, pending messages are discarded."""
+        self._stop_heartbeats()
+        if self._sub is not None:
+            await self._sub.unsubscribe()
+
+    async def drain(self) -> None:
+        """Stop receiving messages once pending messages are processed."""
+        self._stop_heartbeats()
+        if self._sub is not None:
+            await self._sub.drain()
+
+    async def _process_msg(self, msg: Msg) -> None:
+        self._last_activity = asyncio.get_running_loop().time()
+        if not msg.reply.startswith(ACK_PREFIX):
+            await self._process_control_msg(msg)
+            return
+        js_msg = _js_msg(msg)
+        await self._cb(js_msg)
+        if self._auto_ack:
+            await js_msg.ack()
+
+    async def _process_control_msg(self, msg: Msg) -> None:
+        headers = msg.headers or {}
+        if headers.get(STATUS_HDR) != CONTROL_STATUS:
+            return
+        # Flow control requests carry the subject to answer to
+        if msg.reply:
+            await self._js.publish(msg.reply, b"")
+        # Heartbeats of a consumer stalled by flow control carry the subject to resume it
+        stalled = headers.get(CONSUMER_STALLED_HDR)
+        if stalled:
+            await self._js.publish(stalled, b"")
+
+    async def _check_heartbeats(self) -> None:
+        interval: float = self._idle_heartbeat  # type: ignore[assignment]
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if self._js.is_closed:
+                break
+            if not self._js.is_connected:
+                continue
+            if (
+                loop.time() - self._last_activity
+                > interval * MISSED_HEARTBEATS_THRESHOLD
+            ):
+                self.missed_heartbeats += 1
+                # A failing error callback must not stop checking heartbeats
+                try:
+                    await self._js._error_cb(  # type: ignore[misc]
+                        ErrConsumerHeartbeatsMissed(self.stream, self.consumer)
+                    )
+                except Exception:
+                    _logger.exception("jsm: error callback failed")
+
+    def _stop_heartbeats(self) -> None:
+        if self._heartbeat_task is not None and not self._heartbeat_task.done():
+            self._heartbeat_task.cancel()
+
+
+class OrderedSubscription:
+    """Messages of a stream delivered in order by an ephemeral push consumer.
+
+    The consumer does not expect acknowledgements and uses flow control and idle heartbeats.
+    Stream and consumer sequences are tracked so that whenever a message is missed, or
+    heartbeats stop, the consumer is recreated to start right after the last message received.
+
+    Notes:
+        * This is not meant to be constructed directly, use `Client.ordered_subscribe` instead.
+    """
+
+    def __init__(
+        self,
+        js: Client,
+        stream: str,
+        filter_subject: Optional[str] = None,
+        deliver_policy: DeliverPolicy = DeliverPolicy.all,
+        opt_start_seq: Optional[int] = None,
+        opt_start_time: Optional[datetime] = None,
+        headers_only: bool = False,
+        idle_heartbeat: float = 5.0,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.stream = stream
+        self.filter_subject = filter_subject
+        # Stream sequence of the last message received
+        self.stream_seq = 0
+        # Number of messages left to deliver after the last message received
+        self.num_pending = 0
+        self._js = js
+        self._deliver_policy = deliver_policy
+        self._opt_start_seq = opt_start_seq
+        self._opt_start_time = opt_start_time
+        self._headers_only = headers_only
+        self._idle_heartbeat = idle_heartbeat
+        self._timeout = timeout
+        self._consumer: Optional[str] = None
+        self._consumer_seq = 0
+        self._sub: Optional[Subscription] = None
+
+    @property
+    def consumer(self) -> Optional[str]:
+        """Name of the ephemeral consumer currently delivering messages."""
+        return self._consumer
+
+    async def start(self) -> None:
+        await self._reset()
+
+    async def next(self, timeout: Optional[float] = None) -> JsMsg:
+        """Wait and return the next message of the stream.
+
+        Raises:
+            ErrTimeout: when no message is received before timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        heartbeats_timeout = self._idle_heartbeat * MISSED_HEARTBEATS_THRESHOLD
+        while True:
+            wait = heartbeats_timeout
+            if deadline is not None:
+                wait = min(wait, deadline - loop.time())
+            try:
+                msg = await self._sub.next_msg(timeout=wait)  # type: ignore[union-attr]
+            except ErrTimeout:
+                if deadline is not None and loop.time() >= deadline:
+                    raise
+                # Heartbeats were missed, the consumer may be gone
+                await self._reset()
+                continue
+            if not msg.reply.startswith(ACK_PREFIX):
+                await self._process_control_msg(msg)
+                continue
+            js_msg = _js_msg(msg)
+            metadata = js_msg.metadata
+            if metadata.consumer != self._consumer:
+                continue
+            if metadata.consumer_seq != self._consumer_seq + 1:
+                await self._reset()
+                continue
+            self._consumer_seq = metadata.consumer_seq
+            self.stream_seq = metadata.stream_seq
+            self.num_pending = metadata.num_pending
+            return js_msg
+
+    async def messages(
+        self, catch_up: bool = False, timeout: Optional[float] = None
+    ) -> AsyncGenerator[JsMsg, None]:
+        """Iterate over messages of the stream.
+
+        Args:
+            catch_up: Stop once the messages stored in the stream were delivered, instead of waiting for new ones.
+            timeout: timeout to wait for each message before raising a TimeoutError.
+        """
+        if catch_up and not self.num_pending:
+            return
+        while True:
+            yield await self.next(timeout)
+            if catch_up and not self.num_pending:
+                return
+
+    async def unsubscribe(self) -> None:
+        """Stop receiving messages and delete the consumer."""
+        await self._stop()
+
+    async def _stop(self) -> None:
+        sub, consumer = self._sub, self._consumer
+        self._sub = self._consumer = None
+        if self._js.is_closed:
+            return
+        if sub is not None:
+            await sub.unsubscribe()
+        if consumer is not None:
+            await self._js.consumer_delete(
+                self.stream, consumer, timeout=self._timeout, raise_on_error=False
+            )
+
+    async def _reset(self) -> None:
+        """(Re)create the consumer starting after the last message received."""
+        await self._stop()
+        deliver_policy = self._deliver_policy
+        opt_start_seq = self._opt_start_seq
+        opt_start_time = self._opt_start_time
+        if self.stream_seq:
+            deliver_policy = DeliverPolicy.by_start_sequence
+            opt_start_seq = self.stream_seq + 1
+            opt_start_time = None
+        inbox = f"_INBOX.{self._js._nuid.next().decode()}"
+        self._sub = await self._js.subscribe(inbox)
+        info = await self._js.consumer_create(
+            self.stream,
+            deliver_subject=inbox,
+            deliver_policy=deliver_policy,
+            ack_policy=AckPolicy.none,
+            filter_subject=self.filter_subject,
+            idle_heartbeat=int(self._idle_heartbeat * 1e9),
+            flow_control=True,
+            opt_start_seq=opt_start_seq,
+            opt_start_time=opt_start_time,
+            headers_only=self._headers_only or None,
+            timeout=self._timeout,
+            raise_on_error=True,
+        )
+        self._consumer = info.name
+        self._consumer_seq = 0
+        self.num_pending = info.num_pending
+
+    async def _process_control_msg(self, msg: Msg) -> None:
+        headers = msg.headers or {}
+        if headers.get(STATUS_HDR) != CONTROL_STATUS:
+            return
+        # Flow control requests are answered once previous messages are consumed
+        if msg.reply:
+            await self._js.publish(msg.reply, b"")
+        stalled = headers.get(CONSUMER_STALLED_HDR)
+        if stalled:
+            await self._js.publish(stalled, b"")
+        # Heartbeats carry the last consumer sequence delivered
+        last = headers.get(LAST_CONSUMER_HDR)
+        if last is not None and int(last) != self._consumer_seq:
+            await self._reset()
+
+
+def _pull_expires(timeout: Optional[float], no_wait: bool) -> Optional[float]:
+    """Expiration of a pull request, so that the server expires it before the client gives up."""
+    if no_wait or timeout is None:
+        return None
+    return max(timeout - PULL_EXPIRES_MARGIN, PULL_EXPIRES_MARGIN)
+
+
+def _js_msg(msg: Msg) -> JsMsg:
+    """Messages are built by the client using its message class."""
+    return cast(JsMsg, msg)
+
+
+def _is_status(msg: Msg) -> bool:
+    """Status messages sent by the server on the inbox of a pull request have no reply subject."""
+    return not msg.reply
@@ -131,13 +131,18 @@ class Config(JetstreamModel):
         description="The number of pulls that can be outstanding on a pull consumer, pulls received after this is reached are ignored",
         ge=0,
     )
-    ops_start_seq: Optional[int] = Field(
+    opt_start_seq: Optional[int] = Field(
         None,
-        description="The sequence to start replay on, ignored if deliver_policy is not start_by_sequence",
+        description="The sequence to start replay on, ignored if deliver_policy is not by_start_sequence",
+        ge=0,
+    )
+    opt_start_time: Optional[datetime] = Field(
+        None,
+        description="The time to start replay on, ignored if deliver_policy is not by_start_time",
     )
-    ops_start_time: Optional[int] = Field(
+    headers_only: Optional[bool] = Field(
         None,
-        description="The sequence to start replay on, ignored if deliver_policy is not start_by_sequence",
+        description="Deliver only the headers of messages, the size of the payload is sent in the Nats-Msg-Size header",
     )
 
 
@@ -1,6 +1,8 @@
 # Copyright 2021 - Guillaume Charbonnier
 # Licensed under the Apache License, Version 2.0 (the "License");
 # http://www.apache.org/licenses/LICENSE-2.0
+from typing import Optional
+
 from pydantic import Field
 
 from jsm.api.errors import JetStreamError
@@ -17,6 +19,9 @@ class IoNatsJetstreamApiV1ErrorItem(JetstreamModel):
     description: str = Field(
         "", description="A human friendly description of the error"
     )
+    err_code: Optional[int] = Field(
+        None, description="The NATS error code unique to each kind of error"
+    )
 
 
 class IoNatsJetstreamApiV1ErrorResponse(BaseResponse):
@@ -5,24 +5,106 @@ from __future__ import annotations
 
 from base64 import b64decode
 from datetime import datetime, timezone
-from email.parser import BytesParser
-from typing import Dict, Optional
+from typing import Dict, NamedTuple, Optional
 
 from pydantic import Field, PrivateAttr, validator
 
-from _nats.aio.client import (
-    CTRL_LEN,
-    DESC_HDR,
-    NATS_HDR_LINE,
-    STATUS_HDR,
-    STATUS_MSG_LEN,
-    Msg,
-)
+from _nats.aio.client import Client, Msg
+from _nats.protocol.headers import parse_headers
 
 from .base import JetstreamModel
 
 
-class Message(JetstreamModel):
+class MsgMetadata(NamedTuple):
+    """Metadata of a message delivered by a consumer, carried by its reply subject"""
+
+    stream: str
+    consumer: str
+    num_delivered: int
+    stream_seq: int
+    consumer_seq: int
+    timestamp: int
+    num_pending: int
+    domain: Optional[str] = None
+
+    @property
+    def time(self) -> datetime:
+        """The time the message was stored, `timestamp` being in nanoseconds"""
+        return datetime.fromtimestamp(self.timestamp / 1_000_000_000.0, tz=timezone.utc)
+
+
+def parse_metadata(reply: str) -> MsgMetadata:
+    """Parse the metadata of a message from its reply subject.
+
+    Reply subjects are either `$JS.ACK.<stream>.<consumer>.<delivered>.<stream seq>.<consumer seq>.<timestamp>.<pending>`,
+    or, for servers which set the domain and account, `$JS.ACK.<domain>.<account>.<stream>...<pending>.<token>`.
+
+    Raises:
+        ValueError: when the reply subject is not the one of a JetStream message.
+    """
+    tokens = reply.split(".")
+    count = len(tokens)
+    if count < 9 or tokens[0] != "$JS" or tokens[1] != "ACK":
+        raise ValueError(
+            "Failed to parse message. Message is not a valid JetStream message"
+        )
+    domain = None
+    if count >= 12:
+        domain = tokens[2] if tokens[2] != "_" else None
+        tokens = tokens[2:]
+    elif count != 9:
+        raise ValueError(
+            "Failed to parse message. Message is not a valid JetStream message"
+        )
+    return MsgMetadata(
+        stream=tokens[2],
+        consumer=tokens[3],
+        num_delivered=int(tokens[4]),
+        stream_seq=int(tokens[5]),
+        consumer_seq=int(tokens[6]),
+        timestamp=int(tokens[7]),
+        num_pending=int(tokens[8]),
+        domain=domain,
+    )
+
+
+class _AckMixin:
+    """Acknowledgements of a message delivered by a consumer."""
+
+    __slots__ = ()
+
+    def _delivered_msg(self) -> Msg:
+        """The message received from the consumer, acknowledgements are sent to its reply subject."""
+        raise NotImplementedError
+
+    async def ack(self, wait: bool = False) -> None:
+        await self._acknowledge(b"+ACK", wait)
+
+    async def nak(self, wait: bool = False) -> None:
+        await self._acknowledge(b"-NAK", wait)
+
+    async def in_progress(self, wait: bool = False) -> None:
+        await self._acknowledge(b"+WPI", wait)
+
+    async def term(self, wait: bool = False) -> None:
+        await self._acknowledge(b"+TERM", wait)
+
+    async def _acknowledge(self, payload: bytes, wait: bool) -> None:
+        # When wait is True, return once the server received the acknowledgement
+        msg = self._delivered_msg()
+        if not msg.reply:
+            raise Exception("No subject to send acknowledgment to.")
+        # JetStream clients batch acknowledgements
+        acks = getattr(msg._client, "acks", None)
+        if acks is None:
+            await msg.respond(payload)
+            if wait:
+                await msg._client.flush()  # type: ignore[union-attr]
+            return
+        await acks.add(msg.reply, payload, wait)
+
+
+class Message(JetstreamModel, _AckMixin):
     """A message read from a stream
 
     References:
@@ -41,9 +123,8 @@ class Message(JetstreamModel):
         ge=0,
     )
     data: bytes = Field(
-        ...,
+        b"",
         description="The base64 encoded payload of the message body",
-        min_length=1,
     )
     time: datetime = Field(
         ...,
@@ -54,63 +135,44 @@ class Message(JetstreamModel):
         description="Base64 encoded headers for the message",
     )
     _msg: Optional[Msg] = PrivateAttr(None)
+    _metadata: Optional[MsgMetadata] = PrivateAttr(None)
 
     @validator("hdrs", pre=True, always=True)
     def parse_b64_headers(cls, v):  # type: ignore[no-untyped-def]
         if not isinstance(v, str):
             return v
-        parser = BytesParser()
-        hdrs: Dict[str, str] = {}
-        headers = b64decode(v)
-        raw_headers = headers[len(NATS_HDR_LINE) :]
-        parsed_hdrs = parser.parsebytes(raw_headers)
-        # Check if it is an inline status message like:
-        #
-        # NATS/1.0 404 No Messages
-        #
-        if len(parsed_hdrs.items()) == 0:
-            _inline = headers[len(NATS_HDR_LINE) - 1 :]
-            status = _inline[:STATUS_MSG_LEN]
-            desc = _inline[STATUS_MSG_LEN + 1 : len(_inline) - CTRL_LEN - CTRL_LEN]
-            hdrs[STATUS_HDR] = status.decode()
-            hdrs[DESC_HDR] = desc.decode()
-        else:
-            for k, v in parsed_hdrs.items():
-                hdrs[k] = v
-
-        return hdrs
+        return parse_headers(b64decode(v))
 
     @classmethod
     def from_msg(cls, msg: Msg) -> Message:
         """Parse a JetStream message from an NATS message"""
-        tokens = msg.reply.split(".")
-        if len(tokens) != 9 or tokens[0] != "$JS" or tokens[1] != "ACK":
-            raise ValueError(
-                "Failed to parse message. Message is not a valid JetStream message"
-            )
+        metadata = parse_metadata(msg.reply)
         message = Message(
             subject=msg.subject,
-            seq=tokens[6],
+            seq=metadata.stream_seq,
             data=msg.data,
-            time=datetime.fromtimestamp(
-                int(tokens[7]) / 1_000_000_000.0, tz=timezone.utc
-            ),
+            time=metadata.time,
             hdrs=msg.headers,
         )
         message._msg = msg
+        message._metadata = metadata
         return message
 
+    @property
+    def metadata(self) -> Optional[MsgMetadata]:
+        """Metadata of the message when it was delivered by a consumer, None otherwise."""
+        return self._metadata
+
     async def respond(self, payload: Optional[bytes] = None) -> None:
         if self._msg:
             await self._msg.respond(payload or b"")
             return
         raise Exception("No subject to send acknowledgment to.")
 
-    async def ack(self) -> None:
-        if self._msg:
-            await self._msg.respond(b"")
-            return
-        raise Exception("No subject to send acknowledgment to.")
+    def _delivered_msg(self) -> Msg:
+        if not self._msg:
+            raise Exception("No subject to send acknowledgment to.")
+        return self._msg
 
     @property
     def sid(self) -> int:
@@ -125,3 +187,80 @@ class Message(JetstreamModel):
             return self._msg.reply  # type: ignore[no-any-return]
         else:
             raise Exception("No subject to reply to.")
+
+
+class JsMsg(Msg, _AckMixin):
+    """A message delivered by a JetStream consumer
+
+    Unlike `Message`, no model is built when the message is received: the metadata carried
+    by the reply subject is only parsed once it is accessed, and headers are only parsed
+    once `hdrs` is accessed.
+
+    Consumer methods of the client return `JsMsg` where they used to return `Message`,
+    use `to_message()` to get a `Message`.
+    """
+
+    __slots__ = ("_metadata",)
+
+    def __init__(
+        self,
+        subject: str = "",
+        reply: str = "",
+        data: bytes = b"",
+        sid: int = 0,
+        client: Optional[Client] = None,
+        headers: Optional[Dict[str, str]] = None,
+        raw_headers: Optional[bytes] = None,
+    ) -> None:
+        super().__init__(subject, reply, data, sid, client, headers, raw_headers)
+        self._metadata: Optional[MsgMetadata] = None
+
+    @property
+    def metadata(self) -> MsgMetadata:
+        """Metadata of the message, parsed from its reply subject on first access.
+
+        Raises:
+            ValueError: when the message was not delivered by a consumer.
+        """
+        if self._metadata is None:
+            self._metadata = parse_metadata(self.reply)
+        return self._metadata
+
+    @property
+    def seq(self) -> int:
+        """The sequence number of the message in the stream"""
+        return self.metadata.stream_seq
+
+    @property
+    def consumer_seq(self) -> int:
+        """The sequence number of the message in the consumer"""
+        return self.metadata.consumer_seq
+
+    @property
+    def num_delivered(self) -> int:
+        """The number of times the message was delivered"""
+        return self.metadata.num_delivered
+
+    @property
+    def num_pending(self) -> int:
+        """The number of messages left to deliver by the consumer"""
+        return self.metadata.num_pending
+
+    @property
+    def time(self) -> datetime:
+        """The time the message was stored"""
+        return self.metadata.time
+
+    @property
+    def hdrs(self) -> Optional[Dict[str, str]]:
+        return self.headers
+
+    def to_message(self) -> Message:
+        """Parse the message into a `Message` model, which acknowledges this message when acknowledged."""
+        return Message.from_msg(self)
+
+    async def respond(self, data: Optional[bytes] = None) -> None:
+        await super().respond(data or b"")
+
+    def _delivered_msg(self) -> Msg:
+        return self
@@ -9,8 +9,11 @@ from typing import Any, Dict, List, Optional
 
 from pydantic import Field, root_validator, validator
 
+from jsm.api.errors import JetStreamError
+
 from .base import BaseRequest, BaseResponse, JetstreamModel
 from .clusters import Cluster
+from .errors import IoNatsJetstreamApiV1ErrorItem
 from .messages import Message
 
 
@@ -279,6 +282,18 @@ class PubAck(JetstreamModel):
         None, description="JetStream domain which acknowledged the message"
     )
     duplicate: Optional[bool] = None
+    error: Optional[IoNatsJetstreamApiV1ErrorItem] = Field(
+        None, description="Reason why the message was not stored"
+    )
+
+    def raise_on_error(self) -> None:
+        """Raise an error when the message was not stored"""
+        if self.error is not None:
+            raise JetStreamError(
+                self.error.description,
+                self.error.code,
+                "io.nats.jetstream.api.v1.pub_ack",
+            )
 
 
 class IoNatsJetstreamApiV1StreamItem(JetstreamModel):
@@ -0,0 +1,102 @@
+# type: ignore[no-untyped-def]
+import asyncio
+
+import pytest
+
+from _nats.aio.client import Msg
+from jsm.api.acks import AckBatcher
+from jsm.models.messages import Message
+
+
+class FakeClient:
+    def __init__(self):
+        self.batches = []
+        self.flushes = 0
+
+    async def publish_many(self, messages):
+        self.batches.append(list(messages))
+
+    async def flush(self):
+        self.flushes += 1
+
+
+def make_message(seq):
+    return Message.from_msg(
+        Msg(
+            subject="foo",
+            data=b"x",
+            reply=f"$JS.ACK.S.C.1.{seq}.{seq}.1636471900000000000.0",
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_acks_are_sent_once_per_loop_iteration():
+    nc = FakeClient()
+    acks = AckBatcher(nc)
+    msgs = [make_message(seq) for seq in range(1, 4)]
+    await acks.ack(msgs[0])
+    await acks.nak(msgs[1])
+    await acks.in_progress(msgs[2])
+    assert nc.batches == []
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert nc.batches == [
+        [
+            (msgs[0].reply, b"+ACK", None),
+            (msgs[1].reply, b"-NAK", None),
+            (msgs[2].reply, b"+WPI", None),
+        ]
+    ]
+
+
+@pytest.mark.asyncio
+async def test_acks_are_sent_when_batch_is_full():
+    nc = FakeClient()
+    acks = AckBatcher(nc, max_batch=2)
+    await acks.ack(make_message(1))
+    await acks.ack(make_message(2))
+    assert len(nc.batches) == 1 and acks.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_ack_all_sends_highest_sequence():
+    nc = FakeClient()
+    acks = AckBatcher(nc)
+    msgs = [make_message(seq) for seq in (3, 12, 7)]
+    await acks.ack_all(msgs)
+    await acks.flush()
+    assert nc.batches == [[(msgs[1].reply, b"+ACK", None)]]
+
+
+@pytest.mark.asyncio
+async def test_ack_wait_sends_pending_acks():
+    nc = FakeClient()
+    acks = AckBatcher(nc)
+    msgs = [make_message(seq) for seq in range(1, 3)]
+    await acks.nak(msgs[0])
+    await acks.ack(msgs[1], wait=True)
+    assert nc.batches == [
+        [(msgs[0].reply, b"-NAK", None), (msgs[1].reply, b"+ACK", None)]
+    ]
+    assert nc.flushes == 1 and acks.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_ack_wait_raises_errors():
+    class FailingClient(FakeClient):
+        async def publish_many(self, messages):
+            raise ConnectionError
+
+    acks = AckBatcher(FailingClient())
+    with pytest.raises(ConnectionError):
+        await acks.ack(make_message(1), wait=True)
+
+
+@pytest.mark.asyncio
+async def test_acks_without_batching():
+    nc = FakeClient()
+    acks = AckBatcher(nc, max_batch=1)
+    await acks.ack(make_message(1))
+    await acks.ack(make_message(2))
+    assert len(nc.batches) == 2 and acks.pending == 0
@@ -0,0 +1,79 @@
+# type: ignore[no-untyped-def]
+from io import BytesIO
+
+import pytest
+
+from _nats.protocol.headers import VolatileHeaders
+from jsm.api.archive import ArchiveReader, ArchiveRecord, ArchiveWriter, zstandard
+from jsm.api.mixins.streams import _import_headers
+
+
+@pytest.mark.parametrize(
+    "compression",
+    [
+        "none",
+        "zlib",
+        pytest.param(
+            "zstd",
+            marks=pytest.mark.skipif(
+                zstandard is None, reason="zstandard is not installed"
+            ),
+        ),
+    ],
+)
+def test_archive_roundtrip(compression):
+    records = [
+        ArchiveRecord(i, 1_000 + i, f"foo.{i}", b"NATS/1.0\r\nk: v\r\n\r\n", b"x" * i)
+        for i in range(100)
+    ]
+    f = BytesIO()
+    writer = ArchiveWriter(f, compression, block_size=128)
+    for record in records:
+        writer.write(*record)
+    writer.close()
+    assert writer.count == 100
+
+    f.seek(0)
+    assert list(ArchiveReader(f)) == records
+
+    f.seek(0)
+    reader = ArchiveReader(f)
+    blocks = []
+    while (block := reader.read_block()) is not None:
+        blocks.append(block)
+    assert len(blocks) > 1
+    assert [record for block in blocks for record in block] == records
+
+
+def test_archive_empty():
+    f = BytesIO()
+    ArchiveWriter(f).close()
+    f.seek(0)
+    assert list(ArchiveReader(f)) == []
+
+
+def test_archive_invalid():
+    with pytest.raises(ValueError):
+        ArchiveReader(BytesIO(b"NOPE\x01\x00"))
+    f = BytesIO()
+    writer = ArchiveWriter(f)
+    writer.write(1, 1, "foo", b"", b"bar")
+    writer.close()
+    with pytest.raises(ValueError):
+        list(ArchiveReader(BytesIO(f.getvalue()[:-1])))
+
+
+def test_import_headers():
+    raw = (
+        b"NATS/1.0\r\nNats-Msg-Id: 1\r\nNats-Expected-Last-Sequence: 3\r\n"
+        b"nats-expected-stream: OLD\r\nfoo: bar\r\n\r\n"
+    )
+    assert isinstance(_import_headers(raw, "NEW", False), VolatileHeaders)
+    assert _import_headers(raw, "NEW", False) == {
+        "foo": "bar",
+        "Nats-Expected-Stream": "NEW",
+    }
+    headers = _import_headers(raw, "NEW", True)
+    assert headers["Nats-Msg-Id"] == "1"
+    assert headers["Nats-Expected-Last-Sequence"] == "3"
+    assert headers["Nats-Expected-Stream"] == "NEW"
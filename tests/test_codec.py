@@ -0,0 +1,56 @@
+# type: ignore[no-untyped-def]
+from datetime import datetime, timezone
+
+import pytest
+from pydantic.json import pydantic_encoder
+
+from _nats.protocol.codec import (
+    JSONCodec,
+    available_codecs,
+    get_codec,
+    register_codec,
+)
+from _nats.protocol.parser import Parser
+from jsm.models.consumers import Config, DeliverPolicy
+
+
+@pytest.mark.parametrize("name", available_codecs())
+def test_codec_roundtrip(name):
+    codec = get_codec(name, default=pydantic_encoder)
+    assert codec.name == name
+    config = Config(
+        deliver_policy=DeliverPolicy.by_start_time,
+        opt_start_time=datetime(2021, 11, 1, tzinfo=timezone.utc),
+    )
+    data = codec.dumps(config.dict(exclude_none=True))
+    assert isinstance(data, bytes)
+    assert Config.parse_obj(codec.loads(data)) == config
+    assert codec.loads(bytearray(b'{"a": [1, "b"]}')) == {"a": [1, "b"]}
+
+
+def test_default_codec_is_installed():
+    assert get_codec().name == available_codecs()[0]
+    assert "json" in available_codecs()
+
+
+def test_register_codec():
+    class UpperCodec(JSONCodec):
+        name = "upper"
+
+        def dumps(self, obj):
+            return super().dumps(obj).upper()
+
+    register_codec("upper", UpperCodec)
+    assert get_codec("upper").dumps({"a": "b"}) == b'{"A":"B"}'
+    with pytest.raises(ValueError):
+        get_codec("unknown")
+
+
+def test_parser_uses_codec():
+    class FakeClient:
+        def _process_info(self, info):
+            self.info = info
+
+    nc = FakeClient()
+    Parser(nc, get_codec("json")).parse(b'INFO {"max_payload":1024}\r\n')
+    assert nc.info == {"max_payload": 1024}
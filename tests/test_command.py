@@ -0,0 +1,17 @@
+# type: ignore[no-untyped-def]
+from _nats.protocol.command import hpub_cmd, pub_cmd
+
+
+def test_pub_cmd_segments():
+    payload = b"x" * 1024
+    cmd = pub_cmd("foo", "", payload)
+    assert cmd[0] == b"PUB foo  1024\r\n"
+    assert cmd[1] is payload
+    assert b"".join(cmd) == b"PUB foo  1024\r\n" + payload + b"\r\n"
+
+
+def test_hpub_cmd_segments():
+    hdr = b"NATS/1.0\r\nfoo: bar\r\n\r\n"
+    cmd = hpub_cmd("foo", "bar", hdr, b"hello")
+    assert cmd[2] == b"hello"
+    assert b"".join(cmd) == b"HPUB foo bar 22 27\r\n" + hdr + b"hello\r\n"
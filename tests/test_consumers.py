@@ -1,7 +1,14 @@
 # type: ignore[no-untyped-def]
+import asyncio
+
 import pytest
 
-from jsm import JS
+from jsm import JS, connect
+from jsm.api.subscriptions import (
+    PULL_EXPIRES_MARGIN,
+    PushSubscription,
+    _pull_expires,
+)
 
 
 @pytest.mark.asyncio
@@ -33,3 +40,238 @@ async def test_consumer_get_next(js: JS):
     assert msg_response3 is None
 
     await js.stream_delete(STREAM)
+
+
+@pytest.mark.asyncio
+async def test_consumer_fetch(js: JS):
+    STREAM = "test_consumer_fetch"
+    await js.stream_delete(STREAM)
+    await js.stream_create(STREAM, [f"{STREAM}.>"])
+    await js.consumer_durable_create(STREAM, "durable1", deliver_policy="all")
+
+    await js.stream_publish_many([(f"{STREAM}.{i}", b"test", None) for i in range(10)])
+
+    msgs = await js.consumer_fetch(STREAM, "durable1", batch=4)
+    assert [msg.subject for msg in msgs] == [f"{STREAM}.{i}" for i in range(4)]
+
+    msgs = await js.consumer_fetch(STREAM, "durable1", batch=10, no_wait=True)
+    assert len(msgs) == 6
+
+    assert await js.consumer_fetch(STREAM, "durable1", batch=10, no_wait=True) == []
+
+    await js.stream_delete(STREAM)
+
+
+@pytest.mark.asyncio
+async def test_push_subscribe(js: JS):
+    STREAM = "test_push_subscribe"
+    await js.stream_delete(STREAM)
+    await js.stream_create(STREAM, [f"{STREAM}.>"])
+    await js.stream_publish_many([(f"{STREAM}.{i}", b"test", None) for i in range(10)])
+
+    received = []
+    done = asyncio.Event()
+
+    async def cb(msg):
+        received.append(msg.subject)
+        if len(received) == 10:
+            done.set()
+
+    sub = await js.push_subscribe(STREAM, "push1", cb)
+    await asyncio.wait_for(done.wait(), 1)
+    assert received == [f"{STREAM}.{i}" for i in range(10)]
+
+    await sub.unsubscribe()
+    await js.stream_delete(STREAM)
+
+
+@pytest.mark.asyncio
+async def test_push_subscription_heartbeats_with_failing_error_cb():
+    class FakeSubscription:
+        async def unsubscribe(self):
+            pass
+
+    class FakeClient:
+        is_closed = False
+        is_connected = True
+
+        async def subscribe(self, subject, queue, cb):
+            return FakeSubscription()
+
+        async def _error_cb(self, err):
+            raise RuntimeError
+
+    sub = PushSubscription(FakeClient(), "S", "C", "inbox", None, idle_heartbeat=0.01)
+    await sub.start()
+    await asyncio.sleep(0.1)
+    assert sub.missed_heartbeats > 1
+    assert not sub._heartbeat_task.done()
+    await sub.unsubscribe()
+
+
+@pytest.mark.asyncio
+async def test_ordered_subscribe(js: JS):
+    STREAM = "test_ordered_subscribe"
+    await js.stream_delete(STREAM)
+    await js.stream_create(STREAM, [f"{STREAM}.>"])
+    await js.stream_publish_many([(f"{STREAM}.{i}", b"test", None) for i in range(10)])
+
+    sub = await js.ordered_subscribe(STREAM)
+    received = [msg.subject async for msg in sub.messages(catch_up=True)]
+    assert received == [f"{STREAM}.{i}" for i in range(10)]
+    assert sub.stream_seq == 10
+    assert sub.num_pending == 0
+
+    await sub.unsubscribe()
+    await js.stream_delete(STREAM)
+
+
+@pytest.mark.asyncio
+async def test_kv_snapshot_and_keys(js: JS):
+    BUCKET = "test_kv_snapshot_and_keys"
+    await js.kv_rm(BUCKET)
+    await js.kv_add(BUCKET, history=5)
+    for i in range(10):
+        await js.kv_put(BUCKET, f"key{i}", b"old")
+    await js.kv_put(BUCKET, "key0", b"new")
+    await js.kv_delete(BUCKET, "key1")
+
+    snapshot = await js.kv_snapshot(BUCKET)
+    assert snapshot["key0"].data == b"new"
+    assert "key1" not in snapshot
+    assert len(snapshot) == 9
+    assert sorted(await js.kv_keys(BUCKET)) == sorted(snapshot)
+
+    watch = js.kv_watch(BUCKET, "key2")
+    assert (await watch.__anext__()).data == b"old"
+    assert await watch.__anext__() is None
+    await js.kv_put(BUCKET, "key2", b"new")
+    assert (await watch.__anext__()).data == b"new"
+    await watch.aclose()
+    await js.kv_rm(BUCKET)
+
+
+@pytest.mark.asyncio
+async def test_pull_subscription_reuse(js: JS):
+    STREAM = "test_pull_subscription_reuse"
+    await js.stream_delete(STREAM)
+    await js.stream_create(STREAM, [f"{STREAM}.>"])
+    await js.consumer_durable_create(STREAM, "durable1", deliver_policy="all")
+    await js.stream_publish_many([(f"{STREAM}.{i}", b"test", None) for i in range(4)])
+
+    subs = await asyncio.gather(
+        js.consumer_pull_subscription(STREAM, "durable1"),
+        js.consumer_pull_subscription(STREAM, "durable1"),
+    )
+    assert subs[0] is subs[1]
+    assert (await js.consumer_pull_next(STREAM, "durable1")).subject == f"{STREAM}.0"
+    assert (await js.consumer_pull_next(STREAM, "durable1")).subject == f"{STREAM}.1"
+    assert await js.consumer_pull_subscription(STREAM, "durable1") is subs[0]
+
+    await js.stream_delete(STREAM)
+
+
+@pytest.mark.asyncio
+async def test_pull_next_while_iterating(js: JS):
+    STREAM = "test_pull_next_while_iterating"
+    await js.stream_delete(STREAM)
+    await js.stream_create(STREAM, [f"{STREAM}.>"])
+    await js.consumer_durable_create(STREAM, "durable1", deliver_policy="all")
+    await js.stream_publish_many([(f"{STREAM}.{i}", b"test", None) for i in range(10)])
+
+    received = []
+    async for msg in js.consumer_pull_msgs(STREAM, "durable1", batch=2, timeout=1):
+        received.append(msg.subject)
+        # The iteration does not prevent other calls on the same consumer
+        msg = await js.consumer_pull_next(STREAM, "durable1", timeout=1)
+        received.append(msg.subject)
+        if len(received) >= 6:
+            break
+    # Breaking out of the iteration does not block the consumer either
+    msgs = await js.consumer_fetch(STREAM, "durable1", batch=10, timeout=1)
+    received.extend(msg.subject for msg in msgs)
+    assert sorted(received) == sorted(f"{STREAM}.{i}" for i in range(10))
+
+    await js.stream_delete(STREAM)
+
+
+@pytest.mark.asyncio
+async def test_pull_messages_retire_fulfilled_requests(js: JS):
+    STREAM = "test_pull_messages_retire_fulfilled_requests"
+    await js.stream_delete(STREAM)
+    await js.stream_create(STREAM, [f"{STREAM}.>"])
+    await js.consumer_durable_create(STREAM, "durable1", deliver_policy="all")
+    await js.stream_publish_many([(f"{STREAM}.{i}", b"test", None) for i in range(100)])
+
+    sub = await js.consumer_pull_subscription(STREAM, "durable1")
+    active = []
+    async for msg in sub.messages(batch=10, timeout=1, max_msgs=100):
+        active.append(len(sub._active))
+    assert len(active) == 100
+    # The current request and the one prefetched at most
+    assert max(active) <= 2
+    assert sub._active == {}
+
+    await js.stream_delete(STREAM)
+
+
+def test_pull_expires():
+    assert _pull_expires(1.0, False) == 1.0 - PULL_EXPIRES_MARGIN
+    assert _pull_expires(0.0, False) == PULL_EXPIRES_MARGIN
+    assert _pull_expires(1.0, True) is None
+    assert _pull_expires(None, False) is None
+
+
+@pytest.mark.asyncio
+async def test_pull_subscription_close_and_drain(js: JS):
+    STREAM = "test_pull_subscription_close_and_drain"
+    await js.stream_delete(STREAM)
+    await js.stream_create(STREAM, [f"{STREAM}.>"])
+    await js.consumer_durable_create(
+        STREAM, "durable1", deliver_policy="all", ack_wait=int(60e9)
+    )
+    await js.stream_publish_many([(f"{STREAM}.{i}", b"test", None) for i in range(10)])
+
+    sub = await js.consumer_pull_subscription(STREAM, "durable1")
+    # Stop iterating while messages of the batch are still being delivered
+    async for msg in sub.messages(batch=4, timeout=1):
+        break
+    drained = await sub.drain()
+    assert sub.is_closed
+    assert [msg.subject for msg in drained] == [f"{STREAM}.{i}" for i in range(1, 4)]
+
+    sub = await js.consumer_pull_subscription(STREAM, "durable1")
+    assert not sub.is_closed
+    msg = await sub.next(timeout=1)
+    assert msg.subject == f"{STREAM}.4"
+    await sub.close()
+    assert sub.is_closed
+    assert await js.consumer_pull_subscription(STREAM, "durable1") is not sub
+
+    await js.stream_delete(STREAM)
+
+
+@pytest.mark.asyncio
+async def test_acks_sent_before_drain(js: JS):
+    STREAM = "test_acks_sent_before_drain"
+    await js.stream_delete(STREAM)
+    await js.stream_create(STREAM, [f"{STREAM}.>"])
+    await js.consumer_durable_create(
+        STREAM, "durable1", deliver_policy="all", ack_wait=int(60e9)
+    )
+    await js.stream_publish_many([(f"{STREAM}.{i}", b"test", None) for i in range(4)])
+
+    other = await connect()
+    msgs = await other.consumer_fetch(STREAM, "durable1", batch=4, auto_ack=False)
+    await msgs[0].ack(wait=True)
+    info = await js.consumer_info(STREAM, "durable1")
+    assert info.num_ack_pending == 3
+
+    for msg in msgs[1:]:
+        await msg.ack()
+    await other.drain()
+    assert other.is_closed
+    info = await js.consumer_info(STREAM, "durable1")
+    assert info.num_ack_pending == 0
+
+    await js.stream_delete(STREAM)
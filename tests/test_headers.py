@@ -0,0 +1,104 @@
+# type: ignore[no-untyped-def]
+import asyncio
+
+import pytest
+
+from _nats.aio.client import Client, Msg
+from _nats.aio.errors import ErrInvalidHeaders
+from _nats.protocol.headers import (
+    Headers,
+    VolatileHeaders,
+    _encode_items,
+    encode_headers,
+    header_block,
+    parse_headers,
+)
+
+
+def test_parse_headers():
+    hdrs = parse_headers(b"NATS/1.0\r\nNats-Msg-Id: 1\r\nfoo:  bar baz \r\n\r\n")
+    assert hdrs == {"Nats-Msg-Id": "1", "foo": "bar baz"}
+
+
+def test_parse_inline_status():
+    assert parse_headers(b"NATS/1.0 404 No Messages\r\n\r\n") == {
+        "Status": "404",
+        "Description": "No Messages",
+    }
+    assert parse_headers(b"NATS/1.0 503\r\n\r\n") == {
+        "Status": "503",
+        "Description": "",
+    }
+
+
+def test_parse_inline_status_with_headers():
+    hdrs = parse_headers(
+        memoryview(b"NATS/1.0 100 Idle Heartbeat\r\nNats-Last-Consumer: 2\r\n\r\n")
+    )
+    assert hdrs == {
+        "Status": "100",
+        "Description": "Idle Heartbeat",
+        "Nats-Last-Consumer": "2",
+    }
+
+
+def test_encode_headers_roundtrip():
+    headers = {"Nats-Msg-Id": "abc", "KV-Operation": "DEL"}
+    block = encode_headers(headers)
+    assert block == b"NATS/1.0\r\nNats-Msg-Id: abc\r\nKV-Operation: DEL\r\n\r\n"
+    assert parse_headers(block) == headers
+
+
+def test_frozen_headers():
+    headers = Headers({"Nats-Msg-Id": "abc"})
+    frozen = headers.freeze()
+    headers["foo"] = "bar"
+    assert dict(frozen) == {"Nats-Msg-Id": "abc"}
+    assert frozen.block == b"NATS/1.0\r\nNats-Msg-Id: abc\r\n\r\n"
+    assert header_block(frozen) is frozen.block
+
+
+def test_header_block_is_cached():
+    block = header_block({"foo": "bar"})
+    assert block == encode_headers({"foo": "bar"})
+    assert header_block({"foo": "bar"}) is block
+
+
+def test_volatile_headers_are_not_cached():
+    size = _encode_items.cache_info().currsize
+    for seq in range(10):
+        headers = VolatileHeaders({"Nats-Expected-Last-Subject-Sequence": str(seq)})
+        assert header_block(headers) == encode_headers(headers)
+    assert _encode_items.cache_info().currsize == size
+
+
+def test_msg_headers_are_lazy():
+    msg = Msg(raw_headers=b"NATS/1.0\r\nfoo: bar\r\n\r\n")
+    assert msg._headers is None
+    assert msg.headers == {"foo": "bar"}
+    assert Msg(raw_headers=b"").headers == {}
+    assert Msg().headers is None
+    msg.headers = {"bar": "baz"}
+    assert msg.headers == {"bar": "baz"}
+
+
+@pytest.mark.asyncio
+async def test_msg_invalid_headers_are_reported():
+    errors = []
+
+    async def error_cb(err):
+        errors.append(err)
+
+    client = Client()
+    client._error_cb = error_cb
+    msg = Msg(subject="foo", sid=3, client=client, raw_headers=b"NATS/1.0\r\n\xff\r\n")
+    assert msg.headers == {}
+    assert msg.headers == {}
+    assert len(client._error_tasks) == 1
+    # The task is discarded by its done callback, which runs on the next iteration
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert not client._error_tasks
+    assert len(errors) == 1
+    assert isinstance(errors[0], ErrInvalidHeaders)
+    assert errors[0].subject == "foo" and errors[0].sid == 3
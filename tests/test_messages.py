@@ -0,0 +1,96 @@
+# type: ignore[no-untyped-def]
+from datetime import datetime, timezone
+
+import pytest
+
+from jsm.models.messages import JsMsg, Message, MsgMetadata, parse_metadata
+
+REPLY = "$JS.ACK.S.C.2.12.7.1636471900000000000.5"
+
+
+class FakeAcks:
+    def __init__(self):
+        self.acks = []
+
+    async def add(self, reply, payload, wait=False):
+        self.acks.append((reply, payload, wait))
+
+
+class FakeClient:
+    def __init__(self):
+        self.acks = FakeAcks()
+
+
+def test_js_msg_metadata():
+    msg = JsMsg(subject="foo", reply=REPLY, data=b"x")
+    assert msg.seq == 12
+    assert msg.consumer_seq == 7
+    assert msg.num_delivered == 2
+    assert msg.num_pending == 5
+    assert msg.time == datetime.fromtimestamp(1636471900, tz=timezone.utc)
+
+
+def test_parse_metadata():
+    assert parse_metadata(REPLY) == MsgMetadata(
+        stream="S",
+        consumer="C",
+        num_delivered=2,
+        stream_seq=12,
+        consumer_seq=7,
+        timestamp=1636471900000000000,
+        num_pending=5,
+    )
+
+
+def test_parse_metadata_with_domain():
+    metadata = parse_metadata("$JS.ACK.hub.ACC.S.C.2.12.7.1636471900000000000.5.x")
+    assert metadata.domain == "hub"
+    assert metadata.stream == "S" and metadata.stream_seq == 12
+    assert metadata.num_pending == 5
+    assert parse_metadata("$JS.ACK._.ACC.S.C.2.12.7.1.5.x").domain is None
+
+
+def test_message_metadata():
+    message = Message.from_msg(JsMsg(subject="foo", reply=REPLY, data=b"x"))
+    assert message.seq == 12
+    assert message.metadata.consumer_seq == 7
+    assert message.metadata.num_pending == 5
+
+
+def test_js_msg_headers():
+    msg = JsMsg(subject="foo", reply=REPLY, raw_headers=b"NATS/1.0\r\nfoo: bar\r\n\r\n")
+    assert msg.hdrs == {"foo": "bar"}
+    assert Message.from_msg(msg).hdrs == {"foo": "bar"}
+
+
+def test_js_msg_invalid_reply():
+    msg = JsMsg(subject="foo", reply="_INBOX.foo")
+    with pytest.raises(ValueError):
+        msg.seq
+
+
+@pytest.mark.asyncio
+async def test_js_msg_ack_is_batched():
+    client = FakeClient()
+    msg = JsMsg(subject="foo", reply=REPLY, client=client)
+    await msg.ack()
+    await msg.term(wait=True)
+    assert client.acks.acks == [(REPLY, b"+ACK", False), (REPLY, b"+TERM", True)]
+
+
+@pytest.mark.asyncio
+async def test_js_msg_to_message():
+    client = FakeClient()
+    msg = JsMsg(
+        subject="foo",
+        reply=REPLY,
+        data=b"x",
+        client=client,
+        raw_headers=b"NATS/1.0\r\nfoo: bar\r\n\r\n",
+    )
+    message = msg.to_message()
+    assert isinstance(message, Message)
+    assert message.subject == "foo" and message.data == b"x"
+    assert message.seq == 12 and message.hdrs == {"foo": "bar"}
+    await message.ack()
+    assert client.acks.acks == [(REPLY, b"+ACK", False)]
@@ -0,0 +1,122 @@
+# type: ignore[no-untyped-def]
+import pytest
+
+from _nats.protocol.parser import AWAITING_MSG_PAYLOAD, ErrProtocol, Parser
+
+
+class FakeClient:
+    def __init__(self):
+        self.msgs = []
+        self.errors = []
+        self.infos = []
+        self.pings = 0
+        self.pongs = 0
+
+    def _process_msg(self, sid, subject, reply, payload, headers):
+        # Views handed out by the parser are only valid during the call.
+        if headers is not None:
+            headers = bytes(headers)
+        self.msgs.append((sid, bytes(subject), bytes(reply), bytes(payload), headers))
+
+    def _process_ping(self):
+        self.pings += 1
+
+    def _process_pong(self):
+        self.pongs += 1
+
+    def _process_err(self, err_msg):
+        self.errors.append(err_msg)
+
+    def _process_info(self, info):
+        self.infos.append(info)
+
+
+@pytest.fixture
+def nc():
+    return FakeClient()
+
+
+def test_parse_msg(nc):
+    ps = Parser(nc)
+    ps.parse(b"MSG foo.bar 1 5\r\nhello\r\nMSG foo 2 _INBOX.x 2\r\nhi\r\n")
+    assert nc.msgs == [
+        (1, b"foo.bar", b"", b"hello", None),
+        (2, b"foo", b"_INBOX.x", b"hi", None),
+    ]
+    assert not ps.buf
+
+
+def test_parse_hmsg(nc):
+    ps = Parser(nc)
+    hdr = b"NATS/1.0\r\nfoo: bar\r\n\r\n"
+    ps.parse(
+        b"HMSG foo 3 _INBOX.y %d %d\r\n%shello\r\nHMSG bar 4 %d %d\r\n%s\r\n"
+        % (len(hdr), len(hdr) + 5, hdr, len(hdr), len(hdr), hdr)
+    )
+    assert nc.msgs == [
+        (3, b"foo", b"_INBOX.y", b"hello", hdr),
+        (4, b"bar", b"", b"", hdr),
+    ]
+
+
+def test_parse_split_buffers(nc):
+    ps = Parser(nc)
+    stream = b"PING\r\nMSG foo 1 _INBOX.z 11\r\nhello world\r\nPONG\r\n+OK\r\n"
+    for i in range(len(stream)):
+        ps.parse(stream[i : i + 1])
+    assert nc.msgs == [(1, b"foo", b"_INBOX.z", b"hello world", None)]
+    assert nc.pings == 1
+    assert nc.pongs == 1
+    assert not ps.buf
+
+
+def test_parse_waits_for_payload(nc):
+    ps = Parser(nc)
+    ps.parse(b"MSG foo 1 10\r\nhello")
+    assert ps.state == AWAITING_MSG_PAYLOAD
+    assert not nc.msgs
+    ps.parse(b"world\r\n")
+    assert nc.msgs == [(1, b"foo", b"", b"helloworld", None)]
+
+
+def test_parse_keeps_partial_control_line(nc):
+    ps = Parser(nc)
+    ps.parse(b"MSG foo 1 1\r\na\r\n" * 100 + b"MSG foo 1")
+    assert len(nc.msgs) == 100
+    assert ps.buf == b"MSG foo 1"
+    ps.parse(b" 1\r\nb\r\n")
+    assert nc.msgs[-1] == (1, b"foo", b"", b"b", None)
+    assert not ps.buf
+
+
+def test_parse_info_and_err(nc):
+    ps = Parser(nc)
+    ps.parse(b'INFO {"server_id":"abc","max_payload":1024}\r\n')
+    ps.parse(b"-ERR 'Stale Connection'\r\n")
+    assert nc.infos == [{"server_id": "abc", "max_payload": 1024}]
+    assert nc.errors == [(b"'Stale Connection'",)]
+
+
+def test_parse_unknown_protocol(nc):
+    ps = Parser(nc)
+    with pytest.raises(ErrProtocol):
+        ps.parse(b"FOO bar\r\n")
+
+
+def test_parse_malformed_msg(nc):
+    ps = Parser(nc)
+    with pytest.raises(ErrProtocol):
+        ps.parse(b"MSG foo 1\r\n")
+
+
+def test_parse_reused_buffer(nc):
+    ps = Parser(nc)
+    buf = bytearray(32)
+    for chunk in (b"MSG foo 1 5\r\nhel", b"lo\r\nMSG bar 2 2\r\nhi\r\nPI", b"NG\r\n"):
+        buf[: len(chunk)] = chunk
+        ps.parse(buf, len(chunk))
+        # Leftover bytes must not point into the reused buffer.
+        buf[:] = b"\x00" * len(buf)
+    assert nc.msgs == [(1, b"foo", b"", b"hello", None), (2, b"bar", b"", b"hi", None)]
+    assert nc.pings == 1
+    assert not ps.buf
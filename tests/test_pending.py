@@ -0,0 +1,56 @@
+# type: ignore[no-untyped-def]
+import asyncio
+
+import pytest
+
+from _nats.aio.client import Msg, _PendingBuffer
+
+
+def test_pending_buffer_limits():
+    pending = _PendingBuffer(msgs_limit=2, bytes_limit=10)
+    assert pending.put(Msg(data=b"abc"))
+    assert pending.put(Msg(data=b"def"))
+    assert not pending.put(Msg(data=b"g"))
+    assert len(pending) == 2 and pending.bytes == 6
+    assert pending.get_nowait().data == b"abc"
+    assert not pending.put(Msg(data=b"x" * 7))
+    assert len(pending) == 1 and pending.bytes == 3
+
+
+@pytest.mark.asyncio
+async def test_pending_buffer_get_waits_for_message():
+    pending = _PendingBuffer()
+    getter = asyncio.ensure_future(pending.get())
+    await asyncio.sleep(0)
+    assert not getter.done()
+    pending.put(Msg(data=b"foo"))
+    assert (await getter).data == b"foo"
+    with pytest.raises(asyncio.TimeoutError):
+        await pending.get(timeout=0.01)
+
+
+@pytest.mark.asyncio
+async def test_pending_buffer_cancelled_getter():
+    pending = _PendingBuffer()
+    cancelled = asyncio.ensure_future(pending.get())
+    getter = asyncio.ensure_future(pending.get())
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    pending.put(Msg(data=b"foo"))
+    assert (await getter).data == b"foo"
+
+
+@pytest.mark.asyncio
+async def test_pending_buffer_join():
+    pending = _PendingBuffer()
+    pending.put(Msg(data=b"foo"))
+    pending.put(Msg(data=b"bar"))
+    joined = asyncio.ensure_future(pending.join())
+    pending.get_nowait()
+    pending.task_done()
+    await asyncio.sleep(0)
+    assert not joined.done()
+    pending.get_nowait()
+    pending.task_done()
+    await asyncio.wait_for(joined, 1)
@@ -0,0 +1,62 @@
+# type: ignore[no-untyped-def]
+import pytest
+
+from jsm.api.mixins.request_reply import JetStreamResponse, decode_response
+from jsm.models.errors import IoNatsJetstreamApiV1ErrorResponse
+from jsm.models.streams import (
+    IoNatsJetstreamApiV1StreamInfoResponse,
+    IoNatsJetstreamApiV1StreamNamesResponse,
+)
+
+STREAM_INFO = b"""{
+    "type": "io.nats.jetstream.api.v1.stream_info_response",
+    "config": {
+        "name": "DEMO", "subjects": ["demo.>"], "retention": "limits", "max_consumers": -1,
+        "max_msgs": -1, "max_bytes": -1, "max_age": 0, "max_msgs_per_subject": -1,
+        "max_msg_size": -1, "discard": "old", "storage": "file", "num_replicas": 1,
+        "duplicate_window": 120000000000
+    },
+    "created": "2021-11-01T10:00:00.000000000Z",
+    "state": {
+        "messages": 2, "bytes": 80, "first_seq": 1, "first_ts": "2021-11-01T10:00:00Z",
+        "last_seq": 2, "last_ts": "2021-11-01T10:00:01Z", "consumer_count": 0
+    }
+}"""
+
+
+@pytest.mark.parametrize("trusted", [False, True])
+def test_decode_response(trusted):
+    res = decode_response(
+        STREAM_INFO, JetStreamResponse[IoNatsJetstreamApiV1StreamInfoResponse], trusted
+    )
+    assert isinstance(res, IoNatsJetstreamApiV1StreamInfoResponse)
+    assert res.config.name == "DEMO"
+    assert res.config.subjects == ["demo.>"]
+    assert res.config.storage == "file"
+    assert res.state.last_seq == 2
+    assert res.mirror is None
+
+
+@pytest.mark.parametrize("trusted", [False, True])
+def test_decode_error_response(trusted):
+    res = decode_response(
+        b'{"type":"io.nats.jetstream.api.v1.stream_info_response",'
+        b'"error":{"code":404,"err_code":10059,"description":"stream not found"}}',
+        JetStreamResponse[IoNatsJetstreamApiV1StreamInfoResponse],
+        trusted,
+    )
+    assert isinstance(res, IoNatsJetstreamApiV1ErrorResponse)
+    assert res.error.code == 404
+    assert res.error.err_code == 10059
+
+
+def test_decode_trusted_response_defaults():
+    res = decode_response(
+        b'{"type":"io.nats.jetstream.api.v1.stream_names_response",'
+        b'"total":0,"offset":0,"limit":1024,"streams":null}',
+        JetStreamResponse[IoNatsJetstreamApiV1StreamNamesResponse],
+        trusted=True,
+    )
+    assert res.streams == []
+    res.streams.append("foo")
+    assert IoNatsJetstreamApiV1StreamNamesResponse.__fields__["streams"].default == []
@@ -1,7 +1,12 @@
 # type: ignore[no-untyped-def]
+import asyncio
+
 import pytest
 
+from _nats.protocol.codec import JSONCodec
 from jsm import JS
+from jsm.api.errors import ErrKeyConflict, JetStreamError
+from jsm.api.mixins.streams import _decode_msg_get_response
 from jsm.models.streams import (
     IoNatsJetstreamApiV1StreamListResponse,
     IoNatsJetstreamApiV1StreamNamesResponse,
@@ -60,3 +65,147 @@ async def test_stream_msg_get(js: JS):
     assert msg_response.message.data == b"test"
     assert msg_response2.message.hdrs == {"foo": "bar"}
     await js.stream_delete(STREAM)
+
+
+@pytest.mark.asyncio
+async def test_stream_publish_many(js: JS):
+    STREAM = "test_stream_publish_many"
+    await js.stream_delete(STREAM)
+    await js.stream_create(STREAM, [f"{STREAM}.*"])
+
+    acks = await js.stream_publish_many(
+        [(f"{STREAM}.{i}", b"test", {"foo": str(i)}) for i in range(10)]
+    )
+    assert [ack.seq for ack in acks] == list(range(1, 11))
+
+    msg_response = await js.stream_msg_get(STREAM, seq=5)
+    assert msg_response.message.subject == f"{STREAM}.4"
+    assert msg_response.message.hdrs == {"foo": "4"}
+    await js.stream_delete(STREAM)
+
+
+@pytest.mark.asyncio
+async def test_stream_publish_async(js: JS):
+    STREAM = "test_stream_publish_async"
+    await js.stream_delete(STREAM)
+    await js.stream_create(STREAM, [f"{STREAM}.*"])
+
+    futures = [
+        await js.stream_publish_async(f"{STREAM}.{i}", b"test") for i in range(100)
+    ]
+    await js.publish_async_complete()
+    assert [future.result().seq for future in futures] == list(range(1, 101))
+    await js.stream_delete(STREAM)
+
+
+@pytest.mark.asyncio
+async def test_stream_export_import(js: JS, tmp_path):
+    STREAM = "test_stream_export_import"
+    await js.stream_delete(STREAM)
+    await js.stream_create(STREAM, [f"{STREAM}.*"])
+    await js.stream_publish_many(
+        [
+            (f"{STREAM}.{i}", b"test", {"index": str(i), "Nats-Msg-Id": str(i)})
+            for i in range(10)
+        ]
+    )
+
+    path = tmp_path / "stream.archive"
+    assert await js.stream_export(STREAM, path, compression="zlib") == 10
+    await js.stream_purge(STREAM)
+    assert await js.stream_import(path, STREAM) == 10
+
+    msg = (await js.stream_msg_get(STREAM, 13)).message
+    assert msg.subject == f"{STREAM}.2"
+    assert msg.hdrs["index"] == "2"
+    assert "Nats-Msg-Id" not in msg.hdrs
+    await js.stream_delete(STREAM)
+
+
+@pytest.mark.asyncio
+async def test_stream_msg_get_many(js: JS):
+    STREAM = "test_stream_msg_get_many"
+    await js.stream_delete(STREAM)
+    await js.stream_create(STREAM, [f"{STREAM}.*"])
+    await js.stream_publish_many([(f"{STREAM}.{i}", b"test", None) for i in range(10)])
+    await js.stream_msg_delete(STREAM, 5)
+
+    msgs = [msg async for msg in js.stream_msg_get_many(STREAM, [7, 5, 2], window=2)]
+    assert [msg.seq for msg in msgs] == [7, 2]
+    msgs = [msg async for msg in js.stream_msg_get_range(STREAM, 3)]
+    assert [msg.seq for msg in msgs] == [3, 4, 6, 7, 8, 9, 10]
+    assert msgs[0].data == b"test"
+    await js.stream_delete(STREAM)
+
+    with pytest.raises(JetStreamError):
+        [msg async for msg in js.stream_msg_get_many(STREAM, [1])]
+
+
+def test_decode_msg_get_response():
+    codec = JSONCodec()
+    not_found = (
+        b'{"error":{"code":404,"err_code":10037,"description":"no message found"}}'
+    )
+    assert _decode_msg_get_response(not_found, codec) is None
+    no_stream = (
+        b'{"error":{"code":404,"err_code":10059,"description":"stream not found"}}'
+    )
+    with pytest.raises(JetStreamError) as exc_info:
+        _decode_msg_get_response(no_stream, codec)
+    assert exc_info.value.code == 404
+
+
+@pytest.mark.asyncio
+async def test_kv_bucket_cache(js: JS):
+    BUCKET = "test_kv_bucket_cache"
+    await js.kv_rm(BUCKET)
+    await js.kv_add(BUCKET, history=5)
+    kv = await js.kv_bucket(BUCKET)
+
+    await kv.put("foo", b"bar")
+    assert (await kv.get("foo")).data == b"bar"
+    assert (await kv.get("foo")).data == b"bar"
+    assert kv.hits == 1
+    # Modifications made by other clients are seen by the watcher
+    await js.kv_put(BUCKET, "foo", b"baz")
+    await js.flush()
+    await asyncio.sleep(0.01)
+    assert (await kv.get("foo")).data == b"baz"
+    await js.kv_delete(BUCKET, "foo")
+    await js.flush()
+    await asyncio.sleep(0.01)
+    assert await kv.get("foo") is None
+
+    await kv.close()
+    await js.kv_rm(BUCKET)
+
+
+@pytest.mark.asyncio
+async def test_kv_update_and_create(js: JS):
+    BUCKET = "test_kv_update_and_create"
+    await js.kv_rm(BUCKET)
+    await js.kv_add(BUCKET, history=5)
+
+    ack = await js.kv_create(BUCKET, "foo", b"1")
+    with pytest.raises(ErrKeyConflict):
+        await js.kv_create(BUCKET, "foo", b"1")
+    await js.kv_update(BUCKET, "foo", b"2", ack.seq)
+    with pytest.raises(ErrKeyConflict):
+        await js.kv_update(BUCKET, "foo", b"3", ack.seq)
+    await js.kv_delete(BUCKET, "foo")
+    await js.kv_create(BUCKET, "foo", b"0")
+
+    await asyncio.gather(
+        *(
+            js.kv_compare_and_swap(BUCKET, "foo", lambda v: b"%d" % (int(v) + 1))
+            for _ in range(5)
+        )
+    )
+    assert (await js.kv_get(BUCKET, "foo")).data == b"5"
+
+    async def double(value):
+        return b"%d" % (int(value) * 2)
+
+    await js.kv_compare_and_swap(BUCKET, "foo", double)
+    assert (await js.kv_get(BUCKET, "foo")).data == b"10"
+    await js.kv_rm(BUCKET)
@@ -0,0 +1,184 @@
+# type: ignore[no-untyped-def]
+import asyncio
+
+import pytest
+
+from _nats.aio.client import Client
+from _nats.aio.errors import ErrStaleConnection
+from _nats.aio.transport import NatsProtocol
+from _nats.protocol.parser import ErrProtocol, Parser
+
+
+class FakeClient:
+    def __init__(self):
+        self.is_closed = False
+        self.is_connecting = False
+        self.is_reconnecting = False
+        self.msgs = []
+        self.pongs = 0
+        self.errors = []
+        self.op_errors = []
+        self._deferred = []
+        self._ps = Parser(self)
+
+    def _process_msg(self, sid, subject, reply, payload, headers):
+        self.msgs.append((sid, bytes(subject), bytes(payload)))
+
+    def _process_pong(self):
+        self._defer(self._handle_pong())
+
+    async def _handle_pong(self):
+        self.pongs += 1
+
+    def _defer(self, coro):
+        self._deferred.append(coro)
+
+    async def _run_deferred(self):
+        while self._deferred:
+            await self._deferred.pop(0)
+
+    async def _error_cb(self, err):
+        self.errors.append(err)
+
+    async def _process_op_err(self, err):
+        self.op_errors.append(err)
+
+
+def receive(protocol, data):
+    buffer = protocol.get_buffer(len(data))
+    buffer[: len(data)] = data
+    protocol.buffer_updated(len(data))
+
+
+@pytest.fixture
+async def protocol():
+    return NatsProtocol(FakeClient(), 64, loop=asyncio.get_running_loop())
+
+
+@pytest.mark.asyncio
+async def test_protocol_parses_received_buffers(protocol):
+    receive(protocol, b"MSG foo 1 5\r\nhel")
+    receive(protocol, b"lo\r\nMSG bar 2 2\r\nhi\r\n")
+    assert protocol._nc.msgs == [(1, b"foo", b"hello"), (2, b"bar", b"hi")]
+
+
+@pytest.mark.asyncio
+async def test_protocol_runs_deferred_operations(protocol):
+    receive(protocol, b"PONG\r\nPONG\r\n")
+    assert protocol._nc.pongs == 0
+    await asyncio.sleep(0)
+    assert protocol._nc.pongs == 2
+
+
+@pytest.mark.asyncio
+async def test_protocol_reports_protocol_errors(protocol):
+    receive(protocol, b"NOPE\r\n")
+    await asyncio.sleep(0)
+    assert protocol._nc.op_errors == [ErrProtocol]
+
+
+@pytest.mark.asyncio
+async def test_protocol_connection_lost(protocol):
+    error = ConnectionResetError()
+    protocol.connection_lost(error)
+    await asyncio.sleep(0)
+    assert protocol._nc.errors == [error]
+    assert protocol._nc.op_errors == [error]
+    assert protocol._closed.done()
+
+    other = NatsProtocol(FakeClient(), 64, loop=asyncio.get_running_loop())
+    other.connection_lost(None)
+    await asyncio.sleep(0)
+    assert other._nc._connection_lost_task.done()
+    [err] = other._nc.op_errors
+    assert isinstance(err, ErrStaleConnection)
+
+
+@pytest.mark.asyncio
+async def test_close_cancels_connection_lost_report():
+    nc = Client()
+    nc._flush_queue = asyncio.Queue()
+    protocol = NatsProtocol(nc, 64, loop=asyncio.get_running_loop())
+    protocol.connection_lost(ConnectionResetError())
+    task = nc._connection_lost_task
+    await nc._close(Client.CLOSED, do_cbs=False)
+    assert task.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_protocol_ignores_replaced_connection(protocol):
+    # The client is already reconnecting when the previous connection goes away
+    protocol._nc.is_reconnecting = True
+    receive(protocol, b"MSG foo 1 2\r\nhi\r\n")
+    protocol.connection_lost(ConnectionResetError())
+    await asyncio.sleep(0)
+    assert protocol._nc.msgs == []
+    assert protocol._nc.errors == [] and protocol._nc.op_errors == []
+    assert protocol._closed.done()
+
+
+def test_switch_to_protocol_fallback():
+    class StreamReader:
+        pass
+
+    nc = Client()
+    nc._io_reader = StreamReader()
+    assert nc._switch_to_protocol() is False
+
+
+class FakeServer:
+    """Server answering the handshake and echoing messages to subscription 1."""
+
+    def __init__(self):
+        self.connections = []
+
+    async def handle(self, reader, writer):
+        self.connections.append(writer)
+        writer.write(
+            b'INFO {"server_id":"fake","max_payload":1048576,"headers":true}\r\n'
+        )
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b"PING"):
+                writer.write(b"PONG\r\n")
+            elif line.startswith(b"PUB"):
+                _, subject, size = line.split()
+                payload = await reader.readexactly(int(size) + 2)
+                writer.write(b"MSG %s 1 %s\r\n%s" % (subject, size, payload))
+        writer.close()
+
+
+@pytest.mark.asyncio
+async def test_buffered_protocol_reconnect():
+    server = FakeServer()
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    reconnected = asyncio.Event()
+
+    async def reconnected_cb():
+        reconnected.set()
+
+    nc = Client()
+    await nc.connect(
+        servers=[f"nats://127.0.0.1:{port}"],
+        buffered_protocol=True,
+        reconnect_time_wait=0,
+        reconnected_cb=reconnected_cb,
+    )
+    try:
+        # The buffered protocol reads without a reading task
+        assert nc._reading_task is None
+        sub = await nc.subscribe("foo")
+        await nc.publish("foo", b"1")
+        assert (await sub.next_msg(timeout=1)).data == b"1"
+
+        server.connections[0].close()
+        await asyncio.wait_for(reconnected.wait(), 1)
+        assert len(server.connections) == 2 and nc._reading_task is None
+        await nc.publish("foo", b"2")
+        assert (await sub.next_msg(timeout=1)).data == b"2"
+    finally:
+        await nc.close()
+        listener.close()